@@ -15,3 +15,151 @@ class Config:
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
+
+    # --- Query Statistics ---
+    # Statements slower than this (in milliseconds) are logged with their
+    # parameters and query plan. Set QUERY_STATS_ENABLED=0 to disable the hooks.
+    QUERY_STATS_ENABLED = os.environ.get('QUERY_STATS_ENABLED', '1') == '1'
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+    QUERY_STATS_FLUSH_SECONDS = int(os.environ.get('QUERY_STATS_FLUSH_SECONDS', 60))
+    QUERY_STATS_MAX_FINGERPRINTS = int(os.environ.get('QUERY_STATS_MAX_FINGERPRINTS', 500))
+    # Snapshots not rewritten for this long (exited workers) are deleted at start-up.
+    QUERY_STATS_RETENTION_HOURS = int(os.environ.get('QUERY_STATS_RETENTION_HOURS', 24))
+
+    # --- PDF Engines ---
+    # The PDF stack is imported on first use. With PDF_WARMUP=1 it is
+    # preloaded on a background thread right after the first request.
+    PDF_WARMUP = os.environ.get('PDF_WARMUP', '0') == '1'
+
+    # --- Templates ---
+    # Compiled template bytecode is cached under instance/jinja_cache so
+    # recycled workers skip recompilation. Warm it with `flask precompile-templates`.
+    JINJA_BYTECODE_CACHE = os.environ.get('JINJA_BYTECODE_CACHE', '1') == '1'
+
+    # --- Landing Page Cache ---
+    # Anonymous GET / is served from a rendered-page cache with gzip/brotli
+    # variants and strong ETags. Keep max-age low so page views stay counted.
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'
+    INDEX_PAGE_MAX_AGE = int(os.environ.get('INDEX_PAGE_MAX_AGE', 0))
+    ANALYTICS_BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', 200))
+    ANALYTICS_FLUSH_SECONDS = float(os.environ.get('ANALYTICS_FLUSH_SECONDS', 1.0))
+
+    # --- Published Report Caching ---
+    # Cache-Control sent with public report pages and PDFs. The default makes
+    # browsers and proxies revalidate every time (cheap 304s via ETag).
+    REPORT_CACHE_CONTROL = os.environ.get('REPORT_CACHE_CONTROL') or 'public, max-age=0, must-revalidate'
+
+    # --- Batch-Code Lookup Filter ---
+    # A Bloom filter of known batch codes answers definite misses on POST /
+    # without a query. Memory is about 1.2 bytes per code at a 1% FP rate.
+    BATCH_FILTER_ENABLED = os.environ.get('BATCH_FILTER_ENABLED', '1') == '1'
+    BATCH_FILTER_FP_RATE = float(os.environ.get('BATCH_FILTER_FP_RATE', 0.01))
+    BATCH_FILTER_REBUILD_SECONDS = int(os.environ.get('BATCH_FILTER_REBUILD_SECONDS', 3600))
+    # A rebuild starts a new journal segment once the current one is past this size.
+    BATCH_FILTER_JOURNAL_MAX_BYTES = int(os.environ.get('BATCH_FILTER_JOURNAL_MAX_BYTES', 1024 * 1024))
+
+    # --- Batch-Code Autocomplete ---
+    # Each worker keeps the distinct batch codes of the last BATCH_INDEX_DAYS
+    # per plant in sorted lists for the new-report autocomplete; changes are
+    # shared through a journal and the index is rebuilt every
+    # BATCH_INDEX_REBUILD_SECONDS. Roughly 100 bytes per code.
+    BATCH_INDEX_ENABLED = os.environ.get('BATCH_INDEX_ENABLED', '1') == '1'
+    BATCH_INDEX_DAYS = int(os.environ.get('BATCH_INDEX_DAYS', 365))
+    BATCH_INDEX_REBUILD_SECONDS = int(os.environ.get('BATCH_INDEX_REBUILD_SECONDS', 3600))
+    BATCH_INDEX_SUGGESTIONS = int(os.environ.get('BATCH_INDEX_SUGGESTIONS', 10))
+    # A rebuild starts a new journal segment once the current one is past this size.
+    BATCH_INDEX_JOURNAL_MAX_BYTES = int(os.environ.get('BATCH_INDEX_JOURNAL_MAX_BYTES', 1024 * 1024))
+
+    # --- Machine-Code Expressions ---
+    # The preview endpoint lists at most this many codes of an expression.
+    MACHINE_CODE_PREVIEW_LIMIT = int(os.environ.get('MACHINE_CODE_PREVIEW_LIMIT', 500))
+
+    # --- Bulk Verification API ---
+    # POST /api/verify accepts at most this many codes and bytes per request.
+    BULK_VERIFY_MAX_CODES = int(os.environ.get('BULK_VERIFY_MAX_CODES', 500))
+    BULK_VERIFY_MAX_BYTES = int(os.environ.get('BULK_VERIFY_MAX_BYTES', 64 * 1024))
+
+    # --- Rate Limiting ---
+    # Per-IP token buckets for public lookups (POST /, /report, /api/verify)
+    # and PDF downloads. Set RATE_LIMIT_STORE=sqlite to share the buckets
+    # across worker processes through instance/ratelimit.sqlite.
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+    RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+    RATE_LIMIT_LOOKUP_BURST = int(os.environ.get('RATE_LIMIT_LOOKUP_BURST', 30))
+    RATE_LIMIT_LOOKUP_PER_MINUTE = float(os.environ.get('RATE_LIMIT_LOOKUP_PER_MINUTE', 60))
+    RATE_LIMIT_PDF_BURST = int(os.environ.get('RATE_LIMIT_PDF_BURST', 5))
+    RATE_LIMIT_PDF_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PDF_PER_MINUTE', 10))
+    # Comma-separated client IPs that are never limited (e.g. a load-test host)
+    RATE_LIMIT_EXEMPT_IPS = os.environ.get('RATE_LIMIT_EXEMPT_IPS', '')
+
+    # --- Shared Cache ---
+    # A memory-mapped file (instance/shared_cache.bin) shared by all workers,
+    # used for rendered PDFs and pages. Entries larger than a slot are not cached.
+    SHARED_CACHE_ENABLED = os.environ.get('SHARED_CACHE_ENABLED', '1') == '1'
+    SHARED_CACHE_SLOTS = int(os.environ.get('SHARED_CACHE_SLOTS', 128))
+    SHARED_CACHE_SLOT_KB = int(os.environ.get('SHARED_CACHE_SLOT_KB', 512))
+
+    # --- Background Jobs ---
+    # Deferred work goes to a SQLite queue (instance/jobs.sqlite by default)
+    # drained by `flask worker`. Failed jobs retry with exponential backoff;
+    # a claimed job reappears if its worker dies before the visibility timeout.
+    JOBS_ENABLED = os.environ.get('JOBS_ENABLED', '1') == '1'
+    JOBS_DATABASE = os.environ.get('JOBS_DATABASE')
+    JOBS_VISIBILITY_TIMEOUT = int(os.environ.get('JOBS_VISIBILITY_TIMEOUT', 300))
+    JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+    JOBS_BACKOFF_SECONDS = float(os.environ.get('JOBS_BACKOFF_SECONDS', 10))
+    JOBS_POLL_SECONDS = float(os.environ.get('JOBS_POLL_SECONDS', 1.0))
+    JOBS_KEEP_DAYS = int(os.environ.get('JOBS_KEEP_DAYS', 7))
+
+    # --- Report Archival ---
+    # Reports expired for longer than ARCHIVE_GRACE_DAYS move to compressed
+    # files under instance/archive, via `flask archive-reports` or a worker job
+    # every ARCHIVE_SCHEDULE_HOURS (0 disables the schedule).
+    ARCHIVE_GRACE_DAYS = int(os.environ.get('ARCHIVE_GRACE_DAYS', 30))
+    ARCHIVE_CHUNK_SIZE = int(os.environ.get('ARCHIVE_CHUNK_SIZE', 500))
+    ARCHIVE_SCHEDULE_HOURS = int(os.environ.get('ARCHIVE_SCHEDULE_HOURS', 24))
+
+    # --- Analytics Retention ---
+    # User agents and visitors are stored once in dictionary tables; visitor
+    # IPs are kept only as an HMAC keyed with ANALYTICS_IP_SALT (SECRET_KEY
+    # if unset, so changing either starts a new set of visitor ids). Complete
+    # hours and days are rolled up into analytics_hourly/analytics_daily
+    # every ANALYTICS_COMPACT_HOURS; raw events older than
+    # ANALYTICS_RETENTION_DAYS and hourly rows older than
+    # ANALYTICS_HOURLY_RETENTION_DAYS are then deleted. Each rollup recounts
+    # the last ANALYTICS_ROLLUP_LAG_HOURS hours to include events the writer
+    # stored late.
+    ANALYTICS_IP_SALT = os.environ.get('ANALYTICS_IP_SALT')
+    ANALYTICS_RETENTION_DAYS = int(os.environ.get('ANALYTICS_RETENTION_DAYS', 90))
+    ANALYTICS_HOURLY_RETENTION_DAYS = int(os.environ.get('ANALYTICS_HOURLY_RETENTION_DAYS', 90))
+    ANALYTICS_COMPACT_HOURS = int(os.environ.get('ANALYTICS_COMPACT_HOURS', 1))
+    ANALYTICS_ROLLUP_LAG_HOURS = int(os.environ.get('ANALYTICS_ROLLUP_LAG_HOURS', 2))
+    # Largest number of buckets one /api/analytics/series request may ask for
+    ANALYTICS_API_MAX_BUCKETS = int(os.environ.get('ANALYTICS_API_MAX_BUCKETS', 2000))
+
+    # --- Hot Batches ---
+    # Each worker keeps a space-saving top-K of viewed/downloaded batch codes
+    # (HOT_BATCHES_CAPACITY counters) and flushes it to analytics_hot_batch
+    # every HOT_BATCHES_FLUSH_SECONDS. Every HOT_BATCHES_WARM_MINUTES (0
+    # disables) the PDFs of the HOT_BATCHES_WARM_COUNT hottest reports over
+    # the last HOT_BATCHES_DAYS are re-warmed in the shared cache.
+    HOT_BATCHES_ENABLED = os.environ.get('HOT_BATCHES_ENABLED', '1') == '1'
+    HOT_BATCHES_CAPACITY = int(os.environ.get('HOT_BATCHES_CAPACITY', 200))
+    HOT_BATCHES_FLUSH_SECONDS = float(os.environ.get('HOT_BATCHES_FLUSH_SECONDS', 60))
+    HOT_BATCHES_DAYS = int(os.environ.get('HOT_BATCHES_DAYS', 7))
+    HOT_BATCHES_KEEP_DAYS = int(os.environ.get('HOT_BATCHES_KEEP_DAYS', 30))
+    HOT_BATCHES_WARM_COUNT = int(os.environ.get('HOT_BATCHES_WARM_COUNT', 20))
+    HOT_BATCHES_WARM_MINUTES = int(os.environ.get('HOT_BATCHES_WARM_MINUTES', 30))
+
+    # --- Report Search ---
+    # Searches matching at most SEARCH_RANK_LIMIT reports are ranked by
+    # relevance; broader ones are listed newest first, with the total shown
+    # as "more than SEARCH_RANK_LIMIT" (project/search.py).
+    SEARCH_RANK_LIMIT = int(os.environ.get('SEARCH_RANK_LIMIT', 5000))
+    SEARCH_PER_PAGE = int(os.environ.get('SEARCH_PER_PAGE', 20))
+
+    # --- Quality Statistics ---
+    # Per-parameter trend statistics (/api/stats/*) cover the last
+    # STATS_DAYS complete days by default and at most STATS_MAX_DAYS.
+    STATS_DAYS = int(os.environ.get('STATS_DAYS', 30))
+    STATS_MAX_DAYS = int(os.environ.get('STATS_MAX_DAYS', 730))
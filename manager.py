@@ -17,6 +17,13 @@ COMMAND = [
     # "--keyfile", r"D:\certs\privateKey.key"
 ]
 
+# Compiles all Jinja templates into the bytecode cache before each start,
+# so the first visitor after a restart doesn't pay compilation latency.
+PRECOMPILE_COMMAND = [sys.executable, "-m", "flask", "--app", "wsgi", "precompile-templates"]
+
+# Background job worker (see project/jobs.py), restarted together with the server.
+WORKER_COMMAND = [sys.executable, "-m", "flask", "--app", "wsgi", "worker"]
+
 # The specific time of day to restart the server.
 RESTART_HOUR = 1  # 1 AM
 RESTART_MINUTE = 0
@@ -54,10 +61,17 @@ def run_server():
     Starts the server as a subprocess and monitors it for scheduled restarts.
     """
     while True:
+        try:
+            print("\nMANAGER: Precompiling templates...")
+            subprocess.run(PRECOMPILE_COMMAND, timeout=120)
+        except Exception as e:
+            print(f"MANAGER: Template precompilation failed, continuing: {e}")
+
         print(f"\nMANAGER: Starting Hypercorn server process...")
         try:
             # Start the Hypercorn server as a child process.
             server_process = subprocess.Popen(COMMAND)
+            worker_process = subprocess.Popen(WORKER_COMMAND)
 
             # Calculate and wait for the time until the next restart.
             seconds_until_restart = get_seconds_until_next_restart()
@@ -66,16 +80,21 @@ def run_server():
             # Gracefully terminate the process and wait for it to exit.
             print("\nMANAGER: Scheduled restart time reached. Gracefully shutting down server...")
             server_process.terminate()
+            worker_process.terminate()
             server_process.wait(timeout=30) # Wait up to 30 seconds.
+            worker_process.wait(timeout=30)
             print("MANAGER: Server shut down. Restarting immediately...")
 
         except subprocess.TimeoutExpired:
             print("MANAGER: Server did not shut down gracefully. Forcing termination.")
             server_process.kill()
+            worker_process.kill()
         except KeyboardInterrupt:
             print("MANAGER: Manual shutdown detected. Stopping server...")
             server_process.terminate()
+            worker_process.terminate()
             server_process.wait()
+            worker_process.wait()
             break # Exit the while loop
         except Exception as e:
             print(f"MANAGER: An unexpected error occurred: {e}")
@@ -94,6 +94,14 @@ def run_migrations_online():
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
 
+    # The FTS5 report search table (project/search.py) and its shadow tables
+    # are created by a migration, not from the models
+    def include_name(name, type_, parent_names):
+        return not (type_ == 'table' and name.startswith('report_search'))
+
+    if conf_args.get("include_name") is None:
+        conf_args["include_name"] = include_name
+
     connectable = get_engine()
 
     with connectable.connect() as connection:
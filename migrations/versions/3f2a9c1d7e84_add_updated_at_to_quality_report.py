@@ -0,0 +1,29 @@
+"""Add updated_at to quality_report
+
+Revision ID: 3f2a9c1d7e84
+Revises: 6b25bdbc71a0
+Create Date: 2026-10-19 09:12:44.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e84'
+down_revision = '6b25bdbc71a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('quality_report', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Existing reports were last modified when they were created
+    op.execute('UPDATE quality_report SET updated_at = created_at WHERE updated_at IS NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('quality_report', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,76 @@
+"""Add the report_search FTS5 index
+
+Revision ID: 7c1d4e9a2b60
+Revises: 0d5e8b3f7a29
+Create Date: 2026-10-19 23:31:42.508117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d4e9a2b60'
+down_revision = '0d5e8b3f7a29'
+branch_labels = None
+depends_on = None
+
+# Same statements as project/search.py, frozen at this revision
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS report_search USING fts5(
+        batch_code, machine_codes, product, plant, creator,
+        tokenize = 'unicode61', prefix = '2 3 4 5 6')""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_insert AFTER INSERT ON quality_report BEGIN
+        INSERT INTO report_search (rowid, batch_code, machine_codes, product, plant, creator)
+        VALUES (new.id, new.batch_code, new.machine_codes,
+                (SELECT name FROM product WHERE id = new.product_id),
+                coalesce((SELECT name FROM plant WHERE id = new.plant_id), new.plant_name),
+                (SELECT username FROM user WHERE id = new.user_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_update
+    AFTER UPDATE OF batch_code, machine_codes, product_id, plant_id, plant_name, user_id ON quality_report BEGIN
+        DELETE FROM report_search WHERE rowid = old.id;
+        INSERT INTO report_search (rowid, batch_code, machine_codes, product, plant, creator)
+        VALUES (new.id, new.batch_code, new.machine_codes,
+                (SELECT name FROM product WHERE id = new.product_id),
+                coalesce((SELECT name FROM plant WHERE id = new.plant_id), new.plant_name),
+                (SELECT username FROM user WHERE id = new.user_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_delete AFTER DELETE ON quality_report BEGIN
+        DELETE FROM report_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_product AFTER UPDATE OF name ON product BEGIN
+        UPDATE report_search SET product = new.name
+        WHERE rowid IN (SELECT id FROM quality_report WHERE product_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_plant AFTER UPDATE OF name ON plant BEGIN
+        UPDATE report_search SET plant = new.name
+        WHERE rowid IN (SELECT id FROM quality_report WHERE plant_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_user AFTER UPDATE OF username ON user BEGIN
+        UPDATE report_search SET creator = new.username
+        WHERE rowid IN (SELECT id FROM quality_report WHERE user_id = new.id);
+    END""",
+]
+
+POPULATE = """INSERT INTO report_search (rowid, batch_code, machine_codes, product, plant, creator)
+    SELECT q.id, q.batch_code, q.machine_codes, p.name, coalesce(pl.name, q.plant_name), u.username
+    FROM quality_report q
+    LEFT JOIN product p ON p.id = q.product_id
+    LEFT JOIN plant pl ON pl.id = q.plant_id
+    LEFT JOIN user u ON u.id = q.user_id"""
+
+TRIGGERS = ['report_search_insert', 'report_search_update', 'report_search_delete',
+            'report_search_product', 'report_search_plant', 'report_search_user']
+
+
+def upgrade():
+    for statement in SCHEMA:
+        op.execute(statement)
+    op.execute(POPULATE)
+    op.execute("INSERT INTO report_search (report_search) VALUES ('optimize')")
+
+
+def downgrade():
+    for trigger in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    op.execute('DROP TABLE IF EXISTS report_search')
@@ -0,0 +1,132 @@
+"""Dictionary-encode analytics events and add daily rollups
+
+Revision ID: c41e7f93a2d6
+Revises: 8d4e2b7a91c5
+Create Date: 2026-10-19 16:41:05.227318
+
+"""
+import hmac
+from hashlib import sha1, sha256
+
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e7f93a2d6'
+down_revision = '8d4e2b7a91c5'
+branch_labels = None
+depends_on = None
+
+# Events are backfilled in id ranges so memory stays flat on large tables
+CHUNK_SIZE = 20000
+
+
+def _ip_salt():
+    # Must match project.analytics.hash_ip so new events join the same visitors
+    return current_app.config.get('ANALYTICS_IP_SALT') or current_app.config['SECRET_KEY']
+
+
+def _backfill_dictionaries(conn):
+    salt = _ip_salt().encode('utf-8')
+    agent_ids, visitor_ids = {}, {}
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.text(
+            'SELECT id, ip_address, user_agent FROM analytics_event WHERE id > :last_id ORDER BY id LIMIT :size'
+        ), {'last_id': last_id, 'size': CHUNK_SIZE}).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        new_agents, new_visitors, keys = {}, {}, []
+        for _, ip_address, user_agent in rows:
+            digest = sha1(user_agent.encode('utf-8')).hexdigest() if user_agent else None
+            ip_hash = hmac.new(salt, ip_address.encode('utf-8'), sha256).hexdigest()[:32] if ip_address else None
+            if digest and digest not in agent_ids:
+                new_agents[digest] = user_agent
+            if ip_hash and ip_hash not in visitor_ids:
+                new_visitors[ip_hash] = None
+            keys.append((digest, ip_hash))
+
+        if new_agents:
+            conn.execute(sa.text('INSERT OR IGNORE INTO analytics_user_agent (digest, user_agent) VALUES (:d, :u)'),
+                         [{'d': digest, 'u': user_agent} for digest, user_agent in new_agents.items()])
+            agent_ids.update(conn.execute(sa.text('SELECT digest, id FROM analytics_user_agent WHERE digest IN :keys')
+                                          .bindparams(sa.bindparam('keys', expanding=True)),
+                                          {'keys': list(new_agents)}).all())
+        if new_visitors:
+            conn.execute(sa.text('INSERT OR IGNORE INTO analytics_visitor (ip_hash) VALUES (:h)'),
+                         [{'h': ip_hash} for ip_hash in new_visitors])
+            visitor_ids.update(conn.execute(sa.text('SELECT ip_hash, id FROM analytics_visitor WHERE ip_hash IN :keys')
+                                            .bindparams(sa.bindparam('keys', expanding=True)),
+                                            {'keys': list(new_visitors)}).all())
+
+        conn.execute(sa.text('UPDATE analytics_event SET user_agent_id = :a, visitor_id = :v WHERE id = :id'), [
+            {'id': row[0], 'a': agent_ids.get(digest), 'v': visitor_ids.get(ip_hash)}
+            for row, (digest, ip_hash) in zip(rows, keys)
+        ])
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('analytics_user_agent',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('digest', sa.String(length=40), nullable=False),
+    sa.Column('user_agent', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('digest')
+    )
+    op.create_table('analytics_visitor',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ip_hash', sa.String(length=32), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('ip_hash')
+    )
+    op.create_table('analytics_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('event_type', sa.String(length=50), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'event_type')
+    )
+    # ### end Alembic commands ###
+
+    # Plain columns first so the backfill runs before the table is rebuilt once
+    with op.batch_alter_table('analytics_event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('visitor_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('user_agent_id', sa.Integer(), nullable=True))
+
+    _backfill_dictionaries(op.get_bind())
+
+    with op.batch_alter_table('analytics_event', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_analytics_event_event_type'))
+        batch_op.create_index(batch_op.f('ix_analytics_event_timestamp'), ['timestamp'], unique=False)
+        batch_op.create_foreign_key('fk_analytics_event_visitor_id', 'analytics_visitor', ['visitor_id'], ['id'])
+        batch_op.create_foreign_key('fk_analytics_event_user_agent_id', 'analytics_user_agent', ['user_agent_id'], ['id'])
+        batch_op.drop_column('ip_address')
+        batch_op.drop_column('user_agent')
+
+
+def downgrade():
+    # Raw IP addresses cannot be recovered from their hashes; ip_address stays empty
+    with op.batch_alter_table('analytics_event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_agent', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('ip_address', sa.String(length=100), nullable=True))
+
+    op.execute('UPDATE analytics_event SET user_agent = '
+               '(SELECT user_agent FROM analytics_user_agent WHERE analytics_user_agent.id = analytics_event.user_agent_id)')
+
+    with op.batch_alter_table('analytics_event', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_analytics_event_user_agent_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_analytics_event_visitor_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_analytics_event_timestamp'))
+        batch_op.create_index(batch_op.f('ix_analytics_event_event_type'), ['event_type'], unique=False)
+        batch_op.drop_column('user_agent_id')
+        batch_op.drop_column('visitor_id')
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('analytics_daily')
+    op.drop_table('analytics_visitor')
+    op.drop_table('analytics_user_agent')
+    # ### end Alembic commands ###
@@ -97,6 +97,18 @@ def create_app(config_class=Config):
     db.init_app(app)
     login_manager.init_app(app)
 
+    # Memory-mapped cache shared by all worker processes
+    from . import sharedcache
+    sharedcache.init_app(app)
+
+    # Persistent Jinja bytecode cache (must run before app.jinja_env is first used)
+    from . import templating
+    templating.init_app(app)
+
+    # Attach the slow-query log and fingerprint aggregation to the engine
+    from . import querystats
+    querystats.init_app(app)
+
     from .models import User
 
     @login_manager.user_loader
@@ -107,6 +119,62 @@ def create_app(config_class=Config):
     from .routes import bp as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    # Background analytics writer used by log_event_async()
+    from . import analytics
+    analytics.init_app(app)
+
+    # SQLite-backed job queue drained by `flask worker`
+    from . import jobs
+    jobs.init_app(app)
+
+    # Archival of expired reports (CLI plus a scheduled job)
+    from . import archive
+    archive.init_app(app)
+
+    # Daily analytics rollups and raw-event retention (CLI plus a scheduled job)
+    from . import rollups
+    rollups.init_app(app)
+
+    # HyperLogLog unique-visitor sketches (`flask analytics-sketches`)
+    from . import sketches
+    sketches.init_app(app)
+
+    # In-memory top-K of requested batch codes, flushed by the analytics writer
+    from . import hotbatches
+    hotbatches.init_app(app)
+
+    # Specification compliance checks (`flask compliance-rescore`, `flask spec-check`)
+    from . import compliance
+    compliance.init_app(app)
+
+    # Streaming CSV/NDJSON exports (`flask export`; the routes live in routes.py)
+    from . import exports
+    exports.init_app(app)
+
+    # FTS5 report search, kept in step by triggers (`flask search-rebuild`)
+    from . import search
+    search.init_app(app)
+
+    # Per-IP token buckets for the public lookup and PDF routes
+    from . import ratelimit
+    ratelimit.init_app(app)
+
+    # Bloom filter that rejects unknown batch codes without a query
+    from . import batchfilter
+    batchfilter.init_app(app)
+
+    # Per-plant sorted index of recent batch codes for the new-report autocomplete
+    from . import batchindex
+    batchindex.init_app(app)
+
+    # Compiled machine-code expressions (`flask machine-codes-compile`)
+    from . import machinecodes
+    machinecodes.init_app(app)
+
+    # Optionally warm the lazily imported PDF stack once serving has started
+    from . import pdf_engines
+    pdf_engines.init_app(app)
+
     # Register custom CLI commands
     from . import commands
     commands.init_app(app)
@@ -114,6 +182,10 @@ def create_app(config_class=Config):
     # --- Register the data population command ---
     from . import populate_db 
     populate_db.init_app(app)
+
+    from . import loadtest, synthetic
+    loadtest.init_app(app)
+    synthetic.init_app(app)
     # --- End command registration ---
 
     with app.app_context():
@@ -0,0 +1,256 @@
+# project/analytics.py
+# Background writer for analytics events.
+#
+# Requests hand events to an in-memory queue and return immediately; a
+# daemon thread drains the queue and inserts the rows in batches, so a
+# page view costs a queue append instead of a commit.
+#
+# User agents and visitors are dictionary-encoded: events reference small
+# integer ids instead of repeating the full user-agent string, and the IP
+# address is stored only as a keyed hash. Ids are cached per process, so a
+# warm writer resolves them without a query.
+# Each batch also updates the unique-visitor sketches (project/sketches.py),
+# including visits of events that log_event() inserted synchronously.
+
+import atexit
+import hmac
+import queue
+import threading
+import time
+from datetime import datetime
+from hashlib import sha1, sha256
+
+from flask import current_app, request
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db, sketches
+from .models import AnalyticsEvent, AnalyticsUserAgent, AnalyticsVisitor
+
+
+def hash_ip(ip_address, salt):
+    """Keyed hash of an IP address; the raw address is never stored."""
+    return hmac.new(salt.encode('utf-8'), ip_address.encode('utf-8'), sha256).hexdigest()[:32]
+
+
+def user_agent_digest(user_agent):
+    return sha1(user_agent.encode('utf-8')).hexdigest()
+
+
+class Dictionary:
+    """Maps keys to ids in a dictionary table, caching the ids in process memory."""
+
+    def __init__(self, table, key_column, max_cached=50000):
+        self.table = table
+        self.key_column = table.c[key_column]
+        self.max_cached = max_cached
+        self._ids = {}
+
+    def resolve(self, rows):
+        """`rows` maps key -> dictionary row to insert if missing. Returns key -> id."""
+        ids = {}
+        for key in rows:
+            id_ = self._ids.get(key)
+            if id_ is not None:
+                ids[key] = id_
+        missing = [row for key, row in rows.items() if key not in ids]
+        if missing:
+            db.session.execute(sqlite_insert(self.table).on_conflict_do_nothing(), missing)
+            fetched = db.session.execute(
+                select(self.key_column, self.table.c.id).where(
+                    self.key_column.in_([key for key in rows if key not in ids]))).all()
+            if len(self._ids) + len(fetched) > self.max_cached:
+                self._ids.clear()
+            for key, id_ in fetched:
+                self._ids[key] = ids[key] = id_
+        return ids
+
+    def forget(self):
+        """Drops cached ids, e.g. after a rollback may have discarded new rows."""
+        self._ids.clear()
+
+
+def _dictionaries(app):
+    dictionaries = app.extensions.get('analytics_dictionaries')
+    if dictionaries is None:
+        dictionaries = app.extensions['analytics_dictionaries'] = {
+            'user_agent': Dictionary(AnalyticsUserAgent.__table__, 'digest'),
+            'visitor': Dictionary(AnalyticsVisitor.__table__, 'ip_hash'),
+        }
+    return dictionaries
+
+
+def encode_rows(rows):
+    """
+    Replaces the raw 'ip_address' and 'user_agent' of event rows with
+    visitor_id and user_agent_id. Runs inside the caller's transaction.
+    Returns the visits (day, sketch scopes, ip hash) for sketches.record_visits().
+    """
+    app = current_app._get_current_object()
+    dictionaries = _dictionaries(app)
+    salt = app.config.get('ANALYTICS_IP_SALT') or app.config['SECRET_KEY']
+
+    agents, visitors, keys, visits = {}, {}, [], []
+    for row in rows:
+        user_agent = row.pop('user_agent', None)
+        ip_address = row.pop('ip_address', None)
+        # Every row gets the same keys: the batch is one executemany
+        row.setdefault('report_id', None)
+        row.setdefault('plant_id', None)
+        scopes = sketches.scopes_for(row['plant_id'], row.pop('product_id', None))
+        agent_key = user_agent_digest(user_agent) if user_agent else None
+        visitor_key = hash_ip(ip_address, salt) if ip_address else None
+        if agent_key:
+            agents[agent_key] = {'digest': agent_key, 'user_agent': user_agent}
+        if visitor_key:
+            visitors[visitor_key] = {'ip_hash': visitor_key}
+        keys.append((agent_key, visitor_key))
+        visits.append((row['timestamp'].date(), scopes, visitor_key))
+
+    agent_ids = dictionaries['user_agent'].resolve(agents) if agents else {}
+    visitor_ids = dictionaries['visitor'].resolve(visitors) if visitors else {}
+    for row, (agent_key, visitor_key) in zip(rows, keys):
+        row['user_agent_id'] = agent_ids.get(agent_key)
+        row['visitor_id'] = visitor_ids.get(visitor_key)
+    return visits
+
+
+def insert_events(rows):
+    """
+    Dictionary-encodes and inserts event rows in the current session (no
+    commit). Returns their visits for sketches.record_visits().
+    """
+    visits = encode_rows(rows)
+    db.session.execute(AnalyticsEvent.__table__.insert(), rows)
+    return visits
+
+
+def forget_dictionary_ids(app):
+    for dictionary in _dictionaries(app).values():
+        dictionary.forget()
+
+
+class AnalyticsWriter:
+    def __init__(self, app, batch_size=200, flush_interval=1.0, max_queue=10000):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._periodic = []
+
+    def submit(self, row):
+        """Queues one event row (a dict of AnalyticsEvent columns)."""
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            # Analytics must never slow down or fail a user-facing request
+            self.dropped += 1
+
+    def submit_visits(self, visits):
+        """Queues visits whose events were inserted elsewhere, for the sketches only."""
+        if visits:
+            self.submit(list(visits))
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+                self._thread.start()
+
+    def _drain(self, first=None):
+        rows = [first] if first is not None else []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def every(self, seconds, callback):
+        """Runs callback() in an app context on the writer thread every `seconds`."""
+        self._periodic.append([seconds, callback, time.monotonic() + seconds])
+
+    def _run_periodic(self, force=False):
+        now = time.monotonic()
+        for entry in self._periodic:
+            seconds, callback, due = entry
+            if not force and now < due:
+                continue
+            entry[2] = now + seconds
+            with self.app.app_context():
+                try:
+                    callback()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Analytics periodic task {callback.__qualname__} failed: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                first = None
+            if first is not None:
+                self.write(self._drain(first))
+            self._run_periodic()
+
+    def flush(self):
+        """Writes everything currently queued and runs the periodic tasks, on the calling thread."""
+        while True:
+            rows = self._drain()
+            if not rows:
+                break
+            self.write(rows)
+        self._run_periodic(force=True)
+
+    def write(self, items):
+        # Items are event rows (dicts) or lists of visits from submit_visits()
+        rows = [item for item in items if isinstance(item, dict)]
+        visits = [visit for item in items if isinstance(item, list) for visit in item]
+        with self.app.app_context():
+            try:
+                if rows:
+                    visits.extend(insert_events(rows))
+                sketches.record_visits(visits)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                forget_dictionary_ids(self.app)
+                self.app.logger.error(f"Analytics batch write failed ({len(rows)} events): {e}")
+
+
+def event_row(event_type, report=None):
+    """
+    Builds an AnalyticsEvent row from the current request. With `report`,
+    the event records the report and plant, and the visit also counts
+    towards the plant's and product's sketches.
+    """
+    row = {
+        'event_type': event_type,
+        'timestamp': datetime.utcnow(),
+        'ip_address': request.remote_addr,
+        'user_agent': request.user_agent.string,
+    }
+    if report is not None:
+        row['report_id'] = report.id
+        row['plant_id'] = report.plant_id
+        row['product_id'] = report.product_id
+    return row
+
+
+def init_app(app):
+    """Attaches an AnalyticsWriter to the app as app.extensions['analytics_writer']."""
+    writer = AnalyticsWriter(
+        app,
+        batch_size=app.config.get('ANALYTICS_BATCH_SIZE', 200),
+        flush_interval=app.config.get('ANALYTICS_FLUSH_SECONDS', 1.0),
+    )
+    app.extensions['analytics_writer'] = writer
+    atexit.register(writer.flush)
+    return writer
@@ -0,0 +1,203 @@
+# project/archive.py
+# Moves expired reports out of the hot tables into compressed archive files.
+#
+# Reports whose expiry_date is older than the grace period are written, one
+# chunk at a time, as a gzip member appended to instance/archive/reports-<year>.jsonl.gz
+# (one JSON object per line, with product, plant and template details copied
+# in so the record stays readable after templates change). Each archived
+# report keeps a row in `archived_report` pointing at its member, so a single
+# old batch is fetched by seeking to one member and decompressing only it.
+#
+# The member is fsynced before the hot rows are deleted in the same database
+# transaction that inserts the index rows: a crash leaves either the hot rows
+# (archived again next run) or a complete, indexed member, never neither.
+
+import gzip
+import json
+import os
+import time
+from datetime import date, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from . import db, jobs
+from .models import ArchivedReport, Plant, Product, QualityReport, ReportResult, ReportTemplate, User
+
+
+def archive_directory(app):
+    return os.path.join(app.instance_path, 'archive')
+
+
+def _report_record(report, product_name, plant_name, creator, results):
+    return {
+        'id': report.id,
+        'batch_code': report.batch_code,
+        'machine_codes': report.machine_codes,
+        'product_id': report.product_id,
+        'product_name': product_name,
+        'plant_id': report.plant_id,
+        'plant_name': plant_name or report.plant_name,
+        'user_id': report.user_id,
+        'creator': creator,
+        'expiry_date': report.expiry_date.isoformat(),
+        'created_at': report.created_at.isoformat() if report.created_at else None,
+        'updated_at': report.updated_at.isoformat() if report.updated_at else None,
+        'results': results,
+    }
+
+
+def _archive_chunk(ids, directory):
+    """Archives the reports in `ids`. Returns the number archived."""
+    rows = db.session.query(
+        QualityReport, Product.name, Plant.name, User.username
+    ).outerjoin(Product, QualityReport.product_id == Product.id
+    ).outerjoin(Plant, QualityReport.plant_id == Plant.id
+    ).outerjoin(User, QualityReport.user_id == User.id
+    ).filter(QualityReport.id.in_(ids)).order_by(QualityReport.id).all()
+
+    results = {}
+    for report_id, value, parameter, specification, method, order in db.session.query(
+        ReportResult.report_id, ReportResult.result_value, ReportTemplate.parameter,
+        ReportTemplate.specification, ReportTemplate.method, ReportTemplate.order
+    ).outerjoin(ReportTemplate, ReportResult.template_id == ReportTemplate.id
+    ).filter(ReportResult.report_id.in_(ids)).order_by(ReportResult.report_id, ReportTemplate.order):
+        results.setdefault(report_id, []).append({
+            'parameter': parameter, 'specification': specification,
+            'method': method, 'order': order, 'result': value,
+        })
+
+    lines = [json.dumps(_report_record(report, product_name, plant_name, creator, results.get(report.id, [])),
+                        separators=(',', ':'))
+             for report, product_name, plant_name, creator in rows]
+    member = gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'), 6)
+
+    file_name = f"reports-{date.today().year}.jsonl.gz"
+    with open(os.path.join(directory, file_name), 'ab') as fh:
+        offset = fh.seek(0, os.SEEK_END)
+        fh.write(member)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    db.session.execute(ArchivedReport.__table__.insert(), [{
+        'report_id': report.id,
+        'batch_code': report.batch_code,
+        'machine_codes': report.machine_codes,
+        'product_name': product_name,
+        'plant_id': report.plant_id,
+        'expiry_date': report.expiry_date,
+        'archive_file': file_name,
+        'member_offset': offset,
+        'member_length': len(member),
+    } for report, product_name, _, _ in rows])
+    ReportResult.query.filter(ReportResult.report_id.in_(ids)).delete(synchronize_session=False)
+    QualityReport.query.filter(QualityReport.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+    db.session.expunge_all()
+    return len(rows)
+
+
+def archive_reports(older_than_days, chunk_size=500, limit=None, echo=None):
+    """
+    Archives reports that expired more than `older_than_days` ago in one
+    streaming pass (keyset pagination over id). Returns the number archived.
+    """
+    directory = archive_directory(current_app)
+    os.makedirs(directory, exist_ok=True)
+    cutoff = date.today() - timedelta(days=older_than_days)
+    archived, last_id = 0, 0
+    while limit is None or archived < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - archived)
+        ids = [row.id for row in db.session.query(QualityReport.id).filter(
+            QualityReport.expiry_date < cutoff, QualityReport.id > last_id
+        ).order_by(QualityReport.id).limit(size)]
+        if not ids:
+            break
+        try:
+            archived += _archive_chunk(ids, directory)
+        except Exception:
+            db.session.rollback()
+            raise
+        last_id = ids[-1]
+        if echo:
+            echo(f"  {archived} reports archived...")
+    return archived
+
+
+def compact_database():
+    """Reclaims the space freed by archiving and refreshes planner statistics."""
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if db.engine.dialect.name == 'sqlite':
+            conn.execute(text('VACUUM'))
+        conn.execute(text('ANALYZE'))
+
+
+def fetch_archived(batch_code):
+    """Returns the archived report records for `batch_code`, newest first."""
+    entries = ArchivedReport.query.filter_by(batch_code=batch_code).order_by(ArchivedReport.report_id.desc()).all()
+    directory = archive_directory(current_app)
+    records = []
+    for entry in entries:
+        with open(os.path.join(directory, entry.archive_file), 'rb') as fh:
+            fh.seek(entry.member_offset)
+            member = fh.read(entry.member_length)
+        for line in gzip.decompress(member).decode('utf-8').splitlines():
+            # Cheap prefix test before parsing: records start with their id
+            if line.startswith(f'{{"id":{entry.report_id},'):
+                records.append(json.loads(line))
+                break
+    return records
+
+
+@jobs.task('archive_reports', queue='maintenance')
+def archive_reports_job():
+    """Scheduled archival using the configured grace period."""
+    config = current_app.config
+    count = archive_reports(config['ARCHIVE_GRACE_DAYS'], config['ARCHIVE_CHUNK_SIZE'])
+    if count:
+        compact_database()
+    current_app.logger.info(f"Archived {count} expired reports.")
+
+
+@click.command('archive-reports')
+@with_appcontext
+@click.option('--older-than', 'older_than', type=int, default=None,
+              help='Days past expiry before a report is archived. Defaults to ARCHIVE_GRACE_DAYS.')
+@click.option('--chunk-size', default=None, type=int, help='Reports per archive member and transaction.')
+@click.option('--limit', default=None, type=int, help='Stop after this many reports.')
+@click.option('--no-vacuum', is_flag=True, default=False, help='Skip VACUUM/ANALYZE afterwards.')
+def archive_reports_command(older_than, chunk_size, limit, no_vacuum):
+    """Moves expired reports and their results into compressed archive files."""
+    config = current_app.config
+    older_than = config['ARCHIVE_GRACE_DAYS'] if older_than is None else older_than
+    started = time.perf_counter()
+    count = archive_reports(older_than, chunk_size or config['ARCHIVE_CHUNK_SIZE'], limit, echo=click.echo)
+    click.echo(f"Archived {count} reports expired before "
+               f"{date.today() - timedelta(days=older_than)} in {time.perf_counter() - started:.1f} s.")
+    if count and not no_vacuum:
+        started = time.perf_counter()
+        compact_database()
+        click.echo(f"VACUUM/ANALYZE finished in {time.perf_counter() - started:.1f} s.")
+
+
+@click.command('archive-fetch')
+@with_appcontext
+@click.argument('batch_code')
+def archive_fetch_command(batch_code):
+    """Prints archived reports for a batch code as JSON."""
+    records = fetch_archived(batch_code)
+    if not records:
+        click.echo(f"No archived report for {batch_code}.")
+        return
+    click.echo(json.dumps(records, indent=2))
+
+
+def init_app(app):
+    """Registers the archive commands and the scheduled archival job."""
+    app.cli.add_command(archive_reports_command)
+    app.cli.add_command(archive_fetch_command)
+    hours = app.config.get('ARCHIVE_SCHEDULE_HOURS', 24)
+    if hours:
+        jobs.periodic('archive_reports', hours * 3600)
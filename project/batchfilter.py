@@ -0,0 +1,211 @@
+# project/batchfilter.py
+# Bloom filter of known base batch codes for rejecting mistyped lookups.
+#
+# A "no" from the filter is definite, so POST / can answer a mistyped or
+# guessed code without touching the database. A "yes" may be a false
+# positive and falls through to the normal indexed query.
+#
+# Workers share new codes through a journal in the instance folder (see
+# project/journal.py): each worker reads the lines appended since its last
+# check on lookup. Deleted codes cannot be removed from a Bloom filter, so
+# the filter is rebuilt from the table periodically, and each rebuild
+# compacts the journal.
+
+import math
+import os
+import threading
+import time
+from hashlib import blake2b
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+from . import db
+from .journal import Journal, JournalGap
+from .models import QualityReport
+
+
+class BloomFilter:
+    def __init__(self, capacity, fp_rate):
+        capacity = max(capacity, 1000)
+        self.num_bits = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def false_positive_rate(self):
+        """Expected false-positive rate at the current fill level."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class BatchCodeFilter:
+    def __init__(self, app, fp_rate=0.01, rebuild_seconds=3600, headroom=1.5, journal_max_bytes=1024 * 1024,
+                 journal_path=None):
+        self.app = app
+        self.fp_rate = fp_rate
+        self.rebuild_seconds = rebuild_seconds
+        self.headroom = headroom
+        self.journal = Journal(journal_path or os.path.join(app.instance_path, 'batch_codes.journal'),
+                               max_bytes=journal_max_bytes, keep_seconds=rebuild_seconds)
+        self._bloom = None
+        self._built_at = 0.0
+        self._journal_position = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    # --- Building ---
+    def build(self):
+        """Rebuilds the filter from quality_report.batch_code (needs an app context)."""
+        started = time.perf_counter()
+        journal_position = self.journal.end()
+        count = db.session.query(func.count(QualityReport.id)).scalar() or 0
+        bloom = BloomFilter(int(count * self.headroom), self.fp_rate)
+        for (code,) in db.session.query(QualityReport.batch_code).yield_per(50000):
+            bloom.add(code)
+        with self._lock:
+            self._bloom = bloom
+            self._built_at = time.monotonic()
+            self._journal_position = journal_position
+        # Pick up anything appended while we were scanning
+        self._read_journal(rebuild_on_gap=False)
+        try:
+            self.journal.compact()
+        except OSError as e:
+            self.app.logger.error(f"Batch-code journal compaction failed: {e}")
+        self.app.logger.info(
+            f"Batch-code filter built: {bloom.count} codes, {len(bloom.bits) / 1024:.0f} KiB, "
+            f"{bloom.num_hashes} hashes, est. FP rate {bloom.false_positive_rate():.4%} "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return bloom
+
+    def _rebuild_in_background(self):
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+
+        def _run():
+            try:
+                with self.app.app_context():
+                    self.build()
+            except Exception as e:
+                self.app.logger.error(f"Batch-code filter rebuild failed: {e}")
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=_run, name='batch-filter-rebuild', daemon=True).start()
+
+    # --- Journal ---
+    def _read_journal(self, rebuild_on_gap=True):
+        with self._lock:
+            if self._journal_position is None:
+                return
+            try:
+                lines, self._journal_position = self.journal.read(self._journal_position)
+            except JournalGap as e:
+                self.app.logger.warning(f"Batch-code journal: {e}; rebuilding the filter.")
+                # Codes in the lost lines are in the table, which a rebuild reads
+                self._journal_position = self.journal.end()
+                lines = None
+            else:
+                for line in lines:
+                    self._bloom.add(line.decode('utf-8'))
+        if lines is None and rebuild_on_gap:
+            self.build()
+
+    def add(self, batch_code):
+        """Records a newly created or edited code for this and every other worker."""
+        if not batch_code:
+            return
+        try:
+            self.journal.append(batch_code.encode('utf-8') + b'\n')
+        except OSError as e:
+            self.app.logger.error(f"Batch-code journal append failed: {e}")
+            with self._lock:
+                if self._bloom is not None:
+                    self._bloom.add(batch_code)
+            return
+        if self._bloom is not None:
+            self._read_journal()
+
+    # --- Lookup ---
+    def might_contain(self, batch_code):
+        """False means the code definitely has no report."""
+        if self._bloom is None:
+            with self._lock:
+                needs_build = self._bloom is None
+            if needs_build:
+                self.build()
+        elif time.monotonic() - self._built_at > self.rebuild_seconds:
+            self._rebuild_in_background()
+        self._read_journal()
+        return batch_code in self._bloom
+
+    def stats(self):
+        bloom = self._bloom
+        if bloom is None:
+            return None
+        return {
+            'codes': bloom.count,
+            'bits': bloom.num_bits,
+            'hashes': bloom.num_hashes,
+            'memory_bytes': len(bloom.bits),
+            'target_fp_rate': self.fp_rate,
+            'estimated_fp_rate': bloom.false_positive_rate(),
+            'age_seconds': time.monotonic() - self._built_at,
+        }
+
+
+def get_filter():
+    """Returns the app's BatchCodeFilter, or None when it is disabled."""
+    return current_app.extensions.get('batch_filter')
+
+
+@click.command('batch-filter')
+@with_appcontext
+@click.option('--check', 'codes', multiple=True, help='Base batch code(s) to test against the filter.')
+def batch_filter_command(codes):
+    """Builds the batch-code Bloom filter and reports its size and FP rate."""
+    batch_filter = get_filter()
+    if batch_filter is None:
+        click.echo('The batch-code filter is disabled (BATCH_FILTER_ENABLED=0).')
+        return
+    batch_filter.build()
+    stats = batch_filter.stats()
+    click.echo(f"Codes:              {stats['codes']}")
+    click.echo(f"Bits / hashes:      {stats['bits']} / {stats['hashes']}")
+    click.echo(f"Memory:             {stats['memory_bytes'] / 1024:.1f} KiB")
+    click.echo(f"Target FP rate:     {stats['target_fp_rate']:.4%}")
+    click.echo(f"Estimated FP rate:  {stats['estimated_fp_rate']:.4%}")
+    for code in codes:
+        verdict = 'maybe present' if batch_filter.might_contain(code) else 'definitely absent'
+        click.echo(f"{code}: {verdict}")
+
+
+def init_app(app):
+    """Attaches a BatchCodeFilter as app.extensions['batch_filter'] and registers the CLI."""
+    app.cli.add_command(batch_filter_command)
+    if not app.config.get('BATCH_FILTER_ENABLED', True):
+        return
+    app.extensions['batch_filter'] = BatchCodeFilter(
+        app,
+        fp_rate=app.config.get('BATCH_FILTER_FP_RATE', 0.01),
+        rebuild_seconds=app.config.get('BATCH_FILTER_REBUILD_SECONDS', 3600),
+        journal_max_bytes=app.config.get('BATCH_FILTER_JOURNAL_MAX_BYTES', 1024 * 1024),
+    )
@@ -0,0 +1,277 @@
+# project/batchindex.py
+# In-memory prefix index of each plant's recent batch codes, for autocomplete.
+#
+# Per plant, the distinct base codes of reports created in the last
+# BATCH_INDEX_DAYS are kept in a sorted list (with a report count per code),
+# so a prefix query is one bisect plus a short forward scan: microseconds,
+# no query. new_report/edit_report/delete_report record each change as it is
+# committed.
+#
+# Workers share changes through a journal in the instance folder (see
+# project/journal.py), as the batch-code Bloom filter does: "+<plant id>\t<code>"
+# for a new report, "-<plant id>\t<code>" for a removed one. Each worker
+# replays the lines appended since its last read, and rebuilds from the
+# table every BATCH_INDEX_REBUILD_SECONDS, which also drops codes that aged
+# out of the window, corrects any change replayed twice and compacts the
+# journal.
+#
+# Duplicate base codes are checked against the table (find_duplicates()):
+# index() resolves a code to the newest report of any plant, so a collision
+# with an old or another plant's report matters as much as a recent one.
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+from . import batchfilter, db
+from .journal import Journal, JournalGap
+from .models import Plant, Product, QualityReport
+
+
+class PlantCodes:
+    """The sorted distinct codes of one plant, with the number of reports using each."""
+    __slots__ = ('codes', 'counts')
+
+    def __init__(self, counts=None):
+        self.counts = counts or {}
+        self.codes = sorted(self.counts)
+
+    def add(self, code):
+        if code in self.counts:
+            self.counts[code] += 1
+            return
+        self.counts[code] = 1
+        self.codes.insert(bisect_left(self.codes, code), code)
+
+    def remove(self, code):
+        count = self.counts.get(code)
+        if count is None:
+            return
+        if count > 1:
+            self.counts[code] = count - 1
+            return
+        del self.counts[code]
+        index = bisect_left(self.codes, code)
+        if index < len(self.codes) and self.codes[index] == code:
+            del self.codes[index]
+
+    def prefix(self, prefix, limit):
+        """Up to `limit` (code, reports) pairs starting with prefix, in code order."""
+        codes, matches = self.codes, []
+        index = bisect_left(codes, prefix)
+        while index < len(codes) and len(matches) < limit and codes[index].startswith(prefix):
+            matches.append((codes[index], self.counts[codes[index]]))
+            index += 1
+        return matches
+
+
+def normalize(code):
+    """Batch codes are matched upper-cased, as POST / does."""
+    return (code or '').strip().upper()
+
+
+class BatchCodeIndex:
+    def __init__(self, app, days=365, rebuild_seconds=3600, journal_max_bytes=1024 * 1024, journal_path=None):
+        self.app = app
+        self.days = days
+        self.rebuild_seconds = rebuild_seconds
+        self.journal = Journal(journal_path or os.path.join(app.instance_path, 'batch_index.journal'),
+                               max_bytes=journal_max_bytes, keep_seconds=rebuild_seconds)
+        self._plants = None
+        self._built_at = 0.0
+        self._journal_position = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    # --- Building ---
+    def build(self):
+        """Rebuilds the index from quality_report (needs an app context)."""
+        started = time.perf_counter()
+        journal_position = self.journal.end()
+        since = datetime.utcnow() - timedelta(days=self.days)
+        counts = {}
+        for plant_id, code, count in db.session.query(
+            QualityReport.plant_id, QualityReport.batch_code, func.count()
+        ).filter(QualityReport.created_at >= since).group_by(
+            QualityReport.plant_id, QualityReport.batch_code
+        ).yield_per(50000):
+            plant_counts = counts.setdefault(plant_id, {})
+            code = normalize(code)
+            plant_counts[code] = plant_counts.get(code, 0) + count
+        # Sorted once per plant; insertion one code at a time would be quadratic
+        plants = {plant_id: PlantCodes(plant_counts) for plant_id, plant_counts in counts.items()}
+        with self._lock:
+            self._plants = plants
+            self._built_at = time.monotonic()
+            self._journal_position = journal_position
+        # Pick up anything appended while we were scanning
+        self._read_journal(rebuild_on_gap=False)
+        try:
+            self.journal.compact()
+        except OSError as e:
+            self.app.logger.error(f"Batch-code index journal compaction failed: {e}")
+        self.app.logger.info(
+            f"Batch-code index built: {sum(len(p.codes) for p in plants.values())} codes in "
+            f"{len(plants)} plants in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return plants
+
+    def _rebuild_in_background(self):
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+
+        def _run():
+            try:
+                with self.app.app_context():
+                    self.build()
+            except Exception as e:
+                self.app.logger.error(f"Batch-code index rebuild failed: {e}")
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=_run, name='batch-index-rebuild', daemon=True).start()
+
+    # --- Journal ---
+    def _apply(self, line):
+        plant, code = line[1:].split('\t', 1)
+        plant_id = int(plant) if plant else None
+        if line[0] == '+':
+            self._plants.setdefault(plant_id, PlantCodes()).add(code)
+        elif plant_id in self._plants:
+            self._plants[plant_id].remove(code)
+
+    def _read_journal(self, rebuild_on_gap=True):
+        with self._lock:
+            if self._journal_position is None:
+                return
+            try:
+                lines, self._journal_position = self.journal.read(self._journal_position)
+            except JournalGap as e:
+                self.app.logger.warning(f"Batch-code index journal: {e}; rebuilding the index.")
+                self._journal_position = self.journal.end()
+                lines = None
+            else:
+                for line in lines:
+                    self._apply(line.decode('utf-8'))
+        if lines is None and rebuild_on_gap:
+            self.build()
+
+    def record(self, plant_id, added=None, removed=None):
+        """Records a report's code being added and/or removed, for this and every other worker."""
+        plant = '' if plant_id is None else str(int(plant_id))
+        lines = ''.join(f"{op}{plant}\t{normalize(code)}\n" for op, code in (('-', removed), ('+', added)) if code)
+        if not lines:
+            return
+        try:
+            self.journal.append(lines.encode('utf-8'))
+        except OSError as e:
+            self.app.logger.error(f"Batch-code index journal append failed: {e}")
+            with self._lock:
+                if self._plants is not None:
+                    for line in lines.splitlines():
+                        self._apply(line)
+            return
+        if self._plants is not None:
+            self._read_journal()
+
+    # --- Lookup ---
+    def suggest(self, plant_id, prefix, limit=10):
+        """Up to `limit` (code, reports) pairs of the plant's recent codes starting with prefix."""
+        if self._plants is None:
+            with self._lock:
+                needs_build = self._plants is None
+            if needs_build:
+                self.build()
+        elif time.monotonic() - self._built_at > self.rebuild_seconds:
+            self._rebuild_in_background()
+        self._read_journal()
+        codes = self._plants.get(plant_id)
+        return codes.prefix(normalize(prefix), limit) if codes else []
+
+    def stats(self):
+        plants = self._plants
+        if plants is None:
+            return None
+        return {
+            'plants': len(plants),
+            'codes': sum(len(codes.codes) for codes in plants.values()),
+            'reports': sum(sum(codes.counts.values()) for codes in plants.values()),
+            'days': self.days,
+            'age_seconds': time.monotonic() - self._built_at,
+        }
+
+
+def get_index():
+    """Returns the app's BatchCodeIndex, or None when it is disabled."""
+    return current_app.extensions.get('batch_index')
+
+
+def record(plant_id, added=None, removed=None):
+    """BatchCodeIndex.record() on the app's index; a no-op when it is disabled."""
+    index = get_index()
+    if index is not None:
+        index.record(plant_id, added=added, removed=removed)
+
+
+def find_duplicates(code, exclude_id=None, limit=5):
+    """
+    The newest reports (of any plant) already using base code `code`, as
+    dicts, skipping report `exclude_id`. A Bloom-filter miss answers without a query.
+    """
+    code = normalize(code)
+    batch_filter = batchfilter.get_filter()
+    if not code or (batch_filter is not None and not batch_filter.might_contain(code)):
+        return []
+    query = db.session.query(
+        QualityReport.id, QualityReport.created_at, Product.name, func.coalesce(Plant.name, QualityReport.plant_name)
+    ).outerjoin(Product, QualityReport.product_id == Product.id
+    ).outerjoin(Plant, QualityReport.plant_id == Plant.id
+    ).filter(QualityReport.batch_code == code)
+    if exclude_id is not None:
+        query = query.filter(QualityReport.id != exclude_id)
+    return [{'id': report_id, 'product': product, 'plant': plant,
+             'created_at': created_at.isoformat() if created_at else None}
+            for report_id, created_at, product, plant in
+            query.order_by(QualityReport.created_at.desc()).limit(limit)]
+
+
+@click.command('batch-index')
+@with_appcontext
+@click.option('--plant-id', type=int, default=None, help='Plant whose codes --prefix searches.')
+@click.option('--prefix', 'prefixes', multiple=True, help='Prefix to look up (repeatable).')
+def batch_index_command(plant_id, prefixes):
+    """Builds the batch-code autocomplete index and reports its size."""
+    index = get_index()
+    if index is None:
+        click.echo('The batch-code index is disabled (BATCH_INDEX_ENABLED=0).')
+        return
+    started = time.perf_counter()
+    index.build()
+    stats = index.stats()
+    click.echo(f"Built in {time.perf_counter() - started:.2f} s: {stats['codes']} codes "
+               f"({stats['reports']} reports) in {stats['plants']} plants, last {stats['days']} days.")
+    for prefix in prefixes:
+        started = time.perf_counter()
+        matches = index.suggest(plant_id, prefix)
+        elapsed = (time.perf_counter() - started) * 1e6
+        click.echo(f"{prefix}: {', '.join(f'{code} ({count})' for code, count in matches) or '-'} [{elapsed:.0f} us]")
+
+
+def init_app(app):
+    """Attaches a BatchCodeIndex as app.extensions['batch_index'] and registers the CLI."""
+    app.cli.add_command(batch_index_command)
+    if not app.config.get('BATCH_INDEX_ENABLED', True):
+        return
+    app.extensions['batch_index'] = BatchCodeIndex(
+        app,
+        days=app.config.get('BATCH_INDEX_DAYS', 365),
+        rebuild_seconds=app.config.get('BATCH_INDEX_REBUILD_SECONDS', 3600),
+        journal_max_bytes=app.config.get('BATCH_INDEX_JOURNAL_MAX_BYTES', 1024 * 1024),
+    )
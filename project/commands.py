@@ -2,6 +2,12 @@
 # Defines custom Flask CLI commands.
 
 import click
+import json
+import os
+import subprocess
+import sys
+import time
+from flask import current_app
 from flask.cli import with_appcontext
 from . import db
 from .models import User, Product, ReportTemplate, Plant, ParameterMaster
@@ -16,8 +22,8 @@ INITIAL_PLANT_DATA = [
     {'name': 'Corporate', 'code': 'CORP'}
 ]
 
-def generate_default_templates(product, is_cow_milk=False):
-    """Generates the 26 standard templates for a product."""
+def default_template_rows(is_cow_milk=False):
+    """Returns the 26 standard (parameter, specification, method, order) tuples."""
     if is_cow_milk:
         templates_data = [
             # Quality & Safety (Cow Milk Specs)
@@ -68,6 +74,11 @@ def generate_default_templates(product, is_cow_milk=False):
         ('Ammonium Sulphate', 'Negative', 'FSSAI', 25),
         ('Fat B.R reading at 40 Deg C', '40-44', 'FSSAI', 26),
     ]
+    return templates_data
+
+def generate_default_templates(product, is_cow_milk=False):
+    """Generates the 26 standard templates for a product."""
+    templates_data = default_template_rows(is_cow_milk)
 
     new_templates = []
     for order, (param, spec, method, _) in enumerate(templates_data, 1):
@@ -214,7 +225,97 @@ def init_db_command():
 
     click.echo('Database initialization complete.')
 
+# Runs in a fresh interpreter so the numbers reflect a real cold start
+_STARTUP_PROBE = '''
+import json, sys, time
+t0 = time.perf_counter()
+from project import create_app
+app = create_app()
+t1 = time.perf_counter()
+response = app.test_client().get(sys.argv[1])
+t2 = time.perf_counter()
+heavy = [m for m in ('xhtml2pdf', 'reportlab', 'html5lib', 'PIL', 'svglib', 'pyhanko') if m in sys.modules]
+pdf_ms = None
+if sys.argv[2] == '1':
+    from project import pdf_engines
+    t3 = time.perf_counter()
+    pdf_engines.preload()
+    pdf_ms = (time.perf_counter() - t3) * 1000
+print(json.dumps({
+    'create_app_ms': (t1 - t0) * 1000,
+    'first_request_ms': (t2 - t1) * 1000,
+    'first_request_status': response.status_code,
+    'pdf_preload_ms': pdf_ms,
+    'pdf_modules_loaded_at_start': heavy,
+}))
+'''
+
+
+def _parse_importtime(stderr):
+    """Sums `-X importtime` cumulative microseconds per top-level package."""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        try:
+            _, cumulative, name = line[len('import time:'):].split('|')
+        except ValueError:
+            continue
+        # Only top-level imports (no indentation) so nested modules aren't double-counted
+        if name.startswith('   '):
+            continue
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(cumulative)
+    return packages
+
+
+@click.command('startup-profile')
+@with_appcontext
+@click.option('--path', default='/qa/login', show_default=True, help='Path used for the first request.')
+@click.option('--top', default=15, show_default=True, help='Number of packages to list.')
+@click.option('--with-pdf', is_flag=True, default=False, help='Also time loading the PDF engines.')
+@click.option('--json', 'as_json', is_flag=True, default=False, help='Print the profile as JSON.')
+def startup_profile_command(path, top, with_pdf, as_json):
+    """Profiles import cost and time-to-first-request of a cold worker."""
+    project_root = os.path.dirname(current_app.root_path)
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _STARTUP_PROBE, path, '1' if with_pdf else '0'],
+        cwd=project_root, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        click.echo(f"Error: Startup probe failed.\n{proc.stderr[-2000:]}", err=True)
+        return
+
+    profile = json.loads(proc.stdout.strip().splitlines()[-1])
+    packages = _parse_importtime(proc.stderr)
+    profile['process_wall_ms'] = wall_ms
+    profile['total_import_ms'] = sum(packages.values()) / 1000
+    profile['top_imports_ms'] = {
+        name: us / 1000 for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    }
+
+    if as_json:
+        click.echo(json.dumps(profile, indent=2))
+        return
+
+    click.echo(f"Process wall time:       {profile['process_wall_ms']:8.1f} ms")
+    click.echo(f"Total import time:       {profile['total_import_ms']:8.1f} ms")
+    click.echo(f"create_app():            {profile['create_app_ms']:8.1f} ms")
+    click.echo(f"First request ({path}): {profile['first_request_ms']:8.1f} ms "
+               f"(status {profile['first_request_status']})")
+    if profile['pdf_preload_ms'] is not None:
+        click.echo(f"PDF engine preload:      {profile['pdf_preload_ms']:8.1f} ms")
+    loaded = ', '.join(profile['pdf_modules_loaded_at_start']) or 'none'
+    click.echo(f"PDF modules loaded before first PDF: {loaded}")
+    click.echo('Top imports by cumulative time:')
+    for name, ms in profile['top_imports_ms'].items():
+        click.echo(f"  {ms:8.1f} ms  {name}")
+
+
 def init_app(app):
     """Registers commands with the Flask app."""
     app.cli.add_command(init_db_command)
-    app.cli.add_command(create_user_command)
\ No newline at end of file
+    app.cli.add_command(create_user_command)
+    app.cli.add_command(startup_profile_command)
\ No newline at end of file
@@ -0,0 +1,284 @@
+# project/compliance.py
+# Checks report results against their template specifications.
+#
+# A specification is free text; compile_spec() turns the forms we use into
+# a Spec (units and trailing notes such as "on MSNF" are ignored):
+#
+#     Min 6.0hrs, Min. 34 % on MSNF, >= 60   ->  value >= 6.0
+#     Max 550 mg, Max. 0.14, <= 0.14          ->  value <= 550
+#     40-44, 40 to 44                         ->  40 <= value <= 44
+#     Negative, Absent, Nil, Positive         ->  one of the matching words
+#     4  (parameter named "Fat % (Min)")      ->  value >= 4; "(Max)" likewise
+#
+# Only units and notes may follow the number(s): a spec with more digits
+# after its bound, such as "1-2 x 10^4 cfu/g", is not read as 1..2 but left
+# unchecked. Anything else (descriptive text such as "White, Uniform", or a
+# bare number with no direction) is not checked either. A result scores True/False, or None
+# when its spec is unchecked or its value cannot be read as the spec needs.
+# A report is out of spec (False) if any result fails, in spec (True) if
+# at least one result passed and none failed, and None otherwise.
+#
+# Compiled specs are cached per template id together with the text they came
+# from, so an edited specification is recompiled even by a worker that did
+# not see the edit. edit_template() also calls invalidate() and queues a
+# rescore of the product's stored flags.
+
+import re
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, select
+
+from . import db, jobs
+from .models import QualityReport, ReportResult, ReportTemplate
+
+_NUMBER = r'[-+]?(?:\d+(?:\.\d*)?|\.\d+)'
+_RANGE = re.compile(rf'^\s*({_NUMBER})\s*(?:-|–|to)\s*({_NUMBER})', re.IGNORECASE)
+_MIN = re.compile(rf'^\s*(?:min(?:imum)?\.?|>=|≥|>)\s*({_NUMBER})', re.IGNORECASE)
+_MAX = re.compile(rf'^\s*(?:max(?:imum)?\.?|<=|≤|<)\s*({_NUMBER})', re.IGNORECASE)
+_BARE = re.compile(rf'^\s*({_NUMBER})\s*[^\d\s]*\s*$')
+_VALUE = re.compile(_NUMBER)
+# What may follow a bound: units and notes, no further numbers or exponents
+_TAIL = re.compile(r'[^\d]*$')
+
+NEGATIVE = frozenset({'negative', 'absent', 'nil', 'not detected', 'nd', '-ve'})
+POSITIVE = frozenset({'positive', 'present', 'detected', '+ve'})
+
+
+def _words(value):
+    return value.strip().rstrip('.').lower()
+
+
+def parse_number(value):
+    """The first number in a result string ('7.2 %' -> 7.2), or None."""
+    match = _VALUE.search(value) if value else None
+    return float(match.group()) if match else None
+
+
+@event.listens_for(ReportResult.result_value, 'set')
+def _parse_result_value(target, value, oldvalue, initiator):
+    # Keeps result_numeric (used by project/stats.py) in step with every ORM write
+    target.result_numeric = parse_number(value)
+
+
+class Spec:
+    """A compiled specification: kind is 'min', 'max', 'range', 'categorical' or None (unchecked)."""
+    __slots__ = ('kind', 'low', 'high', 'values')
+
+    def __init__(self, kind=None, low=None, high=None, values=None):
+        self.kind = kind
+        self.low = low
+        self.high = high
+        self.values = values
+
+    def check(self, value):
+        """True/False for `value` (a result string), or None if it cannot be checked."""
+        if self.kind is None or value is None:
+            return None
+        if self.kind == 'categorical':
+            words = _words(value)
+            if words in self.values:
+                return True
+            return False if words in NEGATIVE or words in POSITIVE else None
+        number = parse_number(value)
+        if number is None:
+            return None
+        if self.low is not None and number < self.low:
+            return False
+        if self.high is not None and number > self.high:
+            return False
+        return True
+
+    def as_dict(self):
+        """The spec for client-side checks (see qa/new_report.html)."""
+        return {'kind': self.kind, 'low': self.low, 'high': self.high,
+                'values': sorted(self.values) if self.values else None}
+
+    def __repr__(self):
+        return f"Spec({self.kind!r}, low={self.low!r}, high={self.high!r}, values={self.values!r})"
+
+
+UNCHECKED = Spec()
+
+
+def compile_spec(specification, parameter=''):
+    """Parses a specification (see the module comment). Never raises."""
+    text = (specification or '').strip()
+    words = _words(text)
+    if words in NEGATIVE:
+        return Spec('categorical', values=NEGATIVE)
+    if words in POSITIVE:
+        return Spec('categorical', values=POSITIVE)
+    match = _RANGE.match(text)
+    if match:
+        if not _TAIL.match(text, match.end()):
+            return UNCHECKED
+        low, high = sorted((float(match.group(1)), float(match.group(2))))
+        return Spec('range', low=low, high=high)
+    match = _MIN.match(text) or _MAX.match(text)
+    if match:
+        if not _TAIL.match(text, match.end()):
+            return UNCHECKED
+        if match.re is _MIN:
+            return Spec('min', low=float(match.group(1)))
+        return Spec('max', high=float(match.group(1)))
+    match = _BARE.match(text)
+    if match:
+        hint = (parameter or '').lower()
+        if '(min' in hint:
+            return Spec('min', low=float(match.group(1)))
+        if '(max' in hint:
+            return Spec('max', high=float(match.group(1)))
+    return UNCHECKED
+
+
+# template id -> (specification, parameter, Spec)
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def spec_for(template):
+    """The compiled Spec of a ReportTemplate, cached until its text changes."""
+    entry = _compiled.get(template.id)
+    if entry is None or entry[0] != template.specification or entry[1] != template.parameter:
+        entry = (template.specification, template.parameter,
+                 compile_spec(template.specification, template.parameter))
+        with _compiled_lock:
+            _compiled[template.id] = entry
+    return entry[2]
+
+
+def invalidate(template_id=None):
+    """Drops one template's compiled spec, or all of them."""
+    with _compiled_lock:
+        if template_id is None:
+            _compiled.clear()
+        else:
+            _compiled.pop(template_id, None)
+
+
+def report_flag(flags):
+    """Combines result flags into the report flag (see the module comment)."""
+    flag = None
+    for value in flags:
+        if value is False:
+            return False
+        if value is True:
+            flag = True
+    return flag
+
+
+def score_report(report, results):
+    """
+    Sets in_spec on `results` (the report's ReportResult objects) and on
+    `report`, loading their templates in one query; the caller commits.
+    Returns (template, result) pairs for the results that failed.
+    """
+    template_ids = {int(result.template_id) for result in results}
+    templates = {template.id: template for template in
+                 ReportTemplate.query.filter(ReportTemplate.id.in_(template_ids))} if template_ids else {}
+    failed = []
+    for result in results:
+        template = templates.get(int(result.template_id))
+        result.in_spec = spec_for(template).check(result.result_value) if template else None
+        if result.in_spec is False:
+            failed.append((template, result))
+    report.in_spec = report_flag(result.in_spec for result in results)
+    failed.sort(key=lambda pair: pair[0].order)
+    return failed
+
+
+def rescore(plant_id=None, product_id=None, chunk_size=2000, echo=None):
+    """
+    Recomputes the stored flags of every report (optionally of one plant
+    and/or product) in one keyset pass over report ids. Identical (template,
+    value) pairs are checked once, and only flags that changed are written,
+    with one executemany per table and chunk. Returns (results, reports) scored.
+    """
+    specs = {template.id: spec_for(template) for template in ReportTemplate.query}
+    memo = {}
+    scored_results = scored_reports = 0
+    last_id = 0
+    while True:
+        query = select(QualityReport.id, QualityReport.in_spec).where(QualityReport.id > last_id)
+        if plant_id is not None:
+            query = query.where(QualityReport.plant_id == plant_id)
+        if product_id is not None:
+            query = query.where(QualityReport.product_id == product_id)
+        # Core rows: the ORM's per-row processing would dominate at millions of results
+        connection = db.session.connection()
+        reports = connection.execute(query.order_by(QualityReport.id).limit(chunk_size)).all()
+        if not reports:
+            break
+
+        changed_results, flags = [], {}
+        for result_id, report_id, template_id, value, stored in connection.execute(select(
+            ReportResult.id, ReportResult.report_id, ReportResult.template_id, ReportResult.result_value,
+            ReportResult.in_spec
+        ).where(ReportResult.report_id.in_([report_id for report_id, _ in reports]))):
+            key = (template_id, value)
+            flag = memo.get(key, key)
+            if flag is key:
+                flag = memo[key] = specs.get(template_id, UNCHECKED).check(value)
+            if flag is not stored:
+                changed_results.append((flag, result_id))
+            flags.setdefault(report_id, []).append(flag)
+        changed_reports = []
+        for report_id, stored in reports:
+            flag = report_flag(flags.get(report_id, ()))
+            if flag is not stored:
+                changed_reports.append((flag, report_id))
+
+        if changed_results:
+            connection.exec_driver_sql('UPDATE report_result SET in_spec = ? WHERE id = ?', changed_results)
+        if changed_reports:
+            connection.exec_driver_sql('UPDATE quality_report SET in_spec = ? WHERE id = ?', changed_reports)
+        db.session.commit()
+
+        scored_results += sum(len(values) for values in flags.values())
+        scored_reports += len(reports)
+        last_id = reports[-1][0]
+        if echo:
+            echo(f"  {scored_reports} reports scored...")
+    return scored_results, scored_reports
+
+
+@jobs.task('rescore_compliance', queue='maintenance')
+def rescore_compliance(product_id=None, plant_id=None):
+    """Re-scores stored results after a specification edit."""
+    results, reports = rescore(plant_id=plant_id, product_id=product_id)
+    current_app.logger.info(f"Compliance: re-scored {results} results of {reports} reports.")
+
+
+@click.command('compliance-rescore')
+@with_appcontext
+@click.option('--plant-id', type=int, default=None, help='Only reports of this plant.')
+@click.option('--product-id', type=int, default=None, help='Only reports of this product.')
+@click.option('--chunk-size', default=2000, show_default=True, help='Reports per transaction.')
+def compliance_rescore_command(plant_id, product_id, chunk_size):
+    """Checks stored results against the current specifications and updates the pass/fail flags."""
+    started = time.perf_counter()
+    results, reports = rescore(plant_id, product_id, chunk_size, echo=click.echo)
+    click.echo(f"Scored {results} results of {reports} reports in {time.perf_counter() - started:.1f} s.")
+
+
+@click.command('spec-check')
+@with_appcontext
+@click.argument('specification')
+@click.argument('values', nargs=-1)
+@click.option('--parameter', default='', help='Parameter name, for bare-number specs such as "4" on "Fat % (Min)".')
+def spec_check_command(specification, values, parameter):
+    """Shows how a specification is compiled and how VALUES score against it."""
+    spec = compile_spec(specification, parameter)
+    click.echo(repr(spec))
+    for value in values:
+        click.echo(f"  {value!r}: {spec.check(value)}")
+
+
+def init_app(app):
+    """Registers the compliance commands."""
+    app.cli.add_command(compliance_rescore_command)
+    app.cli.add_command(spec_check_command)
@@ -0,0 +1,219 @@
+# project/exports.py
+# Streaming CSV / NDJSON exports of reports and analytics events.
+#
+# Reports are exported one row per report, with each template parameter as a
+# column (the result value, empty when the report has no result for it).
+# Events are exported as stored, with the visitor hash and user agent
+# resolved from their dictionary tables.
+#
+# Rows are read with yield_per, so the database hands them over one chunk at
+# a time; each chunk is encoded (and gzip-compressed, if asked) and yielded
+# before the next is read. An export of millions of rows therefore holds a
+# single chunk in memory. Superadmins download exports from
+# /superadmin/export/<kind>; `flask export` writes the same bytes to a file.
+
+import csv
+import io
+import json
+import sys
+import time
+import zlib
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from . import db
+from .models import (AnalyticsEvent, AnalyticsUserAgent, AnalyticsVisitor, Plant, Product, QualityReport,
+                     ReportResult, ReportTemplate, User)
+
+KINDS = ('reports', 'events')
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+REPORT_COLUMNS = ['id', 'batch_code', 'machine_codes', 'product', 'sku', 'plant', 'creator',
+                  'expiry_date', 'created_at', 'updated_at']
+EVENT_COLUMNS = ['id', 'timestamp', 'event_type', 'report_id', 'plant_id', 'product_id',
+                 'visitor', 'user_agent']
+
+
+def _day_range(column, start, end):
+    """Filters for dates start..end inclusive on a DateTime column (None is unbounded)."""
+    filters = []
+    if start:
+        filters.append(column >= datetime.combine(start, datetime.min.time()))
+    if end:
+        filters.append(column < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    return filters
+
+
+def _partitions(statement, chunk_size):
+    """Yields the result rows of `statement` in lists of up to chunk_size."""
+    # Core execution: plain column rows need none of the ORM's per-row processing
+    result = db.session.connection().execute(statement.execution_options(yield_per=chunk_size))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def report_parameters(product_id=None):
+    """The pivoted parameter columns: the product's templates in order, or every parameter name."""
+    query = db.session.query(ReportTemplate.parameter)
+    if product_id is not None:
+        return [parameter for (parameter,) in query.filter(
+            ReportTemplate.product_id == product_id).order_by(ReportTemplate.order, ReportTemplate.id)]
+    return [parameter for (parameter,) in query.group_by(ReportTemplate.parameter).order_by(
+        func.min(ReportTemplate.order), ReportTemplate.parameter)]
+
+
+def report_chunks(start=None, end=None, plant_id=None, product_id=None, chunk_size=1000):
+    """
+    (columns, chunks) for the reports created between start and end
+    (inclusive dates), optionally for one plant and/or product. Each chunk
+    is a list of rows matching columns; results are pivoted by parameter.
+    """
+    parameters = report_parameters(product_id)
+    statement = select(
+        QualityReport.id, QualityReport.batch_code, QualityReport.machine_codes, Product.name, Product.sku,
+        func.coalesce(Plant.name, QualityReport.plant_name), User.username,
+        QualityReport.expiry_date, QualityReport.created_at, QualityReport.updated_at,
+    ).outerjoin(Product, QualityReport.product_id == Product.id
+    ).outerjoin(Plant, QualityReport.plant_id == Plant.id
+    ).outerjoin(User, QualityReport.user_id == User.id
+    ).where(*_day_range(QualityReport.created_at, start, end)).order_by(QualityReport.id)
+    if plant_id is not None:
+        statement = statement.where(QualityReport.plant_id == plant_id)
+    if product_id is not None:
+        statement = statement.where(QualityReport.product_id == product_id)
+
+    def chunks():
+        for rows in _partitions(statement, chunk_size):
+            values = {}
+            for report_id, parameter, value in db.session.query(
+                ReportResult.report_id, ReportTemplate.parameter, ReportResult.result_value
+            ).join(ReportTemplate, ReportResult.template_id == ReportTemplate.id
+            ).filter(ReportResult.report_id.in_([row[0] for row in rows])):
+                values.setdefault(report_id, {})[parameter] = value
+            yield [list(row) + [values.get(row[0], {}).get(parameter) for parameter in parameters]
+                   for row in rows]
+
+    return REPORT_COLUMNS + parameters, chunks()
+
+
+def event_chunks(start=None, end=None, plant_id=None, product_id=None, event_types=None, chunk_size=5000):
+    """
+    (columns, chunks) for the raw analytics events between start and end
+    (inclusive dates). Only events still within ANALYTICS_RETENTION_DAYS
+    exist; older traffic is available as counts from /api/analytics/series.
+    """
+    statement = select(
+        AnalyticsEvent.id, AnalyticsEvent.timestamp, AnalyticsEvent.event_type, AnalyticsEvent.report_id,
+        AnalyticsEvent.plant_id, QualityReport.product_id, AnalyticsVisitor.ip_hash, AnalyticsUserAgent.user_agent,
+    ).outerjoin(QualityReport, QualityReport.id == AnalyticsEvent.report_id
+    ).outerjoin(AnalyticsVisitor, AnalyticsVisitor.id == AnalyticsEvent.visitor_id
+    ).outerjoin(AnalyticsUserAgent, AnalyticsUserAgent.id == AnalyticsEvent.user_agent_id
+    ).where(*_day_range(AnalyticsEvent.timestamp, start, end)).order_by(AnalyticsEvent.timestamp)
+    if plant_id is not None:
+        statement = statement.where(AnalyticsEvent.plant_id == plant_id)
+    if product_id is not None:
+        statement = statement.where(QualityReport.product_id == product_id)
+    if event_types:
+        statement = statement.where(AnalyticsEvent.event_type.in_(event_types))
+
+    def chunks():
+        for rows in _partitions(statement, chunk_size):
+            yield [list(row) for row in rows]
+
+    return EVENT_COLUMNS, chunks()
+
+
+def encode(columns, chunks, fmt='csv'):
+    """Encodes each chunk of rows as UTF-8 CSV (with a header row) or NDJSON; dates as ISO 8601."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    for rows in chunks:
+        for row in rows:
+            # Checked per value: a column can be NULL throughout the first chunks
+            row = [value.isoformat() if isinstance(value, date) else value for value in row]
+            if writer:
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, row)), separators=(',', ':')))
+                buffer.write('\n')
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # The CSV header of an empty export
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """Compresses a stream of byte chunks into one gzip stream as they arrive."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(kind, fmt='csv', compress=False, **filters):
+    """
+    The export as an iterator of byte chunks. Raises ValueError for an
+    unknown kind or format before any row is read.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of: {', '.join(KINDS)}.")
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}.")
+    if kind == 'reports':
+        filters.pop('event_types', None)
+        columns, chunks = report_chunks(**filters)
+    else:
+        columns, chunks = event_chunks(**filters)
+    body = encode(columns, chunks, fmt)
+    return gzip_stream(body) if compress else body
+
+
+def file_name(kind, fmt, compress=False):
+    return f"{kind}-{datetime.utcnow().strftime('%Y%m%d')}.{fmt}" + ('.gz' if compress else '')
+
+
+@click.command('export')
+@with_appcontext
+@click.argument('kind', type=click.Choice(KINDS))
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv', show_default=True)
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']), default=None, help='First day (YYYY-MM-DD).')
+@click.option('--end', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day (YYYY-MM-DD).')
+@click.option('--plant-id', type=int, default=None)
+@click.option('--product-id', type=int, default=None)
+@click.option('--type', 'event_types', multiple=True, help='Event type to include (events only; repeatable).')
+@click.option('--gzip', 'compress', is_flag=True, default=False, help='Gzip the output.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Output file. Defaults to stdout.')
+def export_command(kind, fmt, start, end, plant_id, product_id, event_types, compress, output):
+    """Streams reports (with results) or analytics events as CSV or NDJSON."""
+    started = time.perf_counter()
+    chunks = stream(kind, fmt, compress, start=start and start.date(), end=end and end.date(),
+                    plant_id=plant_id, product_id=product_id, event_types=list(event_types) or None)
+    written = 0
+    fh = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            fh.write(chunk)
+            written += len(chunk)
+    finally:
+        if output:
+            fh.close()
+        else:
+            fh.flush()
+    if output:
+        click.echo(f"Wrote {written / 2**20:.1f} MiB to {output} in {time.perf_counter() - started:.1f} s.")
+
+
+def init_app(app):
+    """Registers `flask export`."""
+    app.cli.add_command(export_command)
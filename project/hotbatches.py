@@ -0,0 +1,169 @@
+# project/hotbatches.py
+# Streaming top-K of the most requested batch codes.
+#
+# Each worker counts report views and downloads per batch code in a
+# space-saving summary: at most `capacity` counters, and a new code that
+# arrives when they are all taken replaces the smallest one and inherits
+# its count as a known overestimate. Any code whose true count exceeds
+# total / capacity is guaranteed to be tracked. The analytics writer thread
+# adds each worker's counters to per-day rows in `analytics_hot_batch` every
+# HOT_BATCHES_FLUSH_SECONDS, so all workers share one ranking.
+#
+# A scheduled job re-warms the PDFs of the hottest reports in the shared
+# cache, so eviction follows real demand rather than only recent edits.
+
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db, jobs
+from .models import AnalyticsHotBatch
+
+
+class SpaceSaving:
+    """Space-saving heavy-hitters summary (Metwally et al.) over string keys."""
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.counters = {}  # key -> [count, error, report_id]
+
+    def offer(self, key, report_id=None, weight=1):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            counter[2] = report_id
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [weight, 0, report_id]
+        else:
+            # A linear scan is fine at a few hundred counters and only runs for untracked keys
+            victim = min(self.counters, key=lambda k: self.counters[k][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[key] = [floor + weight, floor, report_id]
+
+    def top(self, limit=None):
+        """(key, count, error, report_id) tuples, highest count first."""
+        ranked = sorted(((key, *counter) for key, counter in self.counters.items()),
+                        key=lambda item: item[1], reverse=True)
+        return ranked[:limit] if limit else ranked
+
+
+class HotBatchTracker:
+    def __init__(self, capacity=200, keep_days=30):
+        self.capacity = capacity
+        self.keep_days = keep_days
+        self._summary = SpaceSaving(capacity)
+        self._lock = threading.Lock()
+
+    def record(self, batch_code, report_id=None):
+        with self._lock:
+            self._summary.offer(batch_code, report_id)
+
+    def flush(self):
+        """Adds this worker's counts to today's rows and starts a fresh summary."""
+        with self._lock:
+            summary, self._summary = self._summary, SpaceSaving(self.capacity)
+        if not summary.counters:
+            return 0
+        today = datetime.utcnow().date()
+        statement = sqlite_insert(AnalyticsHotBatch.__table__)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['day', 'batch_code'],
+            set_={
+                'hits': AnalyticsHotBatch.__table__.c.hits + statement.excluded.hits,
+                'error': AnalyticsHotBatch.__table__.c.error + statement.excluded.error,
+                'report_id': statement.excluded.report_id,
+            }), [{'day': today, 'batch_code': key, 'report_id': report_id, 'hits': count, 'error': error}
+                 for key, count, error, report_id in summary.top()])
+
+        # Keep each day's table at the summary size; the tail is noise by construction
+        keep = [code for (code,) in db.session.query(AnalyticsHotBatch.batch_code).filter(
+            AnalyticsHotBatch.day == today).order_by(AnalyticsHotBatch.hits.desc()).limit(self.capacity)]
+        AnalyticsHotBatch.query.filter(
+            AnalyticsHotBatch.day == today, AnalyticsHotBatch.batch_code.notin_(keep)
+        ).delete(synchronize_session=False)
+        AnalyticsHotBatch.query.filter(
+            AnalyticsHotBatch.day < today - timedelta(days=self.keep_days)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return len(summary.counters)
+
+
+def get_tracker():
+    return current_app.extensions.get('hot_batches')
+
+
+def record(report):
+    """Counts one view or download of `report`; never raises into the request."""
+    tracker = get_tracker()
+    if tracker is not None and report is not None:
+        try:
+            tracker.record(report.batch_code, report.id)
+        except Exception as e:
+            current_app.logger.error(f"Hot batch tracking failed: {e}")
+
+
+def hot_batches(days=7, limit=20):
+    """
+    The most requested batch codes over the last `days` days (including
+    today) as dicts with hits, the error bound and the latest report id.
+    """
+    start = datetime.utcnow().date() - timedelta(days=days - 1)
+    hits = func.sum(AnalyticsHotBatch.hits)
+    rows = db.session.query(
+        AnalyticsHotBatch.batch_code, hits, func.sum(AnalyticsHotBatch.error), func.max(AnalyticsHotBatch.report_id)
+    ).filter(AnalyticsHotBatch.day >= start).group_by(AnalyticsHotBatch.batch_code).order_by(
+        hits.desc()).limit(limit).all()
+    return [{'batch_code': batch_code, 'hits': total, 'error': error, 'report_id': report_id}
+            for batch_code, total, error, report_id in rows]
+
+
+@jobs.task('warm_hot_batches', queue='maintenance')
+def warm_hot_batches():
+    """Queues PDF warm-ups for the hottest reports; warm_report_pdf skips PDFs already cached."""
+    config = current_app.config
+    hour = datetime.utcnow().strftime('%Y%m%d%H')
+    for entry in hot_batches(config['HOT_BATCHES_DAYS'], config['HOT_BATCHES_WARM_COUNT']):
+        if entry['report_id'] is not None:
+            jobs.enqueue('warm_report_pdf', {'report_id': entry['report_id']},
+                         idempotency_key=f"warm-hot:{entry['report_id']}:{hour}")
+
+
+@click.command('hot-batches')
+@with_appcontext
+@click.option('--days', default=None, type=int, help='Window in days. Defaults to HOT_BATCHES_DAYS.')
+@click.option('--limit', default=20, show_default=True, help='Number of batch codes to list.')
+def hot_batches_command(days, limit):
+    """Lists the most requested batch codes."""
+    days = days or current_app.config['HOT_BATCHES_DAYS']
+    entries = hot_batches(days, limit)
+    if not entries:
+        click.echo('No hot batches recorded yet.')
+        return
+    click.echo(f"{'Batch code':<20} {'Hits':>10} {'± Error':>10}  Report")
+    for entry in entries:
+        click.echo(f"{entry['batch_code']:<20} {entry['hits']:>10} {entry['error']:>10}  {entry['report_id'] or '-'}")
+
+
+def init_app(app):
+    """
+    Attaches a HotBatchTracker as app.extensions['hot_batches'], flushed by the
+    analytics writer, and schedules the PDF warm-up of the hottest reports.
+    """
+    app.cli.add_command(hot_batches_command)
+    if not app.config.get('HOT_BATCHES_ENABLED', True):
+        return None
+    tracker = HotBatchTracker(
+        capacity=app.config.get('HOT_BATCHES_CAPACITY', 200),
+        keep_days=app.config.get('HOT_BATCHES_KEEP_DAYS', 30),
+    )
+    app.extensions['hot_batches'] = tracker
+    app.extensions['analytics_writer'].every(app.config.get('HOT_BATCHES_FLUSH_SECONDS', 60), tracker.flush)
+    minutes = app.config.get('HOT_BATCHES_WARM_MINUTES', 30)
+    if minutes:
+        jobs.periodic('warm_hot_batches', minutes * 60)
+    return tracker
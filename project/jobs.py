@@ -0,0 +1,340 @@
+# project/jobs.py
+# SQLite-backed job queue and the `flask worker` process that drains it.
+#
+# Jobs live in their own SQLite file (instance/jobs.sqlite) so queue traffic
+# never contends with the application database's write lock. A job belongs
+# to a named queue, has a priority, and is claimed by setting `available_at`
+# into the future (the visibility timeout): a worker that dies mid-job simply
+# lets the claim expire and another worker picks the job up again. Failed
+# jobs are retried with exponential backoff until `max_attempts`; a repeated
+# idempotency key returns the existing job instead of queueing a duplicate.
+#
+# Usage:
+#     @jobs.task('warm_report_pdf', queue='pdf')
+#     def warm_report_pdf(report_id): ...
+#
+#     jobs.enqueue('warm_report_pdf', {'report_id': 7}, idempotency_key='warm-pdf:7')
+
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    id INTEGER PRIMARY KEY,
+    queue TEXT NOT NULL,
+    task TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    idempotency_key TEXT UNIQUE,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_job_ready ON job (queue, priority DESC, available_at)
+    WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_job_finished ON job (finished_at) WHERE finished_at IS NOT NULL;
+"""
+
+# Registered task functions: name -> (function, default queue, max attempts)
+_tasks = {}
+
+# Periodic jobs: (task name, interval in seconds, payload)
+_schedules = []
+
+
+def task(name, queue='default', max_attempts=None):
+    """Registers a function as a job task. Payload keys become keyword arguments."""
+    def decorator(f):
+        _tasks[name] = (f, queue, max_attempts)
+        return f
+    return decorator
+
+
+def periodic(task_name, every_seconds, payload=None):
+    """Makes running workers enqueue `task_name` once every `every_seconds`."""
+    _schedules[:] = [entry for entry in _schedules if entry[0] != task_name]
+    _schedules.append((task_name, every_seconds, payload))
+
+
+class JobQueue:
+    def __init__(self, path, visibility_timeout=300, max_attempts=5, backoff_seconds=10):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    # --- Producer ---
+    def enqueue(self, task_name, payload=None, queue=None, priority=0, delay=0,
+                idempotency_key=None, max_attempts=None):
+        """Queues a job and returns its id (the existing id for a repeated idempotency key)."""
+        registered = _tasks.get(task_name)
+        queue = queue or (registered[1] if registered else 'default')
+        max_attempts = max_attempts or (registered and registered[2]) or self.max_attempts
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO job (queue, task, payload, priority, max_attempts, available_at, '
+                'idempotency_key, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (idempotency_key) DO NOTHING',
+                (queue, task_name, json.dumps(payload or {}), priority, max_attempts,
+                 now + delay, idempotency_key, now))
+            if cursor.rowcount:
+                return cursor.lastrowid
+            return conn.execute('SELECT id FROM job WHERE idempotency_key = ?',
+                                (idempotency_key,)).fetchone()['id']
+
+    # --- Consumer ---
+    def claim(self, queues):
+        """
+        Claims the highest-priority job that is ready in any of `queues`.
+        The claim hides it from other workers for the visibility timeout.
+        An expired claim that already used the job's last attempt (its
+        worker died mid-job every time) marks the job failed instead.
+        """
+        now = time.time()
+        placeholders = ','.join('?' * len(queues))
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                f"UPDATE job SET status = 'failed', finished_at = ?, "
+                f"last_error = 'Claim expired on the last attempt' "
+                f"WHERE queue IN ({placeholders}) AND status = 'running' AND available_at <= ? "
+                f"AND attempts >= max_attempts", (now, *queues, now))
+            row = conn.execute(
+                f"SELECT * FROM job WHERE queue IN ({placeholders}) "
+                f"AND status IN ('queued', 'running') AND available_at <= ? AND attempts < max_attempts "
+                f"ORDER BY priority DESC, available_at LIMIT 1", (*queues, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE job SET status = 'running', attempts = attempts + 1, available_at = ? WHERE id = ?",
+                (now + self.visibility_timeout, row['id']))
+        job = dict(row)
+        job['attempts'] += 1
+        return job
+
+    def complete(self, job_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE job SET status = 'done', finished_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def fail(self, job, error):
+        """Schedules a retry with exponential backoff, or marks the job failed for good."""
+        now = time.time()
+        with self._connect() as conn:
+            if job['attempts'] >= job['max_attempts']:
+                conn.execute("UPDATE job SET status = 'failed', last_error = ?, finished_at = ? WHERE id = ?",
+                             (error, now, job['id']))
+                return False
+            delay = self.backoff_seconds * 2 ** (job['attempts'] - 1) * random.uniform(0.8, 1.2)
+            conn.execute("UPDATE job SET status = 'queued', last_error = ?, available_at = ? WHERE id = ?",
+                         (error, now + delay, job['id']))
+            return True
+
+    def run(self, job):
+        """Runs one claimed job in the current app context. Returns True on success."""
+        registered = _tasks.get(job['task'])
+        try:
+            if registered is None:
+                raise LookupError(f"Unknown task '{job['task']}'")
+            # A fresh app context per job gives each job its own database session
+            with current_app.app_context():
+                registered[0](**json.loads(job['payload']))
+        except Exception as e:
+            retrying = self.fail(job, f"{e}\n{traceback.format_exc(limit=5)}")
+            current_app.logger.error(
+                f"Job {job['id']} ({job['task']}) failed on attempt {job['attempts']}: {e}"
+                f"{' - will retry' if retrying else ' - giving up'}")
+            return False
+        self.complete(job['id'])
+        return True
+
+    # --- Maintenance ---
+    def enqueue_periodic(self):
+        """
+        Enqueues every periodic job that is due. The idempotency key names the
+        current interval, so several workers still enqueue each run only once.
+        """
+        now = time.time()
+        for task_name, every_seconds, payload in _schedules:
+            self.enqueue(task_name, payload,
+                         idempotency_key=f"periodic:{task_name}:{int(now // every_seconds)}")
+
+    def prune(self, keep_seconds):
+        """Deletes finished jobs older than `keep_seconds`. Returns the number removed."""
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM job WHERE finished_at < ?', (time.time() - keep_seconds,)).rowcount
+
+    def counts(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT queue, status, COUNT(*) AS n FROM job GROUP BY queue, status').fetchall()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row['queue'], {})[row['status']] = row['n']
+        return counts
+
+
+class _Transaction:
+    """Commits on success and rolls back on error; the connection stays open for reuse."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, *exc):
+        if self.conn.in_transaction:
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def get_queue():
+    """Returns the app's JobQueue, or None when background jobs are disabled."""
+    return current_app.extensions.get('job_queue')
+
+
+def enqueue(task_name, payload=None, **options):
+    """
+    Queues a job from request code. Failures are logged, never raised: a
+    deferred side job must not turn a successful request into an error.
+    """
+    queue = get_queue()
+    if queue is None:
+        return None
+    try:
+        return queue.enqueue(task_name, payload, **options)
+    except Exception as e:
+        current_app.logger.error(f"Could not enqueue job '{task_name}': {e}")
+        return None
+
+
+# --- CLI ---
+@click.command('worker')
+@with_appcontext
+@click.option('--queue', 'queues', multiple=True, help='Queue(s) to drain. Defaults to every registered queue.')
+@click.option('--burst', is_flag=True, default=False, help='Exit once the queues are empty.')
+def worker_command(queues, burst):
+    """Runs background jobs until interrupted."""
+    queue = get_queue()
+    if queue is None:
+        click.echo('Error: Background jobs are disabled (JOBS_ENABLED=0).', err=True)
+        return
+    queues = list(queues) or sorted({registered[1] for registered in _tasks.values()} | {'default'})
+    poll = current_app.config.get('JOBS_POLL_SECONDS', 1.0)
+    keep_seconds = current_app.config.get('JOBS_KEEP_DAYS', 7) * 86400
+    click.echo(f"Worker {os.getpid()} draining {', '.join(queues)}...")
+
+    processed = failed = 0
+    next_prune = next_schedule = 0.0
+    try:
+        while True:
+            if time.monotonic() >= next_prune:
+                queue.prune(keep_seconds)
+                next_prune = time.monotonic() + 3600
+            if not burst and time.monotonic() >= next_schedule:
+                queue.enqueue_periodic()
+                next_schedule = time.monotonic() + 60
+            job = queue.claim(queues)
+            if job is None:
+                if burst:
+                    break
+                time.sleep(poll)
+                continue
+            if queue.run(job):
+                processed += 1
+            else:
+                failed += 1
+    except KeyboardInterrupt:
+        pass
+    click.echo(f"Worker stopped: {processed} jobs done, {failed} failed attempts.")
+
+
+@click.command('jobs')
+@with_appcontext
+def jobs_command():
+    """Shows job counts per queue and status."""
+    queue = get_queue()
+    if queue is None:
+        click.echo('Background jobs are disabled (JOBS_ENABLED=0).')
+        return
+    counts = queue.counts()
+    if not counts:
+        click.echo('No jobs.')
+    for name, statuses in sorted(counts.items()):
+        click.echo(f"{name}: " + ', '.join(f"{status}={n}" for status, n in sorted(statuses.items())))
+
+
+@click.command('jobs-bench')
+@click.option('--jobs', 'total', default=5000, show_default=True, help='Number of no-op jobs.')
+@click.option('--path', type=click.Path(dir_okay=False), default=None,
+              help='Queue file to benchmark (defaults to a temporary file next to the instance folder).')
+@with_appcontext
+def jobs_bench_command(total, path):
+    """Measures enqueue and claim+complete throughput on the local disk."""
+    directory = None
+    if path is None:
+        directory = tempfile.mkdtemp(dir=current_app.instance_path)
+        path = os.path.join(directory, 'bench.sqlite')
+    queue = JobQueue(path)
+    try:
+        started = time.perf_counter()
+        for i in range(total):
+            queue.enqueue('bench_noop', {'i': i}, queue='bench', priority=i % 3)
+        enqueue_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        while (job := queue.claim(['bench'])) is not None:
+            queue.complete(job['id'])
+        dequeue_seconds = time.perf_counter() - started
+
+        click.echo(f"Enqueue:           {total / enqueue_seconds:,.0f} jobs/s ({enqueue_seconds:.2f} s)")
+        click.echo(f"Claim + complete:  {total / dequeue_seconds:,.0f} jobs/s ({dequeue_seconds:.2f} s)")
+    finally:
+        if directory:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+
+
+def init_app(app):
+    """Opens the job queue as app.extensions['job_queue'] and registers the CLI."""
+    app.cli.add_command(worker_command)
+    app.cli.add_command(jobs_command)
+    app.cli.add_command(jobs_bench_command)
+    if not app.config.get('JOBS_ENABLED', True):
+        return None
+    os.makedirs(app.instance_path, exist_ok=True)
+    queue = JobQueue(
+        app.config.get('JOBS_DATABASE') or os.path.join(app.instance_path, 'jobs.sqlite'),
+        visibility_timeout=app.config.get('JOBS_VISIBILITY_TIMEOUT', 300),
+        max_attempts=app.config.get('JOBS_MAX_ATTEMPTS', 5),
+        backoff_seconds=app.config.get('JOBS_BACKOFF_SECONDS', 10),
+    )
+    app.extensions['job_queue'] = queue
+    return queue
@@ -0,0 +1,119 @@
+# project/journal.py
+# Append-only journal that the workers of one instance folder share.
+#
+# The batch-code Bloom filter and the batch-code index each publish their
+# changes through one: a worker appends a line, and every worker reads the
+# lines appended since its last read. Files are only opened for one append
+# or one read, never held open, and are never renamed, because Windows
+# cannot delete or replace a file another process has open.
+#
+# The journal is a series of numbered segments, <path>.0, <path>.1, ...;
+# writers append to the highest. A rebuild (whose table scan covers every
+# line so far) calls compact(), which starts a new segment once the current
+# one exceeds max_bytes and deletes segments two or more behind that have
+# not been written for keep_seconds. A reader finishes a segment before it
+# moves on to the next. A writer whose append raced a new segment appends
+# again to the new one, so a reader that already moved on still sees the
+# line (a line read twice must be harmless). A reader that falls so far
+# behind that its segment was deleted gets JournalGap and must rebuild.
+
+import os
+import re
+import time
+
+
+class JournalGap(Exception):
+    """Segments the reader had not finished were deleted; it must rebuild."""
+
+
+class Journal:
+    def __init__(self, path, max_bytes=1024 * 1024, keep_seconds=3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep_seconds = keep_seconds
+        self._segment_name = re.compile(re.escape(os.path.basename(path)) + r'\.(\d+)$')
+
+    def _segment_path(self, number):
+        return f"{self.path}.{number}"
+
+    def _size(self, number):
+        try:
+            return os.path.getsize(self._segment_path(number))
+        except OSError:
+            return 0
+
+    def segments(self):
+        """Numbers of the segments on disk, ascending."""
+        try:
+            names = os.listdir(os.path.dirname(self.path) or '.')
+        except OSError:
+            return []
+        return sorted(int(match.group(1)) for match in map(self._segment_name.match, names) if match)
+
+    def latest(self):
+        return max(self.segments(), default=0)
+
+    def end(self):
+        """The position after the last line written so far; reading from it returns only newer lines."""
+        number = self.latest()
+        return number, self._size(number)
+
+    def append(self, data):
+        """Appends `data` (complete lines, as bytes); raises OSError."""
+        number = self.latest()
+        with open(self._segment_path(number), 'ab') as fh:
+            fh.write(data)
+        latest = self.latest()
+        if latest != number:
+            # A new segment started meanwhile; readers may have finished ours already
+            with open(self._segment_path(latest), 'ab') as fh:
+                fh.write(data)
+
+    def read(self, position):
+        """
+        (complete lines after `position`, as bytes, new position). Raises
+        JournalGap when lines after `position` may have been deleted.
+        """
+        number, offset = position
+        lines = []
+        while True:
+            # Checked before reading: a writer that missed the next segment
+            # appended to this one before it was created
+            has_next = os.path.exists(self._segment_path(number + 1))
+            try:
+                with open(self._segment_path(number), 'rb') as fh:
+                    fh.seek(offset)
+                    data = fh.read()
+            except FileNotFoundError:
+                if has_next or self.latest() > number:
+                    raise JournalGap(f"{self._segment_path(number)} was deleted before it was read") from None
+                data = b''
+            # Only consume complete lines; a concurrent append may be half-written
+            end = data.rfind(b'\n') + 1
+            lines.extend(line for line in data[:end].splitlines() if line)
+            offset += end
+            if not has_next:
+                return lines, (number, offset)
+            number, offset = number + 1, 0
+
+    def compact(self):
+        """Starts a new segment if the current one is over max_bytes and deletes old, idle segments."""
+        latest = self.latest()
+        if self._size(latest) > self.max_bytes:
+            try:
+                open(self._segment_path(latest + 1), 'xb').close()
+            except FileExistsError:
+                pass
+            latest += 1
+        cutoff = time.time() - self.keep_seconds
+        for number in self.segments():
+            if number >= latest - 1:
+                break
+            path = self._segment_path(number)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                # Being read by another worker (Windows); removed on a later rebuild
+                continue
+        return latest
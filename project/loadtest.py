@@ -0,0 +1,359 @@
+# project/loadtest.py
+# Self-contained load generator for the public and QA routes.
+
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import machinecodes
+from .models import QualityReport, ReportTemplate
+
+# Relative weights of each scenario in the default traffic mix. Consumer
+# lookups dominate real traffic; PDF downloads and QA posts are rarer.
+DEFAULT_MIX = {
+    'index_get': 30,
+    'lookup_valid': 25,
+    'lookup_valid_machine': 15,
+    'lookup_invalid': 20,
+    'pdf_download': 8,
+    'qa_new_report': 2,
+}
+
+
+# --- Request Plans ---
+def _random_invalid_code(rng):
+    return ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ0123456789') for _ in range(5))
+
+
+def build_plan_from_db(rng, total, mix, qa_product_id=None):
+    """
+    Builds a list of request specs from reports that exist in the database.
+    Each spec is a dict with 'scenario', 'method', 'path' and optional 'form'
+    and 'follow' (follow redirects, as a browser does after a lookup).
+    """
+    reports = QualityReport.query.with_entities(
+        QualityReport.id, QualityReport.batch_code, QualityReport.machine_codes, QualityReport.machine_matcher
+    ).order_by(QualityReport.id.desc()).limit(5000).all()
+
+    plain = [r for r in reports if not r.machine_codes]
+    # Codes each report accepts (wildcard-only expressions have none to list)
+    accepted = {r.id: machinecodes.matcher_for(r).expand(50)[0] for r in reports if r.machine_codes}
+    with_machine = [r for r in reports if accepted.get(r.id)]
+    templates = []
+    if qa_product_id:
+        templates = [t.id for t in ReportTemplate.query.filter_by(product_id=qa_product_id).all()]
+
+    scenarios = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in scenarios]
+    plan = []
+    for _ in range(total):
+        scenario = rng.choices(scenarios, weights)[0]
+        if scenario == 'index_get':
+            plan.append({'scenario': scenario, 'method': 'GET', 'path': '/'})
+        elif scenario == 'lookup_valid' and plain:
+            report = rng.choice(plain)
+            plan.append({'scenario': scenario, 'method': 'POST', 'path': '/', 'follow': True,
+                         'form': {'batch-code': report.batch_code}})
+        elif scenario == 'lookup_valid_machine' and with_machine:
+            report = rng.choice(with_machine)
+            plan.append({'scenario': scenario, 'method': 'POST', 'path': '/', 'follow': True,
+                         'form': {'batch-code': report.batch_code + rng.choice(accepted[report.id])}})
+        elif scenario == 'lookup_invalid':
+            plan.append({'scenario': scenario, 'method': 'POST', 'path': '/', 'follow': True,
+                         'form': {'batch-code': _random_invalid_code(rng)}})
+        elif scenario == 'pdf_download' and reports:
+            report = rng.choice(reports)
+            path = f"/download/report/{report.id}"
+            if accepted.get(report.id):
+                path += f"?machine_code={accepted[report.id][0]}"
+            plan.append({'scenario': scenario, 'method': 'GET', 'path': path})
+        elif scenario == 'qa_new_report' and templates:
+            form = {
+                'product_id': str(qa_product_id),
+                'batch_code': 'LT' + ''.join(rng.choice('0123456789') for _ in range(3)),
+                'expiry_date': (date.today() + timedelta(days=3)).isoformat(),
+                'machine_codes': '',
+            }
+            for template_id in templates:
+                form[f"result-{template_id}"] = 'Negative'
+            plan.append({'scenario': scenario, 'method': 'POST', 'path': '/qa/report/new',
+                         'form': form, 'auth': True})
+    return plan
+
+
+def load_plan_from_file(path):
+    """
+    Reads request specs from a JSONL file, one object per line, e.g.
+    {"scenario": "lookup_valid", "method": "POST", "path": "/", "form": {"batch-code": "AB123"}}
+    A bare {"batch_code": "..."} line is treated as a lookup. A spec may set
+    "expect_status" to a 4xx status the request is meant to return.
+    """
+    plan = []
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            spec = json.loads(line)
+            if 'path' not in spec and 'batch_code' in spec:
+                spec = {'scenario': spec.get('scenario', 'lookup'), 'method': 'POST', 'path': '/',
+                        'follow': True, 'form': {'batch-code': spec['batch_code']}}
+            spec.setdefault('method', 'GET')
+            spec.setdefault('scenario', f"{spec['method']} {spec['path']}")
+            plan.append(spec)
+    return plan
+
+
+# --- Transports ---
+class _TestClientTransport:
+    """
+    Sends requests through the Flask test client, one client per thread.
+    Every test client comes from one address, so the per-IP rate limiter
+    would answer most of the run with 429; that address is exempted here.
+    --url runs still go through the limiter as deployed (see
+    RATE_LIMIT_EXEMPT_IPS).
+    """
+
+    def __init__(self, app, qa_credentials):
+        self.app = app
+        self.qa_credentials = qa_credentials
+        self._local = threading.local()
+        limiter = app.extensions.get('rate_limiter')
+        if limiter is not None:
+            limiter.exempt.add(app.test_client().environ_base['REMOTE_ADDR'])
+
+    def _client(self, auth):
+        attr = 'auth_client' if auth else 'client'
+        client = getattr(self._local, attr, None)
+        if client is None:
+            client = self.app.test_client()
+            if auth:
+                username, password = self.qa_credentials
+                client.post('/qa/login', data={'username': username, 'password': password})
+            setattr(self._local, attr, client)
+        return client
+
+    def send(self, spec):
+        client = self._client(spec.get('auth'))
+        response = client.open(spec['path'], method=spec['method'], data=spec.get('form'),
+                               follow_redirects=spec.get('follow', False))
+        return response.status_code, len(response.get_data())
+
+
+class _HttpTransport:
+    """Sends requests to a running server, one `requests` session per thread."""
+
+    def __init__(self, base_url, qa_credentials, timeout):
+        import requests
+        self._requests = requests
+        self.base_url = base_url.rstrip('/')
+        self.qa_credentials = qa_credentials
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self, auth):
+        attr = 'auth_session' if auth else 'session'
+        session = getattr(self._local, attr, None)
+        if session is None:
+            session = self._requests.Session()
+            if auth:
+                username, password = self.qa_credentials
+                session.post(f"{self.base_url}/qa/login", timeout=self.timeout,
+                             data={'username': username, 'password': password})
+            setattr(self._local, attr, session)
+        return session
+
+    def send(self, spec):
+        session = self._session(spec.get('auth'))
+        response = session.request(spec['method'], f"{self.base_url}{spec['path']}",
+                                   data=spec.get('form'), timeout=self.timeout,
+                                   allow_redirects=spec.get('follow', False))
+        return response.status_code, len(response.content)
+
+
+# --- Runner ---
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def classify(status, spec):
+    """None for a success, else the summary counter it fails under."""
+    if status >= 500:
+        return 'errors'
+    if status == 429:
+        return 'rate_limited'
+    if status >= 400 and status != spec.get('expect_status'):
+        return 'client_errors'
+    return None
+
+
+FAILURE_KINDS = ('errors', 'rate_limited', 'client_errors')
+
+
+def run_plan(transport, plan, concurrency):
+    """
+    Replays `plan` with `concurrency` threads and returns the summary dict.
+    Latency percentiles cover successful requests only; failures are counted
+    per kind (5xx or exception, 429, other unexpected 4xx).
+    """
+    requests = defaultdict(int)
+    samples = defaultdict(list)
+    failures = defaultdict(lambda: dict.fromkeys(FAILURE_KINDS, 0))
+    lock = threading.Lock()
+
+    def worker(spec):
+        start = time.perf_counter()
+        try:
+            status, _ = transport.send(spec)
+            failure = classify(status, spec)
+        except Exception:
+            failure = 'errors'
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with lock:
+            requests[spec['scenario']] += 1
+            if failure:
+                failures[spec['scenario']][failure] += 1
+            else:
+                samples[spec['scenario']].append(elapsed_ms)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, plan))
+    wall_seconds = time.perf_counter() - wall_start
+
+    scenarios = {}
+    for name, count in sorted(requests.items()):
+        values = sorted(samples[name])
+        scenarios[name] = {
+            'requests': count,
+            **failures[name],
+            'throughput_rps': round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+            'mean_ms': round(sum(values) / len(values), 2) if values else 0.0,
+            'p50_ms': round(percentile(values, 50), 2),
+            'p95_ms': round(percentile(values, 95), 2),
+            'p99_ms': round(percentile(values, 99), 2),
+        }
+    return {
+        'total_requests': len(plan),
+        'concurrency': concurrency,
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput_rps': round(len(plan) / wall_seconds, 2) if wall_seconds else 0.0,
+        **{kind: sum(counts[kind] for counts in failures.values()) for kind in FAILURE_KINDS},
+        'scenarios': scenarios,
+    }
+
+
+def compare_to_baseline(summary, baseline, tolerance):
+    """
+    Returns a list of regression messages: a scenario regresses when its p95
+    grows, or its throughput drops, by more than `tolerance` (a fraction), or
+    when it fails more often than in the baseline.
+    """
+    regressions = []
+    for name, current in summary['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        for kind in FAILURE_KINDS:
+            if current[kind] > previous.get(kind, 0):
+                regressions.append(f"{name}: {current[kind]} {kind.replace('_', ' ')} vs baseline "
+                                   f"{previous.get(kind, 0)}")
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms vs baseline {previous['p95_ms']} ms")
+        if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput_rps']} rps vs baseline "
+                               f"{previous['throughput_rps']} rps")
+    return regressions
+
+
+# --- CLI ---
+@click.command('loadtest')
+@with_appcontext
+@click.option('--url', default=None, help='Base URL of a running server. Defaults to the Flask test client.')
+@click.option('--requests', 'total', default=500, show_default=True, help='Total requests to send.')
+@click.option('--concurrency', default=8, show_default=True, help='Number of concurrent workers.')
+@click.option('--seed', default=1, show_default=True, help='Random seed for the request mix.')
+@click.option('--plan-file', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='JSONL file of request specs to replay instead of sampling the database.')
+@click.option('--mix', default=None, help='Scenario weights, e.g. "index_get=5,lookup_invalid=1".')
+@click.option('--qa-user', default=None, help='QA username for the qa_new_report scenario (creates reports).')
+@click.option('--qa-password', default=None, help='Password for --qa-user.')
+@click.option('--qa-product-id', default=None, type=int, help='Product id used for QA form posts.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Write the JSON summary here.')
+@click.option('--baseline', type=click.Path(dir_okay=False), default=None, help='Compare against this JSON summary.')
+@click.option('--save-baseline', is_flag=True, default=False, help='Overwrite --baseline with this run.')
+@click.option('--tolerance', default=0.2, show_default=True, help='Allowed regression as a fraction of the baseline.')
+@click.option('--timeout', default=30.0, show_default=True, help='Per-request timeout for --url mode.')
+def loadtest_command(url, total, concurrency, seed, plan_file, mix, qa_user, qa_password,
+                     qa_product_id, output, baseline, save_baseline, tolerance, timeout):
+    """Replays a realistic request mix and reports latency per scenario."""
+    rng = random.Random(seed)
+
+    weights = dict(DEFAULT_MIX)
+    if mix:
+        weights = {name: 0 for name in DEFAULT_MIX}
+        for part in mix.split(','):
+            name, _, weight = part.partition('=')
+            weights[name.strip()] = int(weight or 1)
+
+    qa_credentials = (qa_user, qa_password) if qa_user and qa_password else None
+    if not qa_credentials or not qa_product_id:
+        weights['qa_new_report'] = 0
+
+    if plan_file:
+        plan = load_plan_from_file(plan_file)
+    else:
+        plan = build_plan_from_db(rng, total, weights, qa_product_id if qa_credentials else None)
+    if not plan:
+        click.echo('Error: No requests to send. Seed the database or pass --plan-file.', err=True)
+        return
+
+    if url:
+        transport = _HttpTransport(url, qa_credentials, timeout)
+    else:
+        transport = _TestClientTransport(current_app._get_current_object(), qa_credentials)
+
+    click.echo(f"Sending {len(plan)} requests with concurrency {concurrency}...")
+    summary = run_plan(transport, plan, concurrency)
+    report = json.dumps(summary, indent=2)
+    click.echo(report)
+    if any(summary[kind] for kind in FAILURE_KINDS):
+        click.echo(f"Failed requests: {summary['errors']} errors, {summary['rate_limited']} rate limited (429), "
+                   f"{summary['client_errors']} unexpected 4xx.", err=True)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as fh:
+            fh.write(report)
+
+    if baseline:
+        if save_baseline:
+            with open(baseline, 'w', encoding='utf-8') as fh:
+                fh.write(report)
+            click.echo(f"Baseline saved to {baseline}.")
+            return
+        with open(baseline, encoding='utf-8') as fh:
+            regressions = compare_to_baseline(summary, json.load(fh), tolerance)
+        if regressions:
+            click.echo('Regressions against baseline:', err=True)
+            for message in regressions:
+                click.echo(f"  - {message}", err=True)
+            raise SystemExit(1)
+        click.echo('No regressions against baseline.')
+
+
+def init_app(app):
+    """Registers the load-test command with the Flask app."""
+    app.cli.add_command(loadtest_command)
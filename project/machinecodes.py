@@ -0,0 +1,321 @@
+# project/machinecodes.py
+# Machine-code expressions: which machine codes a report's batch code accepts.
+#
+# A report's machine_codes is a comma-separated list of terms:
+#   A7        one code
+#   A1-A24    a numeric range with a common prefix (A1-24 is the same range;
+#             A01-A24 matches the zero-padded codes A01 ... A24; at most
+#             MAX_RANGE_SIZE codes wide)
+#   B*        every code starting with B (a lone * accepts any code)
+#   !A13      an exclusion; any of the forms above prefixed with ! removes
+#             codes the other terms accept, e.g. "A1-A24,!A13"
+# Codes are matched upper-cased, as index() upper-cases the batch code.
+#
+# An expression compiles to a MachineCodeMatcher: a set of exact codes,
+# ranges keyed by prefix and wildcard prefixes grouped by length, so a lookup
+# is a few set probes however long the list or wide the ranges are. The
+# compiled form is stored as JSON in quality_report.machine_matcher next to
+# the raw string when a report is saved, and loaded matchers are cached per
+# compiled form, so a lookup neither parses nor rebuilds anything.
+#
+# Reports written without a compiled form (older rows, bulk inserts) keep
+# the meaning machine_codes had before expressions existed: a list of exact
+# codes, so "L1-2" stays the single code L1-2 rather than becoming a range.
+# Saving a report with unchanged machine codes keeps that meaning; only text
+# someone edits is read as an expression. `flask machine-codes-compile`
+# stores the exact-list form for such rows and lists the ones whose text
+# would read differently as an expression, for review.
+
+import json
+import re
+import time
+from functools import lru_cache
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import update
+
+from . import db
+from .models import QualityReport
+
+# Loaded matchers kept per process (each is a few small sets)
+CACHE_SIZE = 4096
+# Widest range a term may span, and the most codes expand() tests before
+# giving up, so a wide range behind broad exclusions cannot stall a request
+MAX_RANGE_SIZE = 10000
+EXPAND_PROBES = 50000
+
+_RANGE = re.compile(r'^([A-Z]*)(\d+)-([A-Z]*)(\d+)$')
+_NUMBERED = re.compile(r'^([A-Z]*)(\d+)$')
+
+
+def _width(digits):
+    """Zero-padded width of a range bound, or 0 for plain numbers."""
+    return len(digits) if len(digits) > 1 and digits.startswith('0') else 0
+
+
+class TermSet:
+    """Exact codes, numeric ranges and wildcard prefixes; one side (accept or exclude) of an expression."""
+    __slots__ = ('exact', 'ranges', 'prefixes')
+
+    def __init__(self, exact=(), ranges=(), prefixes=()):
+        self.exact = frozenset(exact)
+        # {prefix: ((low, high, width), ...)}
+        grouped = {}
+        for prefix, low, high, width in ranges:
+            grouped.setdefault(prefix, []).append((low, high, width))
+        self.ranges = {prefix: tuple(sorted(bounds)) for prefix, bounds in grouped.items()}
+        # {length: frozenset of prefixes}; '' (a lone *) accepts everything
+        by_length = {}
+        for prefix in prefixes:
+            by_length.setdefault(len(prefix), set()).add(prefix)
+        self.prefixes = {length: frozenset(group) for length, group in by_length.items()}
+
+    def __bool__(self):
+        return bool(self.exact or self.ranges or self.prefixes)
+
+    def contains(self, code):
+        if code in self.exact:
+            return True
+        for length, group in self.prefixes.items():
+            if code[:length] in group:
+                return True
+        if self.ranges:
+            match = _NUMBERED.match(code)
+            if match and match.group(1) in self.ranges:
+                digits = match.group(2)
+                number, width = int(digits), _width(digits)
+                for low, high, range_width in self.ranges[match.group(1)]:
+                    if low <= number <= high and (len(digits) == range_width if range_width
+                                                  else width == 0):
+                        return True
+        return False
+
+    def range_list(self):
+        return [[prefix, low, high, width]
+                for prefix in sorted(self.ranges) for low, high, width in self.ranges[prefix]]
+
+    def prefix_list(self):
+        return sorted(prefix for group in self.prefixes.values() for prefix in group)
+
+    def terms(self):
+        """The terms in canonical order, as expression text."""
+        terms = sorted(self.exact)
+        for prefix, low, high, width in self.range_list():
+            terms.append(f"{prefix}{low:0{width}d}-{prefix}{high:0{width}d}")
+        terms.extend(f"{prefix}*" for prefix in self.prefix_list())
+        return terms
+
+    def as_dict(self):
+        return {'exact': sorted(self.exact), 'ranges': self.range_list(), 'prefixes': self.prefix_list()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('exact', ()), [tuple(r) for r in data.get('ranges', ())], data.get('prefixes', ()))
+
+
+class MachineCodeMatcher:
+    """A compiled machine-code expression: codes the accept terms match and no exclusion does."""
+    __slots__ = ('accept', 'exclude')
+
+    def __init__(self, accept, exclude):
+        self.accept = accept
+        self.exclude = exclude
+
+    def __bool__(self):
+        return bool(self.accept)
+
+    def matches(self, code):
+        code = (code or '').strip().upper()
+        return bool(code) and self.accept.contains(code) and not self.exclude.contains(code)
+
+    @property
+    def open_ended(self):
+        """True when a wildcard accepts codes that cannot be listed."""
+        return bool(self.accept.prefixes)
+
+    def expand(self, limit):
+        """
+        Up to `limit` listable codes (exact codes and range members, minus the
+        exclusions) in canonical order, and whether that is all of them.
+        Stops, incomplete, after EXPAND_PROBES candidate codes.
+        """
+        codes, seen = [], set()
+        probes = 0
+
+        def take(code):
+            nonlocal probes
+            probes += 1
+            if probes > EXPAND_PROBES:
+                return False
+            if code in seen or self.exclude.contains(code):
+                return True
+            if len(codes) >= limit:
+                return False
+            seen.add(code)
+            codes.append(code)
+            return True
+
+        for code in sorted(self.accept.exact):
+            if not take(code):
+                return codes, False
+        for prefix, low, high, width in self.accept.range_list():
+            for number in range(low, high + 1):
+                if not take(f"{prefix}{number:0{width}d}"):
+                    return codes, False
+        return codes, True
+
+    def normalized(self):
+        """The canonical expression text (what the stored form means)."""
+        return ','.join(self.accept.terms() + [f"!{term}" for term in self.exclude.terms()])
+
+    def to_json(self):
+        data = {'accept': self.accept.as_dict()}
+        if self.exclude:
+            data['exclude'] = self.exclude.as_dict()
+        return json.dumps(data, separators=(',', ':'))
+
+
+def _parse_term(term):
+    """Classifies one term as ('exact' | 'range' | 'prefix', value); raises ValueError when it is malformed."""
+    if '*' in term:
+        if term.index('*') != len(term) - 1:
+            raise ValueError(f"'{term}': a wildcard can only end a term, as in B*.")
+        return 'prefix', term[:-1]
+    if '-' in term:
+        match = _RANGE.match(term)
+        if not match:
+            raise ValueError(f"'{term}' is not a range like A1-A24.")
+        prefix, low_digits, end_prefix, high_digits = match.groups()
+        if end_prefix and end_prefix != prefix:
+            raise ValueError(f"'{term}': both ends of a range need the same prefix.")
+        low, high = int(low_digits), int(high_digits)
+        if low > high:
+            raise ValueError(f"'{term}': the range runs backwards.")
+        if high - low >= MAX_RANGE_SIZE:
+            raise ValueError(f"'{term}': a range may span at most {MAX_RANGE_SIZE} codes.")
+        width = _width(low_digits)
+        if width and len(high_digits) != width:
+            raise ValueError(f"'{term}': zero-padded bounds need the same number of digits.")
+        return 'range', (prefix, low, high, width)
+    return 'exact', term
+
+
+def compile_expression(expression):
+    """Compiles a machine-code expression (see the module comment). Raises ValueError when it is malformed."""
+    sides = {'accept': ([], [], []), 'exclude': ([], [], [])}
+    for term in (expression or '').split(','):
+        term = term.strip().upper()
+        side = 'accept'
+        if term.startswith('!'):
+            side, term = 'exclude', term[1:].strip()
+            if not term:
+                raise ValueError("'!' needs a code, range or wildcard to exclude.")
+        if not term:
+            continue
+        kind, value = _parse_term(term)
+        exact, ranges, prefixes = sides[side]
+        {'exact': exact, 'range': ranges, 'prefix': prefixes}[kind].append(value)
+    if not any(sides['accept']) and any(sides['exclude']):
+        raise ValueError('An expression of exclusions only accepts nothing; add the codes to exclude from, e.g. "*,!A13".')
+    return MachineCodeMatcher(TermSet(*sides['accept']), TermSet(*sides['exclude']))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def load(compiled):
+    """The matcher for a stored compiled form (MachineCodeMatcher.to_json())."""
+    data = json.loads(compiled)
+    return MachineCodeMatcher(TermSet.from_dict(data.get('accept', {})),
+                              TermSet.from_dict(data.get('exclude', {})))
+
+
+def exact_list(codes):
+    """The pre-expression meaning of a machine_codes string: each comma-separated code, exactly."""
+    return MachineCodeMatcher(TermSet(code.strip().upper() for code in codes.split(',') if code.strip()), TermSet())
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile_raw(codes):
+    return exact_list(codes)
+
+
+def matcher_for(report):
+    """
+    The matcher of a report (or a row with machine_codes and machine_matcher),
+    or None when the report has no machine codes.
+    """
+    if not report.machine_codes:
+        return None
+    compiled = getattr(report, 'machine_matcher', None)
+    return load(compiled) if compiled else _compile_raw(report.machine_codes)
+
+
+def reads_differently(report):
+    """True when reading the report's machine_codes as an expression would change what it accepts."""
+    if not report.machine_codes:
+        return False
+    try:
+        reading = compile_expression(report.machine_codes)
+    except ValueError:
+        return True
+    return reading.normalized() != matcher_for(report).normalized()
+
+
+def compile_for_storage(expression, report=None):
+    """
+    (raw expression or None, compiled JSON or None) to store on a report;
+    raises ValueError. With `report`, unchanged text keeps its stored meaning.
+    """
+    expression = (expression or '').strip()
+    if not expression:
+        return None, None
+    if report is not None and report.machine_codes and expression == report.machine_codes.strip():
+        return report.machine_codes, matcher_for(report).to_json()
+    matcher = compile_expression(expression)
+    if not matcher:
+        return None, None
+    return expression, matcher.to_json()
+
+
+@click.command('machine-codes-compile')
+@with_appcontext
+@click.option('--chunk-size', default=5000, show_default=True, help='Reports updated per transaction.')
+@click.option('--show', default=20, show_default=True, help='Ambiguous reports to list.')
+def machine_codes_compile_command(chunk_size, show):
+    """
+    Stores the compiled exact-list matcher of reports that lack one and lists
+    those whose machine codes would mean something else as an expression.
+    """
+    started = time.perf_counter()
+    last_id, compiled, ambiguous, examples = 0, 0, 0, []
+    while True:
+        rows = db.session.query(QualityReport.id, QualityReport.machine_codes).filter(
+            QualityReport.id > last_id, QualityReport.machine_codes.isnot(None),
+            QualityReport.machine_codes != '', QualityReport.machine_matcher.is_(None)
+        ).order_by(QualityReport.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = []
+        for row in rows:
+            updates.append({'id': row.id, 'machine_matcher': exact_list(row.machine_codes).to_json()})
+            if reads_differently(row):
+                ambiguous += 1
+                if len(examples) < show:
+                    examples.append(row)
+        db.session.execute(update(QualityReport), updates)
+        db.session.commit()
+        compiled += len(updates)
+    click.echo(f"Compiled {compiled} reports as exact code lists in {time.perf_counter() - started:.1f} s.")
+    if ambiguous:
+        click.echo(f"{ambiguous} reports would read differently as expressions (ranges, wildcards or "
+                   f"exclusions); they keep matching their codes exactly until edited:")
+        for row in examples:
+            click.echo(f"  report {row.id}: {row.machine_codes}")
+        if ambiguous > len(examples):
+            click.echo(f"  ... and {ambiguous - len(examples)} more.")
+
+
+def init_app(app):
+    """Registers `flask machine-codes-compile`."""
+    app.cli.add_command(machine_codes_compile_command)
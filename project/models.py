@@ -35,6 +35,8 @@ class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     sku = db.Column(db.String(50), unique=True, nullable=False)
+    # Bumped on every change to the product's templates (see project/templateops.py)
+    template_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     templates = db.relationship('ReportTemplate', backref='product', lazy=True, cascade="all, delete-orphan")
     plants = db.relationship('Plant', secondary=plant_product_association,
                              back_populates='products', lazy='dynamic')
@@ -84,6 +86,8 @@ class QualityReport(db.Model):
     # BEST PRACTICE: Add the new field to store machine codes.
     # It is nullable to ensure old reports without this data remain valid.
     machine_codes = db.Column(db.String(500), nullable=True)
+    # machine_codes compiled by project/machinecodes.py, as JSON; None until compiled
+    machine_matcher = db.Column(db.Text, nullable=True)
     expiry_date = db.Column(db.Date, nullable=False)
     plant_name = db.Column(db.String(100), nullable=True)
     # Add the new, nullable column
@@ -91,7 +95,12 @@ class QualityReport(db.Model):
     # Add the relationship
     plant = db.relationship('Plant', backref=db.backref('reports', lazy=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Version stamp for HTTP validators (ETag / Last-Modified); bumped on every edit
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     product = db.relationship('Product')
+    # Specification compliance (project/compliance.py): False if any result is
+    # out of spec, True if all checked results pass, None if nothing was checked
+    in_spec = db.Column(db.Boolean, nullable=True)
     __table_args__ = (
         db.Index('idx_report_batch_code', 'batch_code'),
     )
@@ -102,20 +111,114 @@ class ReportResult(db.Model):
     report_id = db.Column(db.Integer, db.ForeignKey('quality_report.id'), nullable=False)
     template_id = db.Column(db.Integer, db.ForeignKey('report_template.id'), nullable=False)
     result_value = db.Column(db.String(100), nullable=False)
+    # True/False against the template specification; None when it cannot be checked
+    in_spec = db.Column(db.Boolean, nullable=True)
+    # First number in result_value, set whenever it is assigned (see project/compliance.py)
+    result_numeric = db.Column(db.Float, nullable=True)
     template = db.relationship('ReportTemplate')
 
+    __table_args__ = (
+        db.Index('idx_result_report', 'report_id'),
+        # Per-parameter statistics (project/stats.py) scan one template's results at a time
+        db.Index('idx_result_template_report', 'template_id', 'report_id'),
+    )
+
+
+class ArchivedReport(db.Model):
+    """
+    Index entry for a report moved out of the hot tables by `flask archive-reports`.
+    The full report lives in a gzip member of an archive file under instance/archive.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    # The original QualityReport id (SQLite may reuse ids, so it is not the key here)
+    report_id = db.Column(db.Integer, nullable=False)
+    batch_code = db.Column(db.String(50), nullable=False, index=True)
+    machine_codes = db.Column(db.String(500), nullable=True)
+    product_name = db.Column(db.String(100), nullable=True)
+    plant_id = db.Column(db.Integer, nullable=True)
+    expiry_date = db.Column(db.Date, nullable=False)
+    archive_file = db.Column(db.String(200), nullable=False)
+    member_offset = db.Column(db.BigInteger, nullable=False)
+    member_length = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class AnalyticsUserAgent(db.Model):
+    """Dictionary of distinct user-agent strings, referenced by AnalyticsEvent."""
+    __tablename__ = 'analytics_user_agent'
+    id = db.Column(db.Integer, primary_key=True)
+    # sha1 of the string: a short unique key instead of indexing the full text
+    digest = db.Column(db.String(40), unique=True, nullable=False)
+    user_agent = db.Column(db.Text, nullable=False)
+
+
+class AnalyticsVisitor(db.Model):
+    """Dictionary of visitors, identified by a keyed hash of their IP address."""
+    __tablename__ = 'analytics_visitor'
+    id = db.Column(db.Integer, primary_key=True)
+    ip_hash = db.Column(db.String(32), unique=True, nullable=False)
+
+
+class AnalyticsHourly(db.Model):
+    """Per-hour event counts by type, plant and product (0 = none); see project/rollups.py."""
+    __tablename__ = 'analytics_hourly'
+    hour = db.Column(db.DateTime, primary_key=True)
+    event_type = db.Column(db.String(50), primary_key=True)
+    plant_id = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AnalyticsDaily(db.Model):
+    """Per-day event counts, summed from AnalyticsHourly; raw events are deleted after the retention period."""
+    __tablename__ = 'analytics_daily'
+    day = db.Column(db.Date, primary_key=True)
+    event_type = db.Column(db.String(50), primary_key=True)
+    plant_id = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AnalyticsSketch(db.Model):
+    """HyperLogLog sketch of one day's visitors for a scope ('all', 'plant:<id>', 'product:<id>')."""
+    __tablename__ = 'analytics_sketch'
+    day = db.Column(db.Date, primary_key=True)
+    scope = db.Column(db.String(40), primary_key=True)
+    # zlib-compressed registers; see project/sketches.py
+    registers = db.Column(db.LargeBinary, nullable=False)
+
+
+class AnalyticsHotBatch(db.Model):
+    """Per-day hit counts of the most requested batch codes, flushed from the in-memory top-K tracker."""
+    __tablename__ = 'analytics_hot_batch'
+    day = db.Column(db.Date, primary_key=True)
+    batch_code = db.Column(db.String(50), primary_key=True)
+    report_id = db.Column(db.Integer, nullable=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    # Space-saving overestimate: the true count is between hits - error and hits
+    error = db.Column(db.Integer, nullable=False, default=0)
+
 
 class AnalyticsEvent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     
     # We will log: 'PAGE_VIEW', 'REPORT_VIEW', 'REPORT_DOWNLOAD'
-    event_type = db.Column(db.String(50), nullable=False, index=True) 
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # (event_type lookups use idx_event_timestamp, which leads with it)
+    event_type = db.Column(db.String(50), nullable=False)
+    # Indexed alone for time-range scans across all types (rollups, retention)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
-    # User data (anonymized for privacy)
-    ip_address = db.Column(db.String(100), nullable=True)
-    user_agent = db.Column(db.Text, nullable=True)
+    # User data (anonymized for privacy): dictionary ids instead of raw strings
+    visitor_id = db.Column(db.Integer, db.ForeignKey('analytics_visitor.id'), nullable=True)
+    user_agent_id = db.Column(db.Integer, db.ForeignKey('analytics_user_agent.id'), nullable=True)
+
+    # Report views and downloads only. No foreign keys: events outlive
+    # reports that are edited away or archived.
+    report_id = db.Column(db.Integer, nullable=True)
+    plant_id = db.Column(db.Integer, nullable=True)
 
     __table_args__ = (
         db.Index('idx_event_timestamp', 'event_type', 'timestamp'),
+        # Partial: most events (page views) have no report
+        db.Index('idx_event_report', 'report_id', 'timestamp', sqlite_where=db.text('report_id IS NOT NULL')),
     )
\ No newline at end of file
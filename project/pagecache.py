@@ -0,0 +1,148 @@
+# project/pagecache.py
+# Rendered-page cache with precompressed variants and strong ETags.
+#
+# Used for pages that are identical for every anonymous visitor (the public
+# landing page). Each entry stores the rendered HTML plus gzip (and brotli,
+# when the optional `brotli` package is installed) encodings, so a hit is a
+# dictionary lookup and a bytes copy.
+
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+from hashlib import sha1
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+_pages = {}
+_lock = threading.Lock()
+_deploy_tokens = {}
+
+
+class CachedPage:
+    def __init__(self, html):
+        self.body = html.encode('utf-8')
+        self.etag = sha1(self.body).hexdigest()[:32]
+        self.variants = {'identity': self.body, 'gzip': gzip.compress(self.body, 9)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(self.body, quality=11)
+
+
+def deploy_token(template_names, data=None):
+    """
+    A hash of the given templates' source and the static data they render.
+    It changes whenever a deploy edits either, which invalidates the cache.
+    `data` is treated as immutable: tokens are cached per data object, which
+    the cache entry keeps alive so its id cannot be reused by another object.
+    """
+    key = (tuple(template_names), id(data))
+    entry = _deploy_tokens.get(key)
+    if entry is None:
+        digest = sha1(json.dumps(data, sort_keys=True).encode('utf-8'))
+        loader = current_app.jinja_env.loader
+        for name in template_names:
+            source, _, _ = loader.get_source(current_app.jinja_env, name)
+            digest.update(source.encode('utf-8'))
+        entry = _deploy_tokens[key] = (data, digest.hexdigest()[:16])
+    return entry[1]
+
+
+# Everything a report rendering shows besides the report row itself (templates,
+# product names, signatures) is versioned by one content generation: the
+# size of an append-only file in the instance folder, which every worker can
+# read with a stat(). An admin change appends a line (O_APPEND, so concurrent
+# bumps never collapse into one) and its mtime is when content last changed.
+CONTENT_GENERATION_FILE = 'content_generation'
+
+
+def content_generation():
+    """(generation, UTC datetime of the last bump or None) of rendered report content."""
+    try:
+        stat = os.stat(os.path.join(current_app.instance_path, CONTENT_GENERATION_FILE))
+    except OSError:
+        return 0, None
+    return stat.st_size, datetime.utcfromtimestamp(stat.st_mtime)
+
+
+def bump_content_generation():
+    """Marks every rendered report (HTML and PDF) as changed, in every worker."""
+    try:
+        with open(os.path.join(current_app.instance_path, CONTENT_GENERATION_FILE), 'a', encoding='utf-8') as fh:
+            fh.write(f"{datetime.utcnow().isoformat()}\n")
+    except OSError as e:
+        current_app.logger.error(f"Could not bump the report content generation: {e}")
+
+
+def is_cacheable():
+    """Only anonymous GETs without pending flash messages get the shared page."""
+    return (request.method == 'GET'
+            and not request.args
+            and '_flashes' not in session
+            and not current_user.is_authenticated)
+
+
+def get_page(key, render):
+    """
+    Returns the CachedPage for `key`. On a miss the HTML comes from the
+    cross-process shared cache when another worker already rendered it,
+    otherwise from `render()`.
+    """
+    page = _pages.get(key)
+    if page is None:
+        shared = current_app.extensions.get('shared_cache')
+        body = shared.get('pages', key) if shared is not None else None
+        if body is not None:
+            html = body.decode('utf-8')
+        else:
+            html = render()
+            if shared is not None:
+                shared.set('pages', key, html.encode('utf-8'))
+        page = CachedPage(html)
+        with _lock:
+            _pages[key] = page
+    return page
+
+
+def clear():
+    """Drops every cached page and deploy token."""
+    with _lock:
+        _pages.clear()
+        _deploy_tokens.clear()
+
+
+def _choose_encoding(page):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in page.variants and accepted[encoding]:
+            return encoding
+    return 'identity'
+
+
+def page_response(page, max_age=0):
+    """Builds a response for `page`, honouring Accept-Encoding and If-None-Match."""
+    encoding = _choose_encoding(page)
+    etag = page.etag if encoding == 'identity' else f"{page.etag}-{encoding}"
+
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = make_response(page.variants[encoding])
+        response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding, Cookie'
+    response.headers['Cache-Control'] = f"public, max-age={max_age}"
+    return response
+
+
+def cache_key(name, template_names, data):
+    return f"{name}:{deploy_token(template_names, data)}:{datetime.utcnow().year}"
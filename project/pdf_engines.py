@@ -0,0 +1,100 @@
+# project/pdf_engines.py
+# Registry of PDF engines, imported on first use.
+#
+# The PDF stacks (xhtml2pdf pulls in reportlab, html5lib, PIL, svglib and
+# pyHanko) cost seconds to import, so worker processes that only serve
+# lookups never load them. Each engine registers a loader; the first call
+# to `get_engine()` runs it and caches the result.
+
+import threading
+import time
+from io import BytesIO
+
+_loaders = {}
+_engines = {}
+_load_times = {}
+_lock = threading.Lock()
+
+
+def register_engine(name, loader):
+    """Registers `loader`, a zero-argument callable returning a render function."""
+    _loaders[name] = loader
+
+
+def get_engine(name):
+    """Returns the render function for `name`, importing its stack if needed."""
+    engine = _engines.get(name)
+    if engine is not None:
+        return engine
+    with _lock:
+        engine = _engines.get(name)
+        if engine is None:
+            start = time.perf_counter()
+            engine = _engines[name] = _loaders[name]()
+            _load_times[name] = (time.perf_counter() - start) * 1000
+    return engine
+
+
+def is_loaded(name):
+    return name in _engines
+
+
+def load_times():
+    """Returns {engine name: import time in ms} for engines loaded so far."""
+    return dict(_load_times)
+
+
+def preload(names=None):
+    """Imports the given engines (default: all registered) and returns load_times()."""
+    for name in names or list(_loaders):
+        get_engine(name)
+    return load_times()
+
+
+def start_background_preload(app, names=None):
+    """Preloads engines on a daemon thread so the first PDF request is warm."""
+    def _run():
+        try:
+            times = preload(names)
+            app.logger.info(f"PDF engines preloaded: {times}")
+        except Exception as e:
+            app.logger.error(f"PDF engine preload failed: {e}")
+
+    thread = threading.Thread(target=_run, name='pdf-preload', daemon=True)
+    thread.start()
+    return thread
+
+
+# --- Built-in Engines ---
+def _load_xhtml2pdf():
+    from xhtml2pdf import pisa
+
+    def render(html, link_callback=None):
+        """Renders HTML to PDF bytes. Returns (pdf_bytes, error)."""
+        result = BytesIO()
+        pdf = pisa.CreatePDF(BytesIO(html.encode('UTF-8')), dest=result, link_callback=link_callback)
+        if pdf.err:
+            return None, pdf.err
+        return result.getvalue(), None
+
+    return render
+
+
+# Every engine renders HTML (render(html, link_callback=None) -> (pdf_bytes,
+# error)); utils.generate_report_pdf() draws from report objects instead, so
+# it is not one of them.
+register_engine('xhtml2pdf', _load_xhtml2pdf)
+
+
+def init_app(app):
+    """Schedules the background preload after the first request when PDF_WARMUP is on."""
+    if not app.config.get('PDF_WARMUP'):
+        return
+
+    state = {'started': False}
+
+    @app.before_request
+    def _warm_pdf_engines():
+        if not state['started']:
+            state['started'] = True
+            start_background_preload(app)
@@ -0,0 +1,332 @@
+# project/querystats.py
+# Engine-level query fingerprinting and slow-query logging.
+#
+# Each process flushes its aggregates to instance/querystats/<pid>-<start>.json.
+# Snapshots not rewritten for QUERY_STATS_RETENTION_HOURS are pruned when a
+# process starts; a live process rewrites its own on every flush. Processes
+# are not probed by pid: signal 0 is Ctrl+C on Windows. A reset
+# bumps the number in instance/querystats/GENERATION; every process checks it
+# before flushing and drops its counters when it has moved on, so a reset
+# clears running workers too instead of being undone by their next flush.
+
+import os
+import re
+import json
+import time
+import atexit
+import threading
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event
+
+from . import db
+
+# --- Fingerprint Normalization ---
+# Literals and bound values are replaced by '?' so that every execution of the
+# same query shape lands in the same bucket, whatever the batch code or id.
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_NAMED_PARAM_RE = re.compile(r"[:%]\(?\w+\)?s?")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+OVERFLOW_FINGERPRINT = '<other fingerprints>'
+GENERATION_FILE = 'GENERATION'
+
+_lock = threading.Lock()
+_stats = {}
+_state = {
+    'logger': None,
+    'threshold_ms': None,
+    'max_fingerprints': 500,
+    'flush_seconds': 60,
+    'snapshot_dir': None,
+    'snapshot_path': None,
+    'retention_hours': 24,
+    'generation': 0,
+    'last_flush': time.monotonic(),
+}
+
+
+def fingerprint(statement):
+    """Normalizes a SQL statement into a literal-free fingerprint."""
+    sql = _STRING_RE.sub('?', statement)
+    sql = _NAMED_PARAM_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(?+)', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+def record(statement, elapsed_ms):
+    """Adds one execution of `statement` to the per-fingerprint aggregates."""
+    key = fingerprint(statement)
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            if len(_stats) >= _state['max_fingerprints']:
+                key = OVERFLOW_FINGERPRINT
+                entry = _stats.get(key)
+            if entry is None:
+                entry = _stats[key] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+        if elapsed_ms > entry['max_ms']:
+            entry['max_ms'] = elapsed_ms
+
+
+def snapshot():
+    """Returns a copy of this process's aggregates."""
+    with _lock:
+        return {key: dict(entry) for key, entry in _stats.items()}
+
+
+def reset():
+    """Clears this process's aggregates."""
+    with _lock:
+        _stats.clear()
+
+
+def top_fingerprints(limit=20, include_saved=True):
+    """
+    Returns the top fingerprints by total time as a list of dicts.
+    When `include_saved` is set, snapshots flushed by other worker
+    processes are merged in so the view covers the whole server.
+    """
+    merged = {}
+    _check_generation()
+    sources = [snapshot()]
+    if include_saved:
+        sources.extend(_load_saved_snapshots(exclude=_state['snapshot_path']))
+
+    for stats in sources:
+        for key, entry in stats.items():
+            target = merged.setdefault(key, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            target['count'] += entry['count']
+            target['total_ms'] += entry['total_ms']
+            target['max_ms'] = max(target['max_ms'], entry['max_ms'])
+
+    rows = []
+    for key, entry in merged.items():
+        rows.append({
+            'fingerprint': key,
+            'count': entry['count'],
+            'total_ms': round(entry['total_ms'], 3),
+            'avg_ms': round(entry['total_ms'] / entry['count'], 3) if entry['count'] else 0.0,
+            'max_ms': round(entry['max_ms'], 3),
+        })
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return rows[:limit]
+
+
+# --- Snapshot Files ---
+def _read_generation():
+    directory = _state['snapshot_dir']
+    if not directory:
+        return 0
+    try:
+        with open(os.path.join(directory, GENERATION_FILE), encoding='utf-8') as fh:
+            return int(fh.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _check_generation():
+    """Drops this process's aggregates if a reset happened since they were started."""
+    generation = _read_generation()
+    if generation != _state['generation']:
+        reset()
+        _state['generation'] = generation
+
+
+def flush():
+    """Writes this process's aggregates to its snapshot file."""
+    path = _state['snapshot_path']
+    _state['last_flush'] = time.monotonic()
+    if not path:
+        return
+    _check_generation()
+    stats = snapshot()
+    if not stats:
+        return
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(stats, fh)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        if _state['logger']:
+            _state['logger'].error(f"Query stats flush failed: {e}")
+
+
+def _load_saved_snapshots(exclude=None):
+    directory = _state['snapshot_dir']
+    if not directory or not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith('.json') or path == exclude:
+            continue
+        try:
+            with open(path, encoding='utf-8') as fh:
+                snapshots.append(json.load(fh))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _clear_saved_snapshots():
+    directory = _state['snapshot_dir']
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def prune_snapshots():
+    """Deletes snapshots not rewritten within the retention period."""
+    directory = _state['snapshot_dir']
+    if not directory or not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - _state['retention_hours'] * 3600
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith('.json') or path == _state['snapshot_path']:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+# --- Engine Hooks ---
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    elapsed_ms = (time.perf_counter() - start_times.pop()) * 1000
+    record(statement, elapsed_ms)
+
+    threshold = _state['threshold_ms']
+    if threshold is not None and elapsed_ms >= threshold:
+        _log_slow_query(conn, statement, parameters, elapsed_ms, executemany)
+
+    if time.monotonic() - _state['last_flush'] >= _state['flush_seconds']:
+        flush()
+
+
+def explain_query_plan(conn, statement, parameters):
+    """
+    Returns SQLite's `EXPLAIN QUERY PLAN` rows for a statement, or None
+    on other backends. Uses a raw DBAPI cursor so the hooks don't re-fire.
+    """
+    if conn.dialect.name != 'sqlite':
+        return None
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _log_slow_query(conn, statement, parameters, elapsed_ms, executemany):
+    logger = _state['logger']
+    if logger is None:
+        return
+    plan = None
+    if not executemany and statement.lstrip().upper().startswith(_EXPLAINABLE):
+        try:
+            plan = explain_query_plan(conn, statement, parameters)
+        except Exception as e:
+            plan = [f"(EXPLAIN failed: {e})"]
+    message = f"Slow query ({elapsed_ms:.1f} ms): {statement} | params={parameters!r}"
+    if plan:
+        message += "\n  QUERY PLAN: " + "\n  QUERY PLAN: ".join(plan)
+    logger.warning(message)
+
+
+# --- CLI ---
+@click.command('query-stats')
+@with_appcontext
+@click.option('--limit', default=20, show_default=True, help='Number of fingerprints to show.')
+@click.option('--reset', is_flag=True, default=False, help='Delete all saved query snapshots.')
+def query_stats_command(limit, reset):
+    """Lists the top SQL fingerprints by total execution time."""
+    if reset:
+        reset_all()
+        click.echo('Query statistics cleared.')
+        return
+
+    rows = top_fingerprints(limit=limit)
+    if not rows:
+        click.echo('No query statistics recorded yet.')
+        return
+
+    click.echo(f"{'TOTAL ms':>12} {'COUNT':>8} {'AVG ms':>10} {'MAX ms':>10}  FINGERPRINT")
+    for row in rows:
+        click.echo(f"{row['total_ms']:>12.1f} {row['count']:>8} {row['avg_ms']:>10.2f} "
+                   f"{row['max_ms']:>10.2f}  {row['fingerprint']}")
+
+
+def reset_all():
+    """Clears this process's aggregates and every saved snapshot, and tells running workers to clear theirs."""
+    directory = _state['snapshot_dir']
+    if directory:
+        generation = _read_generation() + 1
+        tmp_path = os.path.join(directory, f"{GENERATION_FILE}.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                fh.write(str(generation))
+            os.replace(tmp_path, os.path.join(directory, GENERATION_FILE))
+            _state['generation'] = generation
+        except OSError as e:
+            if _state['logger']:
+                _state['logger'].error(f"Query stats reset could not be signalled to workers: {e}")
+    reset()
+    _clear_saved_snapshots()
+
+
+def init_app(app):
+    """Attaches the query hooks to the app's engine and registers the CLI."""
+    app.cli.add_command(query_stats_command)
+    if not app.config.get('QUERY_STATS_ENABLED', True):
+        return
+
+    _state['logger'] = app.logger
+    _state['threshold_ms'] = app.config.get('SLOW_QUERY_THRESHOLD_MS')
+    _state['max_fingerprints'] = app.config.get('QUERY_STATS_MAX_FINGERPRINTS', 500)
+    _state['flush_seconds'] = app.config.get('QUERY_STATS_FLUSH_SECONDS', 60)
+    _state['retention_hours'] = app.config.get('QUERY_STATS_RETENTION_HOURS', 24)
+
+    snapshot_dir = os.path.join(app.instance_path, 'querystats')
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        _state['snapshot_dir'] = snapshot_dir
+        _state['snapshot_path'] = os.path.join(
+            snapshot_dir, f"{os.getpid()}-{int(time.time())}.json")
+        _state['generation'] = _read_generation()
+        prune_snapshots()
+    except OSError:
+        pass
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        atexit.register(flush)
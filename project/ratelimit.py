@@ -0,0 +1,160 @@
+# project/ratelimit.py
+# Token-bucket rate limiting for the unauthenticated endpoints.
+#
+# Each client IP gets one bucket per limit name ('lookup', 'pdf'). A bucket
+# holds up to `burst` tokens and refills at `per_minute` tokens a minute;
+# every request spends one token, and an empty bucket means 429.
+#
+# The default store is per process. With RATE_LIMIT_STORE=sqlite the
+# buckets live in a small SQLite file in the instance folder, so every
+# worker behind the server shares one budget per client.
+
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from . import analytics
+
+
+class MemoryStore:
+    """Buckets in a dict; each worker process limits independently."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, burst, rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return retry_after
+
+    def _prune(self, now):
+        # A bucket idle for an hour has refilled completely, so forgetting it is lossless
+        stale = [key for key, (_, updated) in self._buckets.items() if now - updated > 3600]
+        for key in stale:
+            del self._buckets[key]
+
+
+class SQLiteStore:
+    """Buckets in a shared SQLite file so all workers draw on the same tokens."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key, burst, rate, now):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / rate
+            conn.execute('INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                conn.execute('DELETE FROM bucket WHERE updated < ?', (now - 3600,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return retry_after
+
+
+class RateLimiter:
+    def __init__(self, store, limits, exempt=()):
+        self.store = store
+        self.limits = limits
+        self.exempt = set(exempt)
+
+    def hit(self, name, client):
+        """Spends one token from `client`'s `name` bucket. Returns seconds to wait, or 0."""
+        if client in self.exempt:
+            return 0.0
+        burst, per_minute = self.limits[name]
+        # Wall-clock time, not monotonic: the SQLite store compares it across processes
+        return self.store.consume(f"{name}:{client}", burst, per_minute / 60.0, time.time())
+
+
+def _too_many_requests(name, retry_after):
+    """A plain-text 429: no template render, session or database access."""
+    response = make_response('Too many requests. Please try again shortly.\n', 429)
+    response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    writer = current_app.extensions.get('analytics_writer')
+    if writer is not None:
+        writer.submit(analytics.event_row(f"RATE_LIMITED_{name.upper()}"))
+    return response
+
+
+def limit(name, methods=None):
+    """
+    Route decorator that applies the `name` bucket to the client IP.
+    With `methods`, only those HTTP methods are limited (e.g. POST on index()).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limiter = current_app.extensions.get('rate_limiter')
+            if limiter is not None and (methods is None or request.method in methods):
+                try:
+                    retry_after = limiter.hit(name, request.remote_addr)
+                except Exception as e:
+                    # Fail open: a broken limiter store must not take the site down
+                    current_app.logger.error(f"Rate limiter failed: {e}")
+                    retry_after = 0.0
+                if retry_after:
+                    return _too_many_requests(name, retry_after)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def init_app(app):
+    """Attaches a RateLimiter as app.extensions['rate_limiter'] when enabled."""
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return None
+    if app.config.get('RATE_LIMIT_STORE', 'memory') == 'sqlite':
+        os.makedirs(app.instance_path, exist_ok=True)
+        store = SQLiteStore(os.path.join(app.instance_path, 'ratelimit.sqlite'))
+    else:
+        store = MemoryStore()
+    limits = {
+        'lookup': (app.config['RATE_LIMIT_LOOKUP_BURST'], app.config['RATE_LIMIT_LOOKUP_PER_MINUTE']),
+        'pdf': (app.config['RATE_LIMIT_PDF_BURST'], app.config['RATE_LIMIT_PDF_PER_MINUTE']),
+    }
+    exempt = [ip.strip() for ip in app.config.get('RATE_LIMIT_EXEMPT_IPS', '').split(',') if ip.strip()]
+    limiter = RateLimiter(store, limits, exempt)
+    app.extensions['rate_limiter'] = limiter
+    return limiter
@@ -0,0 +1,349 @@
+# project/rollups.py
+# Analytics rollups, the raw-event retention policy and the series queries.
+#
+# Complete hours are counted into `analytics_hourly`, and complete days
+# (summed from the hourly rows) into `analytics_daily`, per event type,
+# plant and product (0 when an event has none). The last bucket in each
+# table is its watermark. A query reads the daily rows up to the daily
+# watermark, hourly rows after it, and raw events only after the hourly
+# watermark: normally just the current, still open hour. So a year of
+# monthly buckets reads a few thousand rollup rows, not a year of events.
+#
+# The analytics writer inserts events some time after their timestamp, so
+# an event can land in an hour that is already rolled up. Each hourly
+# rollup therefore recounts the last `lag_hours` before the watermark from
+# the raw events, and a day is summed only once all of its hours are older
+# than that window.
+#
+# Raw events older than ANALYTICS_RETENTION_DAYS and hourly rows older
+# than ANALYTICS_HOURLY_RETENTION_DAYS are deleted once rolled up.
+
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, literal, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db, jobs
+from .models import AnalyticsDaily, AnalyticsEvent, AnalyticsHourly, Plant, Product, QualityReport
+
+# Plant/product key for events that have none (page views, lookups)
+NONE = 0
+NONE_LABEL = 'Unknown'
+
+# Rolled-up hours recounted on each run, for events written late
+DEFAULT_LAG_HOURS = 2
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+BREAKDOWNS = ('type', 'plant', 'product')
+
+
+def watermarks():
+    """
+    (daily_end, hourly_end): the end of the data in each rollup table, so
+    daily rows cover [.., daily_end) and hourly rows [.., hourly_end).
+    None before the first rollup. One query.
+    """
+    last_day, last_hour = db.session.query(
+        select(func.max(AnalyticsDaily.day)).scalar_subquery(),
+        select(func.max(AnalyticsHourly.hour)).scalar_subquery(),
+    ).one()
+    if isinstance(last_day, str):  # Scalar subqueries can lose the column type
+        last_day = date.fromisoformat(last_day)
+    if isinstance(last_hour, str):
+        last_hour = datetime.fromisoformat(last_hour)
+    daily_end = datetime.combine(last_day + timedelta(days=1), datetime.min.time()) if last_day else None
+    hourly_end = last_hour + timedelta(hours=1) if last_hour else None
+    return daily_end, hourly_end
+
+
+def _add_counts(model, rows):
+    if rows:
+        statement = sqlite_insert(model.__table__)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[column.name for column in model.__table__.primary_key],
+            set_={'count': model.__table__.c.count + statement.excluded.count}), rows)
+
+
+def rollup_complete_hours(lag_hours=DEFAULT_LAG_HOURS):
+    """
+    Counts every complete hour after the hourly watermark and recounts the
+    `lag_hours` before it. Returns hours added.
+    """
+    _, hourly_end = watermarks()
+    current_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    recount_from = hourly_end - timedelta(hours=lag_hours) if hourly_end else None
+    hour = func.strftime('%Y-%m-%d %H:00:00', AnalyticsEvent.timestamp)
+    plant = func.coalesce(AnalyticsEvent.plant_id, NONE)
+    product = func.coalesce(QualityReport.product_id, NONE)
+    query = db.session.query(
+        hour, AnalyticsEvent.event_type, plant, product, func.count(AnalyticsEvent.id)
+    ).outerjoin(QualityReport, QualityReport.id == AnalyticsEvent.report_id
+    ).filter(AnalyticsEvent.timestamp < current_hour)
+    if recount_from:
+        query = query.filter(AnalyticsEvent.timestamp >= recount_from)
+    rows = [
+        {'hour': datetime.fromisoformat(bucket), 'event_type': event_type,
+         'plant_id': plant_id, 'product_id': product_id, 'count': count}
+        for bucket, event_type, plant_id, product_id, count
+        in query.group_by(hour, AnalyticsEvent.event_type, plant, product)
+    ]
+    if recount_from:
+        # The recount replaces these hours, late events included
+        AnalyticsHourly.query.filter(AnalyticsHourly.hour >= recount_from).delete(synchronize_session=False)
+    _add_counts(AnalyticsHourly, rows)
+    db.session.commit()
+    return len({row['hour'] for row in rows if not hourly_end or row['hour'] >= hourly_end})
+
+
+def rollup_complete_days(lag_hours=DEFAULT_LAG_HOURS):
+    """
+    Sums the hourly rows of every day after the daily watermark whose hours
+    are all rolled up and past the recount window.
+    """
+    daily_end, hourly_end = watermarks()
+    if hourly_end is None:
+        return 0
+    settled_end = hourly_end - timedelta(hours=lag_hours)
+    day = func.date(AnalyticsHourly.hour)
+    query = db.session.query(
+        day, AnalyticsHourly.event_type, AnalyticsHourly.plant_id, AnalyticsHourly.product_id,
+        func.sum(AnalyticsHourly.count)
+    ).filter(AnalyticsHourly.hour < datetime.combine(settled_end.date(), datetime.min.time()))
+    if daily_end:
+        query = query.filter(AnalyticsHourly.hour >= daily_end)
+    rows = [
+        {'day': date.fromisoformat(bucket), 'event_type': event_type,
+         'plant_id': plant_id, 'product_id': product_id, 'count': count}
+        for bucket, event_type, plant_id, product_id, count in query.group_by(
+            day, AnalyticsHourly.event_type, AnalyticsHourly.plant_id, AnalyticsHourly.product_id)
+    ]
+    _add_counts(AnalyticsDaily, rows)
+    db.session.commit()
+    return len({row['day'] for row in rows})
+
+
+def rollup(lag_hours=DEFAULT_LAG_HOURS):
+    """Rolls up complete hours, then complete days. Returns (hours, days) added."""
+    return rollup_complete_hours(lag_hours), rollup_complete_days(lag_hours)
+
+
+def delete_expired(retention_days, hourly_retention_days, chunk_size=50000, lag_hours=DEFAULT_LAG_HOURS):
+    """
+    Deletes raw events and hourly rows past their retention that are already
+    rolled up, raw events in short chunked transactions. Raw events the next
+    recount needs are kept. Returns raw events deleted.
+    """
+    daily_end, hourly_end = watermarks()
+    now = datetime.utcnow()
+    if daily_end:
+        AnalyticsHourly.query.filter(
+            AnalyticsHourly.hour < min(now - timedelta(days=hourly_retention_days), daily_end)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    if hourly_end is None:
+        return 0
+    cutoff = min(now - timedelta(days=retention_days), hourly_end - timedelta(hours=lag_hours))
+    deleted = 0
+    while True:
+        ids = db.session.query(AnalyticsEvent.id).filter(AnalyticsEvent.timestamp < cutoff).limit(chunk_size).subquery()
+        count = AnalyticsEvent.query.filter(AnalyticsEvent.id.in_(db.session.query(ids.c.id))).delete(
+            synchronize_session=False)
+        db.session.commit()
+        deleted += count
+        if count < chunk_size:
+            return deleted
+
+
+def compact(retention_days, hourly_retention_days=90, lag_hours=DEFAULT_LAG_HOURS):
+    """Rolls up, then applies the retention policy. Returns (hours, days, raw events deleted)."""
+    hours, days = rollup(lag_hours)
+    return hours, days, delete_expired(retention_days, hourly_retention_days, lag_hours=lag_hours)
+
+
+# --- Queries ---
+def _bucket(column, granularity):
+    """SQL expression for the bucket label of `column` (see bucket_labels())."""
+    if granularity == 'hour':
+        return func.strftime('%Y-%m-%d %H:00', column)
+    if granularity == 'day':
+        return func.date(column)
+    if granularity == 'week':
+        return func.date(column, '-6 days', 'weekday 1')  # The Monday starting the week
+    if granularity == 'month':
+        return func.strftime('%Y-%m', column)
+    return literal('all')
+
+
+def counts(start=None, end=None, granularity=None, breakdown='type', event_types=None):
+    """
+    Event counts in [start, end) (datetimes; None is unbounded) as
+    ({(bucket, key): count}, raw_from). Buckets follow `granularity`, or are
+    'all' without one; keys are the event type, plant id or product id.
+    raw_from is where raw-event fill-in starts, or None if it is not needed.
+    """
+    daily_end, hourly_end = watermarks()
+    raw_from = hourly_end or daily_end
+    # Hour buckets cannot come from daily rows
+    hourly_from = None if granularity == 'hour' else daily_end
+
+    sources = []
+    if granularity != 'hour' and daily_end:
+        sources.append((AnalyticsDaily, AnalyticsDaily.day, None, daily_end))
+    if hourly_end:
+        sources.append((AnalyticsHourly, AnalyticsHourly.hour, hourly_from, hourly_end))
+    sources.append((AnalyticsEvent, AnalyticsEvent.timestamp, raw_from, None))
+
+    results = {}
+    for model, column, source_start, source_end in sources:
+        lower = max(filter(None, (start, source_start)), default=None)
+        upper = min(filter(None, (end, source_end)), default=None)
+        if lower and upper and lower >= upper:
+            continue
+        if model is AnalyticsEvent:
+            plant = func.coalesce(AnalyticsEvent.plant_id, NONE)
+            product = func.coalesce(QualityReport.product_id, NONE)
+            total = func.count(AnalyticsEvent.id)
+        else:
+            plant, product, total = model.plant_id, model.product_id, func.sum(model.count)
+        key = {'type': model.event_type, 'plant': plant, 'product': product}[breakdown]
+        bucket = _bucket(column, granularity)
+        query = db.session.query(bucket, key, total)
+        if model is AnalyticsEvent and breakdown == 'product':
+            query = query.outerjoin(QualityReport, QualityReport.id == AnalyticsEvent.report_id)
+        if model is AnalyticsDaily:
+            lower, upper = lower and lower.date(), upper and upper.date()
+        if lower:
+            query = query.filter(column >= lower)
+        if upper:
+            query = query.filter(column < upper)
+        if event_types:
+            query = query.filter(model.event_type.in_(event_types))
+        for bucket_label, key_value, count in query.group_by(bucket, key):
+            results[(bucket_label, key_value)] = results.get((bucket_label, key_value), 0) + count
+    if end is not None and raw_from is not None and raw_from >= end:
+        raw_from = None
+    return results, raw_from
+
+
+def event_totals():
+    """All-time event counts per event type."""
+    totals, _ = counts()
+    return {event_type: count for (_, event_type), count in totals.items()}
+
+
+def bucket_labels(start_date, end_date, granularity):
+    """Labels of every bucket touching [start_date, end_date], matching _bucket()."""
+    labels = []
+    if granularity == 'hour':
+        day = start_date
+        while day <= end_date:
+            labels.extend(f"{day.isoformat()} {hour:02d}:00" for hour in range(24))
+            day += timedelta(days=1)
+    elif granularity == 'day':
+        labels = [(start_date + timedelta(days=i)).isoformat() for i in range((end_date - start_date).days + 1)]
+    elif granularity == 'week':
+        monday = start_date - timedelta(days=start_date.weekday())
+        while monday <= end_date:
+            labels.append(monday.isoformat())
+            monday += timedelta(days=7)
+    elif granularity == 'month':
+        year, month = start_date.year, start_date.month
+        while (year, month) <= (end_date.year, end_date.month):
+            labels.append(f"{year:04d}-{month:02d}")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return labels
+
+
+def series(start_date, end_date, granularity='day', breakdown='type', event_types=None, max_buckets=2000):
+    """
+    Chart-ready counts for the days start_date..end_date inclusive: one
+    series per breakdown key, each with a count for every bucket label.
+    Raises ValueError for arguments the API should reject.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}.")
+    if breakdown not in BREAKDOWNS:
+        raise ValueError(f"breakdown must be one of: {', '.join(BREAKDOWNS)}.")
+    if start_date > end_date:
+        raise ValueError('start must not be after end.')
+    bucket_count = (end_date - start_date).days + 1
+    if granularity == 'hour':
+        bucket_count *= 24
+    if bucket_count > max_buckets:
+        raise ValueError(f"The range has {bucket_count} {granularity} buckets; the limit is {max_buckets}.")
+
+    labels = bucket_labels(start_date, end_date, granularity)
+    start = datetime.combine(start_date, datetime.min.time())
+    end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    results, raw_from = counts(start, end, granularity, breakdown, event_types)
+
+    keys = {key for _, key in results}
+    names = {}
+    if breakdown == 'plant' and keys:
+        names = dict(db.session.query(Plant.id, Plant.name).filter(Plant.id.in_(keys)))
+    elif breakdown == 'product' and keys:
+        names = dict(db.session.query(Product.id, Product.name).filter(Product.id.in_(keys)))
+
+    position = {label: index for index, label in enumerate(labels)}
+    by_key = {}
+    for (bucket, key), count in results.items():
+        if bucket in position:
+            by_key.setdefault(key, [0] * len(labels))[position[bucket]] += count
+    entries = [{
+        'key': key,
+        'label': key if breakdown == 'type' else (names.get(key) or (NONE_LABEL if key == NONE else f"#{key}")),
+        'counts': values,
+        'total': sum(values),
+    } for key, values in by_key.items()]
+    entries.sort(key=lambda entry: entry['total'], reverse=True)
+    return {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'granularity': granularity,
+        'breakdown': breakdown,
+        'labels': labels,
+        'series': entries,
+        'raw_from': raw_from.isoformat() if raw_from else None,
+    }
+
+
+# --- Jobs and CLI ---
+@jobs.task('analytics_compact', queue='maintenance')
+def analytics_compact_job():
+    config = current_app.config
+    hours, days, deleted = compact(config['ANALYTICS_RETENTION_DAYS'], config['ANALYTICS_HOURLY_RETENTION_DAYS'],
+                                   config['ANALYTICS_ROLLUP_LAG_HOURS'])
+    if hours or days or deleted:
+        current_app.logger.info(f"Analytics: rolled up {hours} hours and {days} days, deleted {deleted} raw events.")
+
+
+@click.command('analytics-compact')
+@with_appcontext
+@click.option('--older-than', 'older_than', type=int, default=None,
+              help='Retention in days for raw events. Defaults to ANALYTICS_RETENTION_DAYS.')
+@click.option('--vacuum', is_flag=True, default=False, help='VACUUM the database afterwards to shrink the file.')
+def analytics_compact_command(older_than, vacuum):
+    """Rolls raw analytics events up into hourly and daily counts and deletes expired ones."""
+    config = current_app.config
+    retention = config['ANALYTICS_RETENTION_DAYS'] if older_than is None else older_than
+    started = time.perf_counter()
+    hours, days, deleted = compact(retention, config['ANALYTICS_HOURLY_RETENTION_DAYS'],
+                                   config['ANALYTICS_ROLLUP_LAG_HOURS'])
+    click.echo(f"Rolled up {hours} hours and {days} days and deleted {deleted} raw events older than "
+               f"{retention} days in {time.perf_counter() - started:.1f} s.")
+    if vacuum and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('VACUUM'))
+        click.echo('Database vacuumed.')
+
+
+def init_app(app):
+    """Registers the compaction command and its periodic job."""
+    app.cli.add_command(analytics_compact_command)
+    hours = app.config.get('ANALYTICS_COMPACT_HOURS', 1)
+    if hours:
+        jobs.periodic('analytics_compact', hours * 3600)
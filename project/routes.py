@@ -2,11 +2,13 @@
 # Contains all application routes, organized by blueprints.
 
 import os
+import hashlib
 from flask import (Blueprint, render_template, request, redirect, url_for, 
-                   flash, current_app, make_response, send_from_directory, jsonify)
+                   flash, current_app, make_response, send_from_directory, jsonify,
+                   Response, stream_with_context)
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
 from functools import wraps
 
 from . import db
@@ -15,38 +17,41 @@ from .models import (Product, QualityReport, ReportTemplate, User, Plant,
                      ReportResult, ParameterMaster, AnalyticsEvent)
 from sqlalchemy import func
 from .data import AWARENESS_DATA
-from .utils import generate_report_pdf
+from . import querystats, pdf_engines, analytics, pagecache, batchfilter, ratelimit, sharedcache, jobs, archive, rollups, sketches, hotbatches, exports, compliance, stats, search, batchindex, machinecodes, templateops
 
-from xhtml2pdf import pisa
-from io import BytesIO
 from urllib.parse import urlparse
 
 bp = Blueprint('main', __name__)
 
 
 # --- Analytics Helper ---
-def log_event(event_type):
+def log_event(event_type, report=None):
     """
     Logs an analytics event to the database.
     This is wrapped in a try/except to ensure that analytics
     failures never crash a user-facing request.
     """
     try:
-        ip = request.remote_addr
-        user_agent = request.user_agent.string
-        
-        event = AnalyticsEvent(
-            event_type=event_type,
-            ip_address=ip,
-            user_agent=user_agent
-        )
-        
-        db.session.add(event)
+        visits = analytics.insert_events([analytics.event_row(event_type, report)])
         db.session.commit()
+        # Sketch updates are left to the background writer
+        current_app.extensions['analytics_writer'].submit_visits(visits)
+        hotbatches.record(report)
     except Exception as e:
         db.session.rollback()
+        analytics.forget_dictionary_ids(current_app._get_current_object())
         # Log this error to your console/server logs, but don't stop the request
         current_app.logger.error(f"Analytics logging failed: {e}")
+
+def log_event_async(event_type):
+    """
+    Queues an analytics event for the background writer.
+    Unlike log_event(), this never touches the database on the request thread.
+    """
+    try:
+        current_app.extensions['analytics_writer'].submit(analytics.event_row(event_type))
+    except Exception as e:
+        current_app.logger.error(f"Analytics logging failed: {e}")
 # --- End Analytics Helper ---
 
 
@@ -62,63 +67,276 @@ def superadmin_required(f):
 
 # --- Public Routes (Consumer Facing) ---
 
+# Templates whose source (together with AWARENESS_DATA) determines the cached landing page
+INDEX_TEMPLATES = ('public/index.html', 'base.html')
+
 @bp.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'GET':
-        log_event('PAGE_VIEW')
+        log_event_async('PAGE_VIEW')
+        if current_app.config['PAGE_CACHE_ENABLED'] and pagecache.is_cacheable():
+            key = pagecache.cache_key('index', INDEX_TEMPLATES, AWARENESS_DATA)
+            page = pagecache.get_page(
+                key, lambda: render_template('public/index.html', awareness_data=AWARENESS_DATA))
+            return pagecache.page_response(page, max_age=current_app.config['INDEX_PAGE_MAX_AGE'])
 
     if request.method == 'POST':
         full_batch_code = request.form.get('batch-code', '').strip().upper()
+        # Only codes that cannot be in a permalink are answered here; the
+        # rest are looked up (and rate-limited) once, by view_report()
+        if len(full_batch_code) < 5:
+            return render_template('public/index.html', awareness_data=AWARENESS_DATA, error=LOOKUP_ERRORS['invalid'])
+        if '/' in full_batch_code:
+            return render_template('public/index.html', awareness_data=AWARENESS_DATA, error=LOOKUP_ERRORS['not_found'])
+        # Redirect to the GET permalink so repeat views can be answered with 304
+        return redirect(url_for('main.view_report', batch_code=full_batch_code), code=303)
 
-        if not full_batch_code or len(full_batch_code) < 5:
-            error = "Please enter a valid Batch Code (at least 5 characters)."
-            return render_template('public/index.html', awareness_data=AWARENESS_DATA, error=error)
+    return render_template('public/index.html', awareness_data=AWARENESS_DATA)
 
-        base_code = full_batch_code[:5]
-        machine_code = full_batch_code[5:]
 
-        report = QualityReport.query.filter_by(
-            batch_code=base_code
-        ).order_by(QualityReport.created_at.desc()).first()
-        
-        if report:
-            if report.machine_codes:
-                if not machine_code:
-                    error = f"This product requires a full batch code (e.g., {base_code}A1). Please enter the complete code."
-                    return render_template('public/index.html', awareness_data=AWARENESS_DATA, error=error)
-
-                allowed_codes = {code.strip() for code in report.machine_codes.split(',') if code.strip()}
-                if machine_code in allowed_codes:
-                    log_event('REPORT_VIEW')
-                    ordered_results = report.results.join(ReportTemplate).order_by(ReportTemplate.order).all()
-                    return render_template('public/report.html', report=report, results=ordered_results, machine_code=machine_code)
-            
-            else:
-                if machine_code:
-                    error = "This batch code does not have a machine-specific ID. Please enter only the 5-digit batch code."
-                    return render_template('public/index.html', awareness_data=AWARENESS_DATA, error=error)
+# Messages shown on the landing page for each lookup status
+LOOKUP_ERRORS = {
+    'invalid': "Please enter a valid Batch Code (at least 5 characters).",
+    'not_found': "No report found. Please check the batch code and try again.",
+    'unknown_machine_code': "No report found. Please check the batch code and try again.",
+    'machine_code_required': "This product requires a full batch code (e.g., {base_code}A1). Please enter the complete code.",
+    'unexpected_machine_code': "This batch code does not have a machine-specific ID. Please enter only the 5-digit batch code.",
+}
+
 
-                log_event('REPORT_VIEW')
-                ordered_results = report.results.join(ReportTemplate).order_by(ReportTemplate.order).all()
-                return render_template('public/report.html', report=report, results=ordered_results, machine_code=machine_code)
+def split_batch_code(full_batch_code):
+    """Splits a full batch code into (5-character base code, machine code)."""
+    return full_batch_code[:5], full_batch_code[5:]
 
-        error = "No report found. Please check the batch code and try again."
+
+def match_machine_code(report, machine_code):
+    """Applies the machine-code rules to a found report. Returns a lookup status."""
+    matcher = machinecodes.matcher_for(report)
+    if matcher is not None:
+        if not machine_code:
+            return 'machine_code_required'
+        return 'valid' if matcher.matches(machine_code) else 'unknown_machine_code'
+    return 'unexpected_machine_code' if machine_code else 'valid'
+
+
+def resolve_batch_code(full_batch_code):
+    """
+    Looks up the report for a full batch code (5-character base code plus an
+    optional machine code). Returns (report, machine_code, error message).
+    """
+    if not full_batch_code or len(full_batch_code) < 5:
+        return None, None, LOOKUP_ERRORS['invalid']
+
+    base_code, machine_code = split_batch_code(full_batch_code)
+
+    # Definite misses (typos, guessed codes) are answered without a query
+    batch_filter = batchfilter.get_filter()
+    if batch_filter is not None and not batch_filter.might_contain(base_code):
+        return None, None, LOOKUP_ERRORS['not_found']
+
+    report = QualityReport.query.filter_by(
+        batch_code=base_code
+    ).order_by(QualityReport.created_at.desc()).first()
+
+    if not report:
+        return None, None, LOOKUP_ERRORS['not_found']
+
+    status = match_machine_code(report, machine_code)
+    if status != 'valid':
+        return None, None, LOOKUP_ERRORS[status].format(base_code=base_code)
+    return report, machine_code, None
+
+
+def resolve_batch_codes(full_batch_codes):
+    """
+    Set-based version of resolve_batch_code() for many codes at once: one
+    IN query over the distinct base codes. Returns {full code: (status, report or None)}.
+    """
+    base_codes = {split_batch_code(code)[0] for code in full_batch_codes if len(code) >= 5}
+    batch_filter = batchfilter.get_filter()
+    if batch_filter is not None:
+        base_codes = {code for code in base_codes if batch_filter.might_contain(code)}
+
+    # Newest report per base code, as in the single lookup
+    latest = {}
+    if base_codes:
+        rows = QualityReport.query.with_entities(
+            QualityReport.id, QualityReport.batch_code, QualityReport.machine_codes, QualityReport.machine_matcher
+        ).filter(QualityReport.batch_code.in_(base_codes)).order_by(QualityReport.created_at.desc()).all()
+        for row in rows:
+            latest.setdefault(row.batch_code, row)
+
+    resolved = {}
+    for full_code in full_batch_codes:
+        if len(full_code) < 5:
+            resolved[full_code] = ('invalid', None)
+            continue
+        base_code, machine_code = split_batch_code(full_code)
+        report = latest.get(base_code)
+        if report is None:
+            resolved[full_code] = ('not_found', None)
+        else:
+            status = match_machine_code(report, machine_code)
+            resolved[full_code] = (status, report if status == 'valid' else None)
+    return resolved
+
+
+@bp.route('/api/verify', methods=['POST'])
+@ratelimit.limit('lookup')
+def verify_batch_codes():
+    """
+    Bulk verification for distributors and retailers.
+    Body: {"batch_codes": ["AB123A1", ...]}. Returns one compact entry per
+    distinct code, in request order, plus a count per status.
+    """
+    max_bytes = current_app.config['BULK_VERIFY_MAX_BYTES']
+    if request.content_length and request.content_length > max_bytes:
+        return jsonify({'error': 'Request body too large.'}), 413
+
+    # Chunked bodies carry no Content-Length; read at most one byte past the cap
+    request.max_content_length = max_bytes + 1
+    if len(request.get_data()) > max_bytes:
+        return jsonify({'error': 'Request body too large.'}), 413
+    payload = request.get_json(silent=True)
+    codes = payload.get('batch_codes') if isinstance(payload, dict) else None
+    if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+        return jsonify({'error': 'Expected a JSON body like {"batch_codes": ["AB123A1", ...]}.'}), 400
+
+    max_codes = current_app.config['BULK_VERIFY_MAX_CODES']
+    if len(codes) > max_codes:
+        return jsonify({'error': f'At most {max_codes} batch codes per request.'}), 413
+
+    # Normalise like the lookup form, dropping duplicates but keeping order
+    codes = list(dict.fromkeys(code.strip().upper() for code in codes))
+    resolved = resolve_batch_codes(codes)
+
+    results, summary = [], {}
+    for code in codes:
+        status, report = resolved[code]
+        entry = {'code': code, 'status': status}
+        if report is not None:
+            entry['report_id'] = report.id
+            entry['url'] = url_for('main.view_report', batch_code=code, _external=True)
+        results.append(entry)
+        summary[status] = summary.get(status, 0) + 1
+
+    # One analytics event per request, not one REPORT_VIEW per code
+    log_event_async('BULK_VERIFY')
+    return jsonify({'results': results, 'summary': summary})
+
+
+# --- HTTP Validators for Published Reports ---
+REPORT_TEMPLATES = ('public/report.html', 'base.html')
+PDF_TEMPLATES = ('reports/milk_report.html',)
+
+def report_validators(report, machine_code, templates):
+    """
+    Returns (strong ETag, Last-Modified) for a rendering of `report`: the
+    report's own version, the templates' source and the content generation
+    bumped by invalidate_rendered_reports() for admin edits that show on it.
+    """
+    report_modified = report.updated_at or report.created_at
+    generation, content_modified = pagecache.content_generation()
+    token = pagecache.deploy_token(templates)
+    etag = hashlib.sha1(
+        f"{report.id}:{report_modified.isoformat()}:{machine_code or ''}:{token}:{generation}".encode('utf-8')
+    ).hexdigest()[:32]
+    modified = max(report_modified, content_modified) if content_modified else report_modified
+    return etag, modified.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def is_not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return etag in request.if_none_match
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional_response(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = current_app.config['REPORT_CACHE_CONTROL']
+    return response
+
+
+@bp.route('/report/<batch_code>')
+@ratelimit.limit('lookup')
+def view_report(batch_code):
+    full_batch_code = batch_code.strip().upper()
+    report, machine_code, error = resolve_batch_code(full_batch_code)
+    if error:
         return render_template('public/index.html', awareness_data=AWARENESS_DATA, error=error)
 
-    return render_template('public/index.html', awareness_data=AWARENESS_DATA)
+    log_event('REPORT_VIEW', report)
+
+    etag, last_modified = report_validators(report, machine_code, REPORT_TEMPLATES)
+    if is_not_modified(etag, last_modified):
+        return conditional_response(make_response('', 304), etag, last_modified)
+
+    ordered_results = report.results.join(ReportTemplate).order_by(ReportTemplate.order).all()
+    response = make_response(render_template('public/report.html', report=report, results=ordered_results, machine_code=machine_code))
+    return conditional_response(response, etag, last_modified)
+
+
+# Shared-cache namespace for rendered PDFs
+PDF_CACHE_NAMESPACE = 'pdf'
+
+def invalidate_rendered_reports():
+    """
+    Changes the validators of every report rendering (templates, signatures
+    and product names are baked in) and drops cached PDFs in every worker.
+    """
+    pagecache.bump_content_generation()
+    sharedcache.invalidate(PDF_CACHE_NAMESPACE)
+
+
+def pdf_response(pdf_bytes, filename, etag, last_modified):
+    response = make_response(pdf_bytes)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'inline; filename="{filename}"'
+    return conditional_response(response, etag, last_modified)
 
 
 @bp.route('/download/report/<int:report_id>')
+@ratelimit.limit('pdf')
 def download_pdf_report(report_id):
     report = QualityReport.query.get_or_404(report_id)
     
-    log_event('REPORT_DOWNLOAD')
+    log_event('REPORT_DOWNLOAD', report)
     
     machine_code = request.args.get('machine_code', None)
+
+    # Repeat downloads of an unchanged report skip the render entirely
+    etag, last_modified = report_validators(report, machine_code, PDF_TEMPLATES)
+    if is_not_modified(etag, last_modified):
+        return conditional_response(make_response('', 304), etag, last_modified)
+
+    # Rendered PDFs are shared by every worker, keyed by the validator
+    filename = f"quality_report_{report.batch_code}{machine_code or ''}.pdf"
+    cache = sharedcache.get_cache()
+    pdf_bytes = cache.get(PDF_CACHE_NAMESPACE, etag) if cache is not None else None
+    if pdf_bytes is not None:
+        return pdf_response(pdf_bytes, filename, etag, last_modified)
+
+    pdf_bytes, pdf_err = render_report_pdf(report, machine_code)
+
+    if not pdf_err:
+        if cache is not None:
+            cache.set(PDF_CACHE_NAMESPACE, etag, pdf_bytes)
+        return pdf_response(pdf_bytes, filename, etag, last_modified)
+    
+    print(f"PDF Generation Error: {pdf_err} for report {report_id}")
+    flash('An error occurred while generating the PDF report.', 'danger')
+    return redirect(url_for('main.index'))
+
+
+def render_report_pdf(report, machine_code):
+    """Renders a report's PDF. Returns (pdf bytes, error); needs a request context for url_for."""
     results = report.results.join(ReportTemplate).order_by(ReportTemplate.order).all()
     
     html_out = render_template('reports/milk_report.html', report=report, results=results, machine_code=machine_code)
-    result = BytesIO()
     
     def link_callback(uri, rel):
         parsed_uri = urlparse(uri)
@@ -138,21 +356,35 @@ def download_pdf_report(report_id):
 
         return uri
 
-    pdf = pisa.CreatePDF(
-        BytesIO(html_out.encode('UTF-8')),
-        dest=result,
-        link_callback=link_callback
-    )
-
-    if not pdf.err:
-        response = make_response(result.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'inline; filename="quality_report_{report.batch_code}{machine_code or ''}.pdf"'
-        return response
-    
-    print(f"PDF Generation Error: {pdf.err} for report {report_id}")
-    flash('An error occurred while generating the PDF report.', 'danger')
-    return redirect(url_for('main.index'))
+    # The PDF stack is imported on first use, not at worker start-up
+    render_pdf = pdf_engines.get_engine('xhtml2pdf')
+    return render_pdf(html_out, link_callback=link_callback)
+
+
+@jobs.task('warm_report_pdf', queue='pdf')
+def warm_report_pdf(report_id):
+    """Background job: renders a new or edited report's PDFs into the shared cache."""
+    cache = sharedcache.get_cache()
+    report = db.session.get(QualityReport, report_id)
+    if cache is None or report is None:
+        return
+    # Ranges are warmed code by code; codes only a wildcard accepts render on demand
+    matcher = machinecodes.matcher_for(report)
+    machine_codes = matcher.expand(20)[0] if matcher is not None else [None]
+    with current_app.test_request_context():
+        for machine_code in machine_codes:
+            etag, _ = report_validators(report, machine_code, PDF_TEMPLATES)
+            if cache.get(PDF_CACHE_NAMESPACE, etag) is not None:
+                continue
+            pdf_bytes, pdf_err = render_report_pdf(report, machine_code)
+            if pdf_err:
+                raise RuntimeError(f"PDF generation failed for report {report_id}: {pdf_err}")
+            cache.set(PDF_CACHE_NAMESPACE, etag, pdf_bytes)
+
+
+def enqueue_pdf_warmup(report):
+    jobs.enqueue('warm_report_pdf', {'report_id': report.id},
+                 idempotency_key=f"warm-pdf:{report.id}:{report.updated_at.isoformat()}")
 
 
 @bp.route('/uploads/<path:filename>')
@@ -196,6 +428,12 @@ def qa_dashboard():
     # Define how many reports to show per page
     PER_PAGE = 20 
 
+    # A search (batch/machine code, product, plant or creator) replaces the date listing
+    query = request.args.get('q', '').strip()
+    if query:
+        pagination = search.search(query, plant_id=current_user.plant_id, page=page, per_page=PER_PAGE)
+        return render_template('qa/dashboard.html', pagination=pagination, query=query)
+
     # Change the query from .all() to .paginate()
     pagination = QualityReport.query.filter_by(
         plant_name=current_user.plant_name
@@ -210,6 +448,21 @@ def qa_dashboard():
     return render_template('qa/dashboard.html', pagination=pagination)
 
 
+def record_batch_code(batch_code):
+    """Adds a saved batch code to the lookup filter so it is found immediately."""
+    batch_filter = batchfilter.get_filter()
+    if batch_filter is not None:
+        batch_filter.add(batch_code)
+
+
+def flash_out_of_spec(failed):
+    """Warns about the results compliance.score_report() found out of specification."""
+    if failed:
+        details = '; '.join(f"{template.parameter}: {result.result_value} (spec: {template.specification})"
+                            for template, result in failed)
+        flash(f'Out of specification: {details}', 'warning')
+
+
 @bp.route('/qa/report/new', methods=['GET', 'POST'])
 @login_required
 def new_report():
@@ -217,12 +470,16 @@ def new_report():
         product_id = request.form.get('product_id')
         batch_code = request.form.get('batch_code', '')
         expiry_date_str = request.form.get('expiry_date')
-        machine_codes = request.form.get('machine_codes', '').strip()
-
         if not all([product_id, batch_code, expiry_date_str]):
             flash('All fields are required.', 'danger')
             return redirect(url_for('main.new_report'))
 
+        try:
+            machine_codes, machine_matcher = machinecodes.compile_for_storage(request.form.get('machine_codes'))
+        except ValueError as e:
+            flash(f'Invalid machine codes: {e}', 'danger')
+            return redirect(url_for('main.new_report'))
+
         expiry_date = datetime.strptime(expiry_date_str, '%Y-%m-%d').date()
         
         new_report_obj = QualityReport(
@@ -230,12 +487,14 @@ def new_report():
             user_id=current_user.id,
             batch_code=batch_code,
             machine_codes=machine_codes,
+            machine_matcher=machine_matcher,
             expiry_date=expiry_date,
             plant_name=current_user.plant_name,
             plant_id=current_user.plant_id # Make sure plant_id is set
         )
         db.session.add(new_report_obj)
         
+        results = []
         for key, value in request.form.items():
             if key.startswith('result-'):
                 template_id = key.split('-')[1]
@@ -245,9 +504,15 @@ def new_report():
                     result_value=value
                 )
                 db.session.add(result)
+                results.append(result)
         
+        failed = compliance.score_report(new_report_obj, results)
         db.session.commit()
+        record_batch_code(batch_code)
+        batchindex.record(new_report_obj.plant_id, added=batch_code)
+        enqueue_pdf_warmup(new_report_obj)
         flash('New quality report created successfully!', 'success')
+        flash_out_of_spec(failed)
         return redirect(url_for('main.qa_dashboard'))
 
     products = Product.query.join(Product.plants).filter(Plant.id == current_user.plant_id).order_by(Product.name).all()
@@ -260,6 +525,7 @@ def delete_report(report_id):
     report = QualityReport.query.filter_by(id=report_id, plant_id=current_user.plant_id).first_or_404()
     db.session.delete(report)
     db.session.commit()
+    batchindex.record(report.plant_id, removed=report.batch_code)
     flash('Report deleted successfully.', 'success')
     return redirect(url_for('main.qa_dashboard'))
 
@@ -270,10 +536,19 @@ def edit_report(report_id):
     report = QualityReport.query.filter_by(id=report_id, plant_id=current_user.plant_id).first_or_404()
     
     if request.method == 'POST':
+        try:
+            machine_codes, machine_matcher = machinecodes.compile_for_storage(request.form.get('machine_codes'), report)
+        except ValueError as e:
+            flash(f'Invalid machine codes: {e}', 'danger')
+            return redirect(url_for('main.edit_report', report_id=report.id))
+        old_batch_code = report.batch_code
         report.product_id = request.form.get('product_id')
         report.batch_code = request.form.get('batch_code', '')
         report.expiry_date = datetime.strptime(request.form.get('expiry_date'), '%Y-%m-%d').date()
-        report.machine_codes = request.form.get('machine_codes', '').strip() # Added machine_codes
+        report.machine_codes = machine_codes
+        report.machine_matcher = machine_matcher
+        # Always bump the version stamp: result-only edits don't touch report columns
+        report.updated_at = datetime.utcnow()
 
         for key, value in request.form.items():
             if key.startswith('result-'):
@@ -282,31 +557,133 @@ def edit_report(report_id):
                 if result and result.report_id == report.id: # Ensure the result belongs to the report
                     result.result_value = value
         
+        failed = compliance.score_report(report, report.results.all())
         db.session.commit()
+        record_batch_code(report.batch_code)
+        if report.batch_code != old_batch_code:
+            batchindex.record(report.plant_id, added=report.batch_code, removed=old_batch_code)
+        enqueue_pdf_warmup(report)
         flash('Quality report updated successfully!', 'success')
+        flash_out_of_spec(failed)
         return redirect(url_for('main.qa_dashboard'))
 
     # Ensure the correct products (for this user's plant) are available in the dropdown
     products = Product.query.join(Product.plants).filter(Plant.id == current_user.plant_id).order_by(Product.name).all()
     # Organize results in a dictionary for easy lookup in the template
     results_dict = {result.template_id: result for result in report.results}
-    return render_template('qa/edit_report.html', report=report, products=products, results_dict=results_dict)
+    spec_checks = {template_id: compliance.spec_for(result.template).as_dict()
+                   for template_id, result in results_dict.items()}
+    return render_template('qa/edit_report.html', report=report, products=products, results_dict=results_dict,
+                           spec_checks=spec_checks, exact_machine_codes=machinecodes.reads_differently(report))
+
+@bp.route('/api/batch-codes/suggest')
+@login_required
+def suggest_batch_codes():
+    """Recent batch codes of the user's plant starting with prefix (see project/batchindex.py)."""
+    prefix = batchindex.normalize(request.args.get('prefix'))
+    index = batchindex.get_index()
+    matches = []
+    if prefix and index is not None:
+        matches = index.suggest(current_user.plant_id, prefix, current_app.config['BATCH_INDEX_SUGGESTIONS'])
+    return jsonify({'prefix': prefix, 'codes': [{'code': code, 'reports': count} for code, count in matches]})
+
+@bp.route('/api/batch-codes/check')
+@login_required
+def check_batch_code():
+    """
+    Reports of any plant already using the base code of `code`, skipping
+    report exclude_id (the one being edited). POST / shows only the newest.
+    """
+    code = batchindex.normalize(request.args.get('code'))
+    if len(code) < 5:
+        return jsonify({'code': code, 'duplicates': []})
+    base_code = split_batch_code(code)[0]
+    duplicates = batchindex.find_duplicates(base_code, exclude_id=request.args.get('exclude_id', type=int))
+    return jsonify({'code': base_code, 'duplicates': duplicates})
+
+@bp.route('/api/machine-codes/preview')
+@login_required
+def preview_machine_codes():
+    """
+    Validates a machine-code expression (see project/machinecodes.py) and
+    lists the codes it accepts. Query parameters: expression, and optionally
+    code to test against it.
+    """
+    expression = request.args.get('expression', '')
+    try:
+        matcher = machinecodes.compile_expression(expression)
+    except ValueError as e:
+        return jsonify({'expression': expression, 'valid': False, 'error': str(e)}), 400
+    codes, complete = matcher.expand(current_app.config['MACHINE_CODE_PREVIEW_LIMIT'])
+    payload = {
+        'expression': expression,
+        'valid': True,
+        'normalized': matcher.normalized(),
+        'codes': codes,
+        'complete': complete,
+        # Wildcards accept codes that cannot be listed
+        'wildcards': [f"{prefix}*" for prefix in matcher.accept.prefix_list()],
+        'excluded': matcher.exclude.terms(),
+    }
+    code = request.args.get('code')
+    if code:
+        payload['code'] = code.strip().upper()
+        payload['matches'] = matcher.matches(code)
+    return jsonify(payload)
+
+@bp.route('/api/reports/search')
+@login_required
+def search_reports():
+    """
+    Reports matching q (words matched as prefixes of batch and machine codes,
+    product, plant and creator), ranked by relevance; QA users only see their
+    plant's reports. Query parameters: q, page. A capped total means "more
+    than SEARCH_RANK_LIMIT"; those results are listed newest first.
+    """
+    query = request.args.get('q', '').strip()
+    if not search.match_expression(query):
+        return jsonify({'error': 'q must contain at least one word.'}), 400
+    plant_id = None if current_user.role == 'superadmin' else current_user.plant_id
+    pagination = search.search(query, plant_id=plant_id, page=request.args.get('page', 1, type=int),
+                               per_page=current_app.config['SEARCH_PER_PAGE'])
+    return jsonify({
+        'query': query,
+        'page': pagination.page,
+        'pages': pagination.pages,
+        'total': pagination.total,
+        'ranked': pagination.ranked,
+        'capped': pagination.capped,
+        'reports': [{
+            'id': report.id,
+            'batch_code': report.batch_code,
+            'machine_codes': report.machine_codes,
+            'product': report.product.name if report.product else None,
+            'plant': report.plant_name,
+            'creator': report.creator.username if report.creator else None,
+            'in_spec': report.in_spec,
+            'created_at': report.created_at.isoformat() if report.created_at else None,
+            'expiry_date': report.expiry_date.isoformat(),
+        } for report in pagination.items],
+    })
 
 @bp.route('/api/templates/<int:product_id>')
 @login_required
 def get_templates_for_product(product_id):
     product = Product.query.get_or_404(product_id)
     templates = ReportTemplate.query.filter_by(product_id=product.id).order_by(ReportTemplate.order).all()
+    return jsonify({'templates': [template_dict(t) for t in templates], 'version': product.template_version})
+
 
-    template_list = [{
+def template_dict(t):
+    return {
         'id': t.id,
         'parameter': t.parameter,
         'specification': t.specification,
         'method': t.method,
-        'order': t.order
-    } for t in templates]
-
-    return jsonify({'templates': template_list})
+        'order': t.order,
+        # Compiled spec, so the report form can warn while results are typed
+        'check': compliance.spec_for(t).as_dict()
+    }
 
 # --- Superadmin Routes ---
 @bp.route('/superadmin/dashboard')
@@ -331,55 +708,28 @@ def superadmin_dashboard():
     }
 
     # 3. Consumer Stats (Your request)
-    analytics_data['total_page_views'] = db.session.query(AnalyticsEvent.id).filter_by(event_type='PAGE_VIEW').count()
-    analytics_data['total_report_views'] = db.session.query(AnalyticsEvent.id).filter_by(event_type='REPORT_VIEW').count()
-    analytics_data['total_downloads'] = db.session.query(AnalyticsEvent.id).filter_by(event_type='REPORT_DOWNLOAD').count()
+    # All-time totals from the hourly/daily rollups plus the raw events of the open hour
+    event_totals = rollups.event_totals()
+    analytics_data['total_page_views'] = event_totals.get('PAGE_VIEW', 0)
+    analytics_data['total_report_views'] = event_totals.get('REPORT_VIEW', 0)
+    analytics_data['total_downloads'] = event_totals.get('REPORT_DOWNLOAD', 0)
     
-    # Approx. unique visitors (by IP)
-    analytics_data['unique_visitors'] = db.session.query(AnalyticsEvent.ip_address).distinct().count()
+    # Approx. unique visitors over 7/30/365 days, merged from the daily HyperLogLog sketches
+    analytics_data['unique_visitors'] = sketches.unique_visitors((7, 30, 365))
+    analytics_data['unique_visitors_error'] = round(sketches.STANDARD_ERROR * 100, 1)
 
-    # 4. Data for Time-Series Chart (NEW)
-    today = datetime.utcnow().date()
-    start_date = today - timedelta(days=29) # 30 days ago (inclusive of today)
-    
-    # Create a list of all 30 date labels
-    date_labels = [(start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(30)]
-    
-    # Query the DB for all events in the last 30 days, grouped by date and type
-    raw_data = db.session.query(
-        func.date(AnalyticsEvent.timestamp),
-        AnalyticsEvent.event_type,
-        func.count(AnalyticsEvent.id)
-    ).filter(
-        AnalyticsEvent.timestamp >= start_date
-    ).filter(
-        AnalyticsEvent.event_type.in_(['PAGE_VIEW', 'REPORT_VIEW', 'REPORT_DOWNLOAD'])
-    ).group_by(
-        func.date(AnalyticsEvent.timestamp),
-        AnalyticsEvent.event_type
-    ).all()
-    
-    # Process the raw data into a format Chart.js can read
-    # Initialize a dict with all dates set to 0
-    processed_data = {label: {'PAGE_VIEW': 0, 'REPORT_VIEW': 0, 'REPORT_DOWNLOAD': 0} for label in date_labels}
-    
-    # Fill in the counts from the query
-    for row in raw_data:
-        date_str = row[0] # This is a string from func.date() in SQLite
-        event_type = row[1]
-        count = row[2]
-        if date_str in processed_data:
-            if event_type in processed_data[date_str]:
-                processed_data[date_str][event_type] = count
-                
-    # Create the final data structure for the chart
-    analytics_data['time_series_chart'] = {
-        'labels': date_labels,
-        'page_views': [processed_data[date]['PAGE_VIEW'] for date in date_labels],
-        'report_views': [processed_data[date]['REPORT_VIEW'] for date in date_labels],
-        'downloads': [processed_data[date]['REPORT_DOWNLOAD'] for date in date_labels]
-    }
-    
+    # Most requested batch codes (views + downloads), from the top-K tracker
+    analytics_data['hot_batches_days'] = current_app.config['HOT_BATCHES_DAYS']
+    analytics_data['hot_batches'] = hotbatches.hot_batches(analytics_data['hot_batches_days'], limit=10)
+
+    # Requests rejected by the rate limiter, per bucket
+    analytics_data['rate_limited'] = {event_type: count for event_type, count in event_totals.items()
+                                      if event_type.startswith('RATE_LIMITED_')}
+
+    # 4. The traffic charts fetch /api/analytics/series when the analytics tab opens
+
+    # 5. Top SQL fingerprints by total time (all workers)
+    query_stats = querystats.top_fingerprints(limit=25)
 
     return render_template('superadmin/dashboard.html', 
                            qa_users=qa_users, 
@@ -387,7 +737,16 @@ def superadmin_dashboard():
                            plants=plants,
                            master_parameters=master_parameters,
                            all_reports=all_reports,
-                           analytics_data=analytics_data) 
+                           analytics_data=analytics_data,
+                           query_stats=query_stats) 
+
+@bp.route('/superadmin/query-stats/reset', methods=['POST'])
+@login_required
+@superadmin_required
+def reset_query_stats():
+    querystats.reset_all()
+    flash('Query statistics cleared.', 'success')
+    return redirect(url_for('main.superadmin_dashboard', tab='query_stats'))
 
 @bp.route('/superadmin/users/new', methods=['GET', 'POST'])
 @login_required
@@ -439,6 +798,8 @@ def delete_user(user_id):
             pass
     db.session.delete(user)
     db.session.commit()
+    # Their signature disappears from the reports they created
+    invalidate_rendered_reports()
     flash(f'User "{user.username}" has been deleted.', 'success')
     return redirect(url_for('main.superadmin_dashboard'))
 
@@ -493,6 +854,7 @@ def edit_user(user_id):
             user.signature_filename = sig_filename
 
         db.session.commit()
+        invalidate_rendered_reports()
         flash(f'User "{username}" updated successfully!', 'success')
         return redirect(url_for('main.superadmin_dashboard'))
 
@@ -593,7 +955,9 @@ def add_template(product_id):
             order=int(request.form.get('order')) 
         )
         db.session.add(new_template)
+        templateops.bump_version(product.id)
         db.session.commit()
+        invalidate_rendered_reports()
         
         template_data = {
             'id': new_template.id,
@@ -618,7 +982,10 @@ def delete_template(template_id):
         template_id_copy = template.id  
         
         db.session.delete(template)
+        templateops.bump_version(template.product_id)
         db.session.commit()
+        compliance.invalidate(template_id_copy)
+        invalidate_rendered_reports()
         
         # Ensures a clean JSON response with the correct mimetype
         return jsonify({'success': True, 'template_id': template_id_copy}), 200, {'Content-Type': 'application/json'}
@@ -638,10 +1005,17 @@ def edit_template(template_id):
     
     try:
         # Only allow updates to specification and order, locking parameter and method
+        spec_changed = template.specification != data['specification']
         template.specification = data['specification']
         template.order = data['order']
+        templateops.bump_version(template.product_id)
         
         db.session.commit()
+        invalidate_rendered_reports()
+        if spec_changed:
+            # Stored pass/fail flags of the product's reports follow the new spec
+            compliance.invalidate(template.id)
+            jobs.enqueue('rescore_compliance', {'product_id': template.product_id})
         return jsonify({'success': True}), 200, {'Content-Type': 'application/json'}
         
     except Exception as e:
@@ -650,6 +1024,48 @@ def edit_template(template_id):
         return jsonify({'success': False, 'error': f"Failed to save changes: {e}"}), 400, {'Content-Type': 'application/json'}
     
 
+@bp.route('/superadmin/templates/batch/<int:product_id>', methods=['POST'])
+@login_required
+@superadmin_required
+def batch_edit_templates(product_id):
+    """
+    Applies a list of add/edit/delete/reorder operations to a product's
+    templates in one transaction (see project/templateops.py).
+    Body: {"version": <version the edits start from, optional>, "operations": [...]}.
+    Returns the new version and the product's templates.
+    """
+    product = Product.query.get_or_404(product_id)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON body like {"operations": [...]}.'}), 400
+    base_version = data.get('version')
+    if base_version is not None and (isinstance(base_version, bool) or not isinstance(base_version, int)):
+        return jsonify({'success': False, 'error': "'version' must be an integer."}), 400
+
+    try:
+        version, spec_changed, deleted = templateops.apply(product, data.get('operations'), base_version)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except templateops.VersionConflict as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e), 'version': e.version}), 409
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Template batch for product {product_id} failed: {e}")
+        return jsonify({'success': False, 'error': f"Failed to save changes: {e}"}), 500
+
+    for template_id in list(spec_changed) + list(deleted):
+        compliance.invalidate(template_id)
+    invalidate_rendered_reports()
+    if spec_changed:
+        # Stored pass/fail flags of the product's reports follow the new specs
+        jobs.enqueue('rescore_compliance', {'product_id': product.id})
+    templates = ReportTemplate.query.filter_by(product_id=product.id).order_by(ReportTemplate.order).all()
+    return jsonify({'success': True, 'version': version, 'templates': [template_dict(t) for t in templates]})
+
+
 # --- MASTER PARAMETER ROUTES ---
 
 @bp.route('/superadmin/master_parameters/add', methods=['POST'])
@@ -694,6 +1110,125 @@ def get_master_parameters():
 # --- END MASTER PARAMETER ROUTES ---
 
 
+@bp.route('/superadmin/archive/<batch_code>')
+@login_required
+@superadmin_required
+def get_archived_report(batch_code):
+    """Fetches expired reports that `flask archive-reports` moved out of the hot tables."""
+    records = archive.fetch_archived(batch_code.strip().upper())
+    if not records:
+        return jsonify({'error': 'No archived report for this batch code.'}), 404
+    return jsonify({'reports': records})
+
+
+@bp.route('/api/analytics/series')
+@login_required
+@superadmin_required
+def analytics_series():
+    """
+    Event counts for the analytics charts. Query parameters: start and end
+    (YYYY-MM-DD, inclusive; the last 30 days by default), granularity
+    (hour, day, week or month), breakdown (type, plant or product) and
+    types (comma-separated event types).
+    """
+    try:
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else datetime.utcnow().date()
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates in YYYY-MM-DD format.'}), 400
+    event_types = [t.strip() for t in request.args.get('types', '').split(',') if t.strip()]
+    try:
+        data = rollups.series(start, end,
+                              granularity=request.args.get('granularity', 'day'),
+                              breakdown=request.args.get('breakdown', 'type'),
+                              event_types=event_types or None,
+                              max_buckets=current_app.config['ANALYTICS_API_MAX_BUCKETS'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = jsonify(data)
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
+
+def _stats_filters():
+    """days, plant_id and product_id query parameters of the stats API; raises ValueError."""
+    days = request.args.get('days', current_app.config['STATS_DAYS'], type=int)
+    if days is None or not 1 <= days <= current_app.config['STATS_MAX_DAYS']:
+        raise ValueError(f"days must be between 1 and {current_app.config['STATS_MAX_DAYS']}.")
+    return {'days': days,
+            'plant_id': request.args.get('plant_id', type=int),
+            'product_id': request.args.get('product_id', type=int)}
+
+@bp.route('/api/stats/overview')
+@login_required
+@superadmin_required
+def stats_overview():
+    """Per-parameter summary and control limits. Query parameters: days, plant_id, product_id."""
+    try:
+        filters = _stats_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = jsonify(stats.cached('overview', stats.overview, **filters))
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
+@bp.route('/api/stats/trend')
+@login_required
+@superadmin_required
+def stats_trend():
+    """
+    Daily means, rolling mean and control limits of one parameter. Query
+    parameters: parameter (required), days, window, plant_id, product_id.
+    """
+    parameter = request.args.get('parameter', '').strip()
+    window = request.args.get('window', 7, type=int)
+    try:
+        if not parameter:
+            raise ValueError('parameter is required.')
+        if window is None or not 1 <= window <= 90:
+            raise ValueError('window must be between 1 and 90 days.')
+        filters = _stats_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = jsonify(stats.cached('trend', stats.trend, parameter=parameter, window=window, **filters))
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
+
+@bp.route('/superadmin/export/<kind>')
+@login_required
+@superadmin_required
+def export_data(kind):
+    """
+    Streams an export (see project/exports.py). Query parameters: format
+    (csv or ndjson), start and end (YYYY-MM-DD, inclusive), plant_id,
+    product_id and, for events, types (comma-separated).
+    """
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates in YYYY-MM-DD format.'}), 400
+    fmt = request.args.get('format', 'csv')
+    # Compressed on the fly when the client accepts it; the browser saves the plain file
+    compress = bool(request.accept_encodings['gzip'])
+    event_types = [t.strip() for t in request.args.get('types', '').split(',') if t.strip()]
+    try:
+        chunks = exports.stream(kind, fmt, compress, start=start, end=end,
+                                plant_id=request.args.get('plant_id', type=int),
+                                product_id=request.args.get('product_id', type=int),
+                                event_types=event_types or None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = Response(stream_with_context(chunks), mimetype=exports.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{exports.file_name(kind, fmt)}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
 @bp.route('/superadmin/plants/new', methods=['POST'])
 @login_required
 @superadmin_required
@@ -739,6 +1274,7 @@ def edit_product(product_id):
         
         try:
             db.session.commit()
+            invalidate_rendered_reports()
             flash(f'Product "{product.name}" updated successfully!', 'success')
         except Exception as e:
             db.session.rollback()
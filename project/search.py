@@ -0,0 +1,168 @@
+# project/search.py
+# Full-text search over reports (SQLite FTS5).
+#
+# report_search holds one row per quality_report (rowid = report id) with the
+# batch code, machine codes, product name, plant name and creator. SQLite
+# triggers keep it in step with every writer: the QA views, bulk inserts from
+# the synthetic generator and deletes by the archiver alike. Renaming a
+# product, plant or user rewrites the rows of their reports.
+#
+# A query is split into words and every word must match the start of a
+# token, so "ab12 milk" finds batch AB1234 of "Heritage Toned Milk". Prefix
+# indexes on 2 to 6 characters cover the prefixes people type (batch codes
+# are five characters); a longer prefix makes FTS5 merge the doclists of
+# every token it matches. Matches are ranked by bm25 with the batch and
+# machine codes weighted above the names. A query matching more than
+# SEARCH_RANK_LIMIT reports is listed newest first instead, and its total is
+# reported as "more than SEARCH_RANK_LIMIT": ranking or counting it exactly
+# would visit every match before returning the first page.
+#
+# The migration creates the table and backfills it; on a database built with
+# db.create_all() it is created after the model tables. `flask search-rebuild`
+# repopulates it from scratch.
+
+import re
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import event, text
+
+from . import db
+from .models import QualityReport
+
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS report_search USING fts5(
+        batch_code, machine_codes, product, plant, creator,
+        tokenize = 'unicode61', prefix = '2 3 4 5 6')""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_insert AFTER INSERT ON quality_report BEGIN
+        INSERT INTO report_search (rowid, batch_code, machine_codes, product, plant, creator)
+        VALUES (new.id, new.batch_code, new.machine_codes,
+                (SELECT name FROM product WHERE id = new.product_id),
+                coalesce((SELECT name FROM plant WHERE id = new.plant_id), new.plant_name),
+                (SELECT username FROM user WHERE id = new.user_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_update
+    AFTER UPDATE OF batch_code, machine_codes, product_id, plant_id, plant_name, user_id ON quality_report BEGIN
+        DELETE FROM report_search WHERE rowid = old.id;
+        INSERT INTO report_search (rowid, batch_code, machine_codes, product, plant, creator)
+        VALUES (new.id, new.batch_code, new.machine_codes,
+                (SELECT name FROM product WHERE id = new.product_id),
+                coalesce((SELECT name FROM plant WHERE id = new.plant_id), new.plant_name),
+                (SELECT username FROM user WHERE id = new.user_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_delete AFTER DELETE ON quality_report BEGIN
+        DELETE FROM report_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_product AFTER UPDATE OF name ON product BEGIN
+        UPDATE report_search SET product = new.name
+        WHERE rowid IN (SELECT id FROM quality_report WHERE product_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_plant AFTER UPDATE OF name ON plant BEGIN
+        UPDATE report_search SET plant = new.name
+        WHERE rowid IN (SELECT id FROM quality_report WHERE plant_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS report_search_user AFTER UPDATE OF username ON user BEGIN
+        UPDATE report_search SET creator = new.username
+        WHERE rowid IN (SELECT id FROM quality_report WHERE user_id = new.id);
+    END""",
+]
+
+POPULATE = """INSERT INTO report_search (rowid, batch_code, machine_codes, product, plant, creator)
+    SELECT q.id, q.batch_code, q.machine_codes, p.name, coalesce(pl.name, q.plant_name), u.username
+    FROM quality_report q
+    LEFT JOIN product p ON p.id = q.product_id
+    LEFT JOIN plant pl ON pl.id = q.plant_id
+    LEFT JOIN user u ON u.id = q.user_id"""
+
+# bm25 weights, in column order: batch_code, machine_codes, product, plant, creator
+RANK = 'bm25(report_search, 10.0, 5.0, 2.0, 1.0, 1.0)'
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for statement in SCHEMA:
+            connection.exec_driver_sql(statement)
+
+
+def match_expression(query):
+    """The FTS5 MATCH expression for a user query (every word as a prefix), or None if it has no words."""
+    words = _WORD.findall(query or '')
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+
+class SearchPagination(Pagination):
+    """
+    A page of reports matching `query`, optionally of one plant; supports
+    the same attributes as db.paginate() (items, total, iter_pages(), ...).
+    When capped is True, total is SEARCH_RANK_LIMIT + 1 rather than exact.
+    """
+
+    def _query_items(self):
+        expression = match_expression(self._query_args['query'])
+        self.ranked = self.capped = False
+        self._total = 0
+        if expression is None:
+            return []
+        plant_id = self._query_args.get('plant_id')
+        where = 'report_search MATCH :expression'
+        params = {'expression': expression}
+        if plant_id is not None:
+            where += ' AND quality_report.plant_id = :plant_id'
+            params['plant_id'] = plant_id
+        joined = f'FROM report_search JOIN quality_report ON quality_report.id = report_search.rowid WHERE {where}'
+        limit = current_app.config['SEARCH_RANK_LIMIT']
+        # Counting stops one past the rank limit
+        self._total = db.session.execute(text(
+            f'SELECT count(*) FROM (SELECT 1 {joined} LIMIT :cap)'), {**params, 'cap': limit + 1}).scalar()
+        self.capped = self._total > limit
+        self.ranked = not self.capped
+        order = RANK if self.ranked else 'report_search.rowid DESC'
+        ids = db.session.execute(text(
+            f'SELECT report_search.rowid {joined} ORDER BY {order} LIMIT :limit OFFSET :offset'
+        ), {**params, 'limit': self.per_page, 'offset': self._query_offset}).scalars().all()
+        if not ids:
+            return []
+        reports = {report.id: report for report in QualityReport.query.options(
+            db.joinedload(QualityReport.product), db.joinedload(QualityReport.creator)
+        ).filter(QualityReport.id.in_(ids))}
+        return [reports[report_id] for report_id in ids if report_id in reports]
+
+    def _query_count(self):
+        return self._total
+
+
+def search(query, plant_id=None, page=1, per_page=20):
+    """A SearchPagination of the reports matching `query` (see the module comment)."""
+    return SearchPagination(page=page, per_page=per_page, error_out=False, query=query, plant_id=plant_id)
+
+
+def rebuild():
+    """Recreates and repopulates report_search. Returns the number of reports indexed."""
+    connection = db.session.connection()
+    connection.exec_driver_sql('DROP TABLE IF EXISTS report_search')
+    for statement in SCHEMA:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql(POPULATE)
+    connection.exec_driver_sql("INSERT INTO report_search (report_search) VALUES ('optimize')")
+    db.session.commit()
+    return db.session.execute(text('SELECT count(*) FROM report_search')).scalar()
+
+
+@click.command('search-rebuild')
+@with_appcontext
+def search_rebuild_command():
+    """Rebuilds the report search index from the report tables."""
+    started = time.perf_counter()
+    count = rebuild()
+    click.echo(f"Indexed {count} reports in {time.perf_counter() - started:.1f} s.")
+
+
+def init_app(app):
+    """Registers `flask search-rebuild`."""
+    app.cli.add_command(search_rebuild_command)
@@ -0,0 +1,264 @@
+# project/sharedcache.py
+# Cross-process byte cache over a memory-mapped file in the instance folder.
+#
+# Every worker maps the same file, so a PDF rendered by one worker is served
+# by all of them and an invalidation in one worker is seen by the others on
+# their next read.
+#
+# Layout: a header page, a table of fixed-size slot headers, then one
+# fixed-size data area per slot. Keys hash to a set of `ways` adjacent slots
+# and a full set evicts its least recently used slot. Writers take an
+# exclusive file lock. Readers take no lock: each slot carries a sequence
+# number that is odd while a write is in progress, and a read that sees the
+# sequence change is treated as a miss.
+#
+# Invalidation uses generation counters. Each namespace maps to a counter
+# in the header that is mixed into its keys; bumping the counter orphans
+# every entry in the namespace at once, and LRU reclaims the slots.
+
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from hashlib import blake2b
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows (IIS)
+    fcntl = None
+    import msvcrt
+
+MAGIC = b'QRSCACHE'
+VERSION = 1
+PAGE = 4096
+
+# magic, version, slots, slot_bytes, ways, global generation
+_HEADER = struct.Struct('<8sIIIIQ')
+_NAMESPACE_OFFSET = 64
+_NAMESPACE_COUNTERS = 256
+
+# sequence, key hash, generation, last used (ms), length
+_SLOT = struct.Struct('<Q16sQQI')
+_SLOT_SIZE = 64
+
+
+def _round_up(value, multiple):
+    return (value + multiple - 1) // multiple * multiple
+
+
+class SharedCache:
+    def __init__(self, path, slots=128, slot_bytes=512 * 1024, ways=8):
+        self.path = path
+        self.slots = _round_up(slots, ways)
+        self.slot_bytes = slot_bytes
+        self.ways = ways
+        self.table_offset = PAGE
+        self.data_offset = PAGE + _round_up(self.slots * _SLOT_SIZE, PAGE)
+        self.size = self.data_offset + self.slots * slot_bytes
+        self.hits = self.misses = self.stores = self.oversize = 0
+        self._thread_lock = threading.Lock()
+        self._open()
+
+    # --- File and Locking ---
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._file = os.fdopen(fd, 'r+b')
+        with self._locked():
+            if os.fstat(fd).st_size != self.size:
+                self._file.truncate(self.size)
+            self._map = mmap.mmap(fd, self.size)
+            magic, version, slots, slot_bytes, ways, _ = _HEADER.unpack_from(self._map, 0)
+            if (magic, version, slots, slot_bytes, ways) != (MAGIC, VERSION, self.slots, self.slot_bytes, self.ways):
+                # New file, or the geometry changed with the config: start empty
+                self._map[:self.data_offset] = bytes(self.data_offset)
+                _HEADER.pack_into(self._map, 0, MAGIC, VERSION, self.slots, self.slot_bytes, self.ways, 1)
+
+    @contextmanager
+    def _locked(self):
+        # The thread lock covers threads sharing this process's file handle
+        with self._thread_lock:
+            fd = self._file.fileno()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    # --- Generations ---
+    def _global_generation(self):
+        return struct.unpack_from('<Q', self._map, 24)[0]
+
+    def _namespace_offset(self, namespace):
+        index = blake2b(namespace.encode('utf-8'), digest_size=2).digest()
+        return _NAMESPACE_OFFSET + (int.from_bytes(index, 'little') % _NAMESPACE_COUNTERS) * 8
+
+    def generation(self, namespace):
+        return struct.unpack_from('<Q', self._map, self._namespace_offset(namespace))[0]
+
+    def invalidate(self, namespace):
+        """Drops every entry in `namespace`, in every process."""
+        offset = self._namespace_offset(namespace)
+        with self._locked():
+            struct.pack_into('<Q', self._map, offset, struct.unpack_from('<Q', self._map, offset)[0] + 1)
+
+    def clear(self):
+        """Drops every entry in every namespace."""
+        with self._locked():
+            struct.pack_into('<Q', self._map, 24, self._global_generation() + 1)
+
+    # --- Slots ---
+    def _key_hash(self, namespace, key):
+        raw = f"{namespace}\0{self.generation(namespace)}\0{key}".encode('utf-8')
+        return blake2b(raw, digest_size=16).digest()
+
+    def _set_slots(self, key_hash):
+        first = int.from_bytes(key_hash[:8], 'little') % (self.slots // self.ways) * self.ways
+        return range(first, first + self.ways)
+
+    def _slot_offset(self, slot):
+        return self.table_offset + slot * _SLOT_SIZE
+
+    def _data_offset(self, slot):
+        return self.data_offset + slot * self.slot_bytes
+
+    def _find(self, key_hash, generation):
+        for slot in self._set_slots(key_hash):
+            seq, slot_key, slot_generation, _, length = _SLOT.unpack_from(self._map, self._slot_offset(slot))
+            if slot_key == key_hash and slot_generation == generation and not seq & 1:
+                return slot, seq, length
+        return None, 0, 0
+
+    def get(self, namespace, key):
+        """
+        Returns the cached bytes for `key`, or None. The payload is copied
+        straight out of the shared mapping: no read() calls and no decoding.
+        """
+        key_hash = self._key_hash(namespace, key)
+        slot, seq, length = self._find(key_hash, self._global_generation())
+        if slot is None:
+            self.misses += 1
+            return None
+        start = self._data_offset(slot)
+        value = self._map[start:start + length]
+        # A concurrent writer bumps the sequence number; treat a torn read as a miss
+        if struct.unpack_from('<Q', self._map, self._slot_offset(slot))[0] != seq:
+            self.misses += 1
+            return None
+        # Benign race: last-used stamps only steer eviction
+        struct.pack_into('<Q', self._map, self._slot_offset(slot) + 32, int(time.time() * 1000))
+        self.hits += 1
+        return value
+
+    def set(self, namespace, key, value):
+        """Stores `value` (bytes). Returns False when it is larger than a slot."""
+        if len(value) > self.slot_bytes:
+            self.oversize += 1
+            return False
+        key_hash = self._key_hash(namespace, key)
+        with self._locked():
+            generation = self._global_generation()
+            slot, _, _ = self._find(key_hash, generation)
+            if slot is None:
+                slot = self._choose_victim(key_hash, generation)
+            offset = self._slot_offset(slot)
+            # Odd sequence while writing; the final even value is published last
+            writing = struct.unpack_from('<Q', self._map, offset)[0] | 1
+            struct.pack_into('<Q', self._map, offset, writing)
+            start = self._data_offset(slot)
+            self._map[start:start + len(value)] = value
+            _SLOT.pack_into(self._map, offset, writing, key_hash, generation,
+                            int(time.time() * 1000), len(value))
+            struct.pack_into('<Q', self._map, offset, writing + 1)
+        self.stores += 1
+        return True
+
+    def _choose_victim(self, key_hash, generation):
+        victim, oldest = None, None
+        for slot in self._set_slots(key_hash):
+            _, slot_key, slot_generation, last_used, length = _SLOT.unpack_from(self._map, self._slot_offset(slot))
+            if slot_generation != generation or not length:
+                return slot  # Empty or from a cleared generation
+            if oldest is None or last_used < oldest:
+                victim, oldest = slot, last_used
+        return victim
+
+    def stats(self):
+        generation = self._global_generation()
+        headers = (_SLOT.unpack_from(self._map, self._slot_offset(slot)) for slot in range(self.slots))
+        used = sum(1 for _, _, slot_generation, _, length in headers
+                   if slot_generation == generation and length)
+        return {
+            'slots': self.slots,
+            'slots_used': used,
+            'slot_bytes': self.slot_bytes,
+            'file_bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'oversize': self.oversize,
+        }
+
+
+def get_cache():
+    """Returns the app's SharedCache, or None when it is disabled or unavailable."""
+    return current_app.extensions.get('shared_cache')
+
+
+def invalidate(namespace):
+    """Invalidates `namespace` across workers; a no-op without a shared cache."""
+    cache = get_cache()
+    if cache is not None:
+        try:
+            cache.invalidate(namespace)
+        except Exception as e:
+            current_app.logger.error(f"Shared cache invalidation failed: {e}")
+
+
+@click.command('shared-cache')
+@with_appcontext
+@click.option('--clear', is_flag=True, default=False, help='Drop every entry in every worker.')
+def shared_cache_command(clear):
+    """Shows the shared cache's slot usage, optionally clearing it."""
+    cache = get_cache()
+    if cache is None:
+        click.echo('The shared cache is disabled (SHARED_CACHE_ENABLED=0).')
+        return
+    if clear:
+        cache.clear()
+        click.echo('Shared cache cleared.')
+    stats = cache.stats()
+    click.echo(f"File:       {cache.path} ({stats['file_bytes'] / 1024 / 1024:.1f} MiB)")
+    click.echo(f"Slots used: {stats['slots_used']} / {stats['slots']} of {stats['slot_bytes'] // 1024} KiB")
+
+
+def init_app(app):
+    """Maps instance/shared_cache.bin and attaches it as app.extensions['shared_cache']."""
+    app.cli.add_command(shared_cache_command)
+    if not app.config.get('SHARED_CACHE_ENABLED', True):
+        return None
+    try:
+        os.makedirs(app.instance_path, exist_ok=True)
+        cache = SharedCache(
+            os.path.join(app.instance_path, 'shared_cache.bin'),
+            slots=app.config.get('SHARED_CACHE_SLOTS', 128),
+            slot_bytes=app.config.get('SHARED_CACHE_SLOT_KB', 512) * 1024,
+        )
+    except (OSError, ValueError) as e:
+        app.logger.error(f"Shared cache disabled: {e}")
+        return None
+    app.extensions['shared_cache'] = cache
+    return cache
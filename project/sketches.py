@@ -0,0 +1,192 @@
+# project/sketches.py
+# Approximate unique-visitor counts with HyperLogLog sketches.
+#
+# Each (day, scope) pair keeps one sketch: 4096 one-byte registers, zlib
+# compressed in `analytics_sketch`. Scopes are 'all', 'plant:<id>' and
+# 'product:<id>'. The analytics writer folds new visits into the sketches
+# in the same transaction as the events. Sketches merge by taking the
+# register-wise maximum, so any range of days is one read of at most a few
+# hundred small blobs, whatever the event volume, and re-adding a visitor
+# is harmless. Sketches are kept after raw events expire.
+#
+# The standard error of an estimate is 1.04 / sqrt(4096), about 1.6%.
+
+import math
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import AnalyticsEvent, AnalyticsSketch, AnalyticsVisitor
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+STANDARD_ERROR = 1.04 / math.sqrt(REGISTERS)
+
+_RANK_BITS = 64 - PRECISION
+_RANK_MASK = (1 << _RANK_BITS) - 1
+# Merge helpers: registers never exceed 53, so each byte lane has a free top bit
+_HIGH_BITS = int.from_bytes(b'\x80' * REGISTERS, 'little')
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+
+class HyperLogLog:
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers is not None else bytearray(REGISTERS)
+
+    def add(self, hash64):
+        """Adds one item given a uniformly distributed 64-bit hash."""
+        index = hash64 >> _RANK_BITS
+        rank = _RANK_BITS - (hash64 & _RANK_MASK).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Folds `other` into this sketch (register-wise maximum) and returns self."""
+        a = int.from_bytes(self.registers, 'little')
+        b = int.from_bytes(other.registers, 'little')
+        # Per byte lane, (a | 0x80) - b keeps its top bit exactly when a >= b
+        a_wins = (((a | _HIGH_BITS) - b) & _HIGH_BITS) >> 7
+        mask = a_wins * 0xFF
+        self.registers = bytearray(((a & mask) | (b & ~mask)).to_bytes(REGISTERS, 'little'))
+        return self
+
+    def count(self):
+        registers = bytes(self.registers)
+        harmonic = sum(registers.count(rank) * 2.0 ** -rank for rank in range(_RANK_BITS + 2))
+        estimate = _ALPHA * REGISTERS * REGISTERS / harmonic
+        zeros = registers.count(0)
+        if estimate <= 2.5 * REGISTERS and zeros:
+            # Linear counting is more accurate while many registers are empty
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return int(round(estimate))
+
+    def to_blob(self):
+        return zlib.compress(bytes(self.registers), 6)
+
+    @classmethod
+    def from_blob(cls, blob):
+        return cls(zlib.decompress(blob))
+
+
+def visitor_hash(ip_hash):
+    """64-bit sketch hash of a visitor; ip_hash is already a keyed, uniform digest."""
+    return int(ip_hash[:16], 16)
+
+
+def scopes_for(plant_id=None, product_id=None):
+    scopes = ['all']
+    if plant_id is not None:
+        scopes.append(f"plant:{plant_id}")
+    if product_id is not None:
+        scopes.append(f"product:{product_id}")
+    return scopes
+
+
+def record_visits(visits):
+    """Folds `visits` (day, scopes, ip_hash) into the stored sketches, in the caller's transaction."""
+    updates = defaultdict(HyperLogLog)
+    for day, scopes, ip_hash in visits:
+        if ip_hash:
+            hash64 = visitor_hash(ip_hash)
+            for scope in scopes:
+                updates[(day, scope)].add(hash64)
+    save(updates)
+
+
+def save(updates):
+    """Merges `updates` ({(day, scope): HyperLogLog}) into the stored sketches."""
+    if not updates:
+        return
+    table = AnalyticsSketch.__table__
+    rows = [{'day': day, 'scope': scope, 'registers': sketch.to_blob()} for (day, scope), sketch in updates.items()]
+    # Writing first takes SQLite's write lock, so no other process can change
+    # the sketches between the read and the merged write below. Merging a
+    # sketch inserted here with itself changes nothing.
+    db.session.execute(sqlite_insert(table).on_conflict_do_nothing(), rows)
+    stored = db.session.query(AnalyticsSketch.day, AnalyticsSketch.scope, AnalyticsSketch.registers).filter(
+        AnalyticsSketch.day.in_({day for day, _ in updates}),
+        AnalyticsSketch.scope.in_({scope for _, scope in updates}))
+    merged_rows = [{'day': day, 'scope': scope,
+                    'registers': updates[(day, scope)].merge(HyperLogLog.from_blob(blob)).to_blob()}
+                   for day, scope, blob in stored if (day, scope) in updates]
+    statement = sqlite_insert(table)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['day', 'scope'], set_={'registers': statement.excluded.registers}), merged_rows)
+
+
+# --- Queries ---
+def merged(start_date, end_date, scope='all'):
+    """One sketch covering every visitor from `start_date` to `end_date` inclusive."""
+    sketch = HyperLogLog()
+    for (blob,) in db.session.query(AnalyticsSketch.registers).filter(
+        AnalyticsSketch.scope == scope, AnalyticsSketch.day >= start_date, AnalyticsSketch.day <= end_date
+    ):
+        sketch.merge(HyperLogLog.from_blob(blob))
+    return sketch
+
+
+def unique_visitors(windows=(7, 30, 365), scope='all', today=None):
+    """
+    Estimated unique visitors over the last N days (including today) for
+    each N in `windows`, from a single query. Returns {N: estimate}.
+    """
+    today = today or datetime.utcnow().date()
+    windows = sorted(windows)
+    rows = db.session.query(AnalyticsSketch.day, AnalyticsSketch.registers).filter(
+        AnalyticsSketch.scope == scope, AnalyticsSketch.day > today - timedelta(days=windows[-1]),
+        AnalyticsSketch.day <= today
+    ).order_by(AnalyticsSketch.day.desc()).all()
+
+    # Merge newest first, reading off each window's count as its boundary passes
+    sketch, estimates, position = HyperLogLog(), {}, 0
+    for window in windows:
+        start = today - timedelta(days=window - 1)
+        while position < len(rows) and rows[position][0] >= start:
+            sketch.merge(HyperLogLog.from_blob(rows[position][1]))
+            position += 1
+        estimates[window] = sketch.count()
+    return estimates
+
+
+# --- Backfill ---
+def backfill(chunk_size=20000, echo=None):
+    """
+    Adds every retained raw event to the 'all' sketches. Merging is
+    idempotent, so running this over already-sketched days is harmless.
+    """
+    last_id, total = 0, 0
+    while True:
+        rows = db.session.query(AnalyticsEvent.id, AnalyticsEvent.timestamp, AnalyticsVisitor.ip_hash).join(
+            AnalyticsVisitor, AnalyticsEvent.visitor_id == AnalyticsVisitor.id
+        ).filter(AnalyticsEvent.id > last_id).order_by(AnalyticsEvent.id).limit(chunk_size).all()
+        if not rows:
+            return total
+        record_visits([(timestamp.date(), ('all',), ip_hash) for _, timestamp, ip_hash in rows if timestamp])
+        db.session.commit()
+        last_id = rows[-1][0]
+        total += len(rows)
+        if echo:
+            echo(f"  {total} events sketched...")
+
+
+@click.command('analytics-sketches')
+@with_appcontext
+@click.option('--backfill', 'run_backfill', is_flag=True, default=False,
+              help='Fold the retained raw events into the sketches first.')
+@click.option('--scope', default='all', show_default=True, help="'all', 'plant:<id>' or 'product:<id>'.")
+def analytics_sketches_command(run_backfill, scope):
+    """Prints approximate unique visitors for the last 7, 30 and 365 days."""
+    if run_backfill:
+        click.echo(f"Sketched {backfill(echo=click.echo)} events.")
+    for window, estimate in unique_visitors(scope=scope).items():
+        click.echo(f"Last {window:>3} days: ~{estimate} unique visitors (±{STANDARD_ERROR:.1%})")
+
+
+def init_app(app):
+    """Registers the sketch report/backfill command."""
+    app.cli.add_command(analytics_sketches_command)
@@ -0,0 +1,197 @@
+# project/stats.py
+# Per-parameter statistics over numeric results.
+#
+# Results are read as two columns, (day, result_numeric), one query per
+# request, and summarised as arrays: mean, standard deviation, percentiles,
+# daily means with a trailing rolling mean, and individuals control-chart
+# (I-MR) limits: centre ± 3 sigma, with sigma estimated from the average
+# moving range (MR-bar / 1.128). NumPy does the arithmetic when it is
+# installed; otherwise the same figures come from plain Python.
+#
+# Figures cover complete days only (up to yesterday), so each one is cached
+# in the shared cache under today's date and recomputed once a day.
+
+import json
+import math
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db, sharedcache
+from .models import QualityReport, ReportResult, ReportTemplate
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency
+    np = None
+
+CACHE_NAMESPACE = 'stats'
+PERCENTILES = (5, 25, 50, 75, 95)
+# d2 for moving ranges of two observations
+D2 = 1.128
+
+
+# --- Array statistics ---
+def _percentile(ordered, q):
+    """Linear-interpolation percentile of a sorted list (NumPy's default method)."""
+    position = (len(ordered) - 1) * q / 100
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def describe(values):
+    """count, mean, std (sample), min, max and PERCENTILES of `values`; None figures when empty."""
+    count = len(values)
+    if not count:
+        return {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None,
+                **{f"p{q}": None for q in PERCENTILES}}
+    if np is not None:
+        array = np.asarray(values, dtype=float)
+        mean = float(array.mean())
+        std = float(array.std(ddof=1)) if count > 1 else 0.0
+        percentiles = [float(p) for p in np.percentile(array, PERCENTILES)]
+        low, high = float(array.min()), float(array.max())
+    else:
+        ordered = sorted(values)
+        mean = math.fsum(ordered) / count
+        std = math.sqrt(math.fsum((v - mean) ** 2 for v in ordered) / (count - 1)) if count > 1 else 0.0
+        percentiles = [_percentile(ordered, q) for q in PERCENTILES]
+        low, high = ordered[0], ordered[-1]
+    return {'count': count, 'mean': mean, 'std': std, 'min': low, 'max': high,
+            **{f"p{q}": p for q, p in zip(PERCENTILES, percentiles)}}
+
+
+def control_limits(values):
+    """I-MR limits for `values` in time order, and how many values fall outside them."""
+    if len(values) < 2:
+        return {'center': None, 'sigma': None, 'ucl': None, 'lcl': None, 'out_of_control': 0}
+    if np is not None:
+        array = np.asarray(values, dtype=float)
+        center = float(array.mean())
+        sigma = float(np.abs(np.diff(array)).mean()) / D2
+        ucl, lcl = center + 3 * sigma, center - 3 * sigma
+        out = int(np.count_nonzero((array > ucl) | (array < lcl)))
+    else:
+        center = math.fsum(values) / len(values)
+        sigma = math.fsum(abs(b - a) for a, b in zip(values, values[1:])) / (len(values) - 1) / D2
+        ucl, lcl = center + 3 * sigma, center - 3 * sigma
+        out = sum(1 for v in values if v > ucl or v < lcl)
+    return {'center': center, 'sigma': sigma, 'ucl': ucl, 'lcl': lcl, 'out_of_control': out}
+
+
+def daily_means(days, values, day_count):
+    """(means, counts) per day index 0..day_count-1; a day without values has mean None."""
+    if np is not None:
+        index = np.asarray(days, dtype=np.int64)
+        counts = np.bincount(index, minlength=day_count)[:day_count]
+        sums = np.bincount(index, weights=np.asarray(values, dtype=float), minlength=day_count)[:day_count]
+        means = [float(s / c) if c else None for s, c in zip(sums, counts)]
+        return means, [int(c) for c in counts]
+    sums, counts = [0.0] * day_count, [0] * day_count
+    for day, value in zip(days, values):
+        sums[day] += value
+        counts[day] += 1
+    return [s / c if c else None for s, c in zip(sums, counts)], counts
+
+
+def rolling_mean(means, counts, window):
+    """Trailing `window`-day mean of the underlying values, weighting each day by its count."""
+    if np is not None:
+        weights = np.asarray(counts, dtype=float)
+        sums = np.asarray([m or 0.0 for m in means]) * weights
+        kernel = np.ones(window)
+        total = np.convolve(sums, kernel)[:len(means)]
+        count = np.convolve(weights, kernel)[:len(means)]
+        return [float(t / c) if c else None for t, c in zip(total, count)]
+    rolled, total, count = [], 0.0, 0
+    for i, (mean, n) in enumerate(zip(means, counts)):
+        total += (mean or 0.0) * n
+        count += n
+        if i >= window:
+            total -= (means[i - window] or 0.0) * counts[i - window]
+            count -= counts[i - window]
+        rolled.append(total / count if count else None)
+    return rolled
+
+
+# --- Queries ---
+def _window(days):
+    """[start, end) dates of the last `days` complete days."""
+    end = datetime.utcnow().date()
+    return end - timedelta(days=days), end
+
+
+def _result_rows(start, end, plant_id=None, product_id=None, parameter=None):
+    """(parameter, day index, value) rows of numeric results of reports created in [start, end), in time order."""
+    created = func.julianday(QualityReport.created_at)
+    statement = select(
+        ReportTemplate.parameter, func.cast(created - func.julianday(start.isoformat()), db.Integer),
+        ReportResult.result_numeric,
+    ).join(QualityReport, QualityReport.id == ReportResult.report_id
+    ).join(ReportTemplate, ReportTemplate.id == ReportResult.template_id
+    ).where(ReportResult.result_numeric.isnot(None),
+            QualityReport.created_at >= start, QualityReport.created_at < end)
+    # Report ids follow creation time, so the first id in the window bounds the
+    # result scan (via idx_result_report) without an index on created_at, and
+    # ordering by report id needs no sort
+    first_id = db.session.query(func.min(QualityReport.id)).filter(QualityReport.created_at >= start).scalar()
+    if first_id is None:
+        return []
+    statement = statement.where(ReportResult.report_id >= first_id)
+    if plant_id is not None:
+        statement = statement.where(QualityReport.plant_id == plant_id)
+    if product_id is not None:
+        statement = statement.where(QualityReport.product_id == product_id)
+    if parameter is not None:
+        # Narrows the scan to the parameter's templates through idx_result_template_report
+        template_ids = select(ReportTemplate.id).where(ReportTemplate.parameter == parameter)
+        statement = statement.where(ReportResult.template_id.in_(template_ids))
+    return db.session.connection().execute(statement.order_by(ReportResult.report_id, ReportResult.id)).all()
+
+
+def overview(days=30, plant_id=None, product_id=None):
+    """Summary and control limits for every parameter with numeric results in the last `days` days."""
+    start, end = _window(days)
+    values = {}
+    for parameter, _, value in _result_rows(start, end, plant_id, product_id):
+        values.setdefault(parameter, []).append(value)
+    parameters = [{'parameter': parameter, **describe(series), 'limits': control_limits(series)}
+                  for parameter, series in values.items()]
+    parameters.sort(key=lambda entry: entry['parameter'])
+    return {'start': start.isoformat(), 'end': (end - timedelta(days=1)).isoformat(), 'days': days,
+            'numpy': np is not None, 'parameters': parameters}
+
+
+def trend(parameter, days=90, plant_id=None, product_id=None, window=7):
+    """Daily means, a `window`-day rolling mean and control limits of one parameter."""
+    start, end = _window(days)
+    rows = _result_rows(start, end, plant_id, product_id, parameter)
+    day_index = [day for _, day, _ in rows]
+    values = [value for _, _, value in rows]
+    means, counts = daily_means(day_index, values, days)
+    return {
+        'parameter': parameter, 'start': start.isoformat(), 'end': (end - timedelta(days=1)).isoformat(),
+        'days': days, 'window': window, 'numpy': np is not None,
+        'labels': [(start + timedelta(days=i)).isoformat() for i in range(days)],
+        'daily_mean': means, 'counts': counts, 'rolling_mean': rolling_mean(means, counts, window),
+        'summary': describe(values), 'limits': control_limits(values),
+    }
+
+
+def cached(name, builder, **arguments):
+    """builder(**arguments), cached in the shared cache until the date changes."""
+    key = f"{name}:{datetime.utcnow().date().isoformat()}:" + json.dumps(arguments, sort_keys=True)
+    cache = sharedcache.get_cache()
+    if cache is not None:
+        data = cache.get(CACHE_NAMESPACE, key)
+        if data is not None:
+            return json.loads(bytes(data))
+    result = builder(**arguments)
+    if cache is not None:
+        try:
+            cache.set(CACHE_NAMESPACE, key, json.dumps(result, separators=(',', ':')).encode('utf-8'))
+        except Exception as e:
+            current_app.logger.error(f"Could not cache statistics '{name}': {e}")
+    return result
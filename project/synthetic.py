@@ -0,0 +1,297 @@
+# project/synthetic.py
+# Deterministic synthetic dataset generator for scale testing.
+
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash
+
+from . import analytics, db, sketches
+from .commands import default_template_rows
+from .compliance import parse_number
+
+# --- Distributions ---
+# Consumer traffic peaks in the morning and evening around milk delivery.
+HOURLY_WEIGHTS = [1, 1, 1, 1, 2, 4, 8, 10, 9, 7, 6, 5, 5, 5, 4, 4, 5, 7, 9, 10, 8, 5, 3, 2]
+
+EVENT_TYPE_WEIGHTS = [('PAGE_VIEW', 60), ('REPORT_VIEW', 30), ('REPORT_DOWNLOAD', 10)]
+
+USER_AGENTS = [
+    ('Mozilla/5.0 (Linux; Android 13; SM-A536E) AppleWebKit/537.36 (KHTML, like Gecko) '
+     'Chrome/120.0.0.0 Mobile Safari/537.36', 40),
+    ('Mozilla/5.0 (Linux; Android 12; Redmi Note 11) AppleWebKit/537.36 (KHTML, like Gecko) '
+     'Chrome/119.0.0.0 Mobile Safari/537.36', 25),
+    ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+     'Version/17.1 Mobile/15E148 Safari/604.1', 15),
+    ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+     'Chrome/120.0.0.0 Safari/537.36', 12),
+    ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+     'Version/17.0 Safari/605.1.15', 5),
+    ('Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)', 3),
+]
+
+BATCH_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+BATCH_SPACE = len(BATCH_ALPHABET) ** 5
+# A multiplier coprime with 36**5 turns a sequential counter into a
+# scattered but collision-free sequence of 5-character batch codes.
+BATCH_STRIDE = 7_919_777
+
+
+def _batch_code(n, offset):
+    value = (n * BATCH_STRIDE + offset) % BATCH_SPACE
+    chars = []
+    for _ in range(5):
+        value, digit = divmod(value, 36)
+        chars.append(BATCH_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def _result_value(rng, specification):
+    """Produces a plausible result string for a template specification."""
+    spec = specification.strip()
+    if spec.lower() == 'negative':
+        return 'Negative'
+    numbers = []
+    for token in spec.replace('-', ' ').replace('%', ' ').split():
+        try:
+            numbers.append(float(token.rstrip('hrsmlg.')))
+        except ValueError:
+            continue
+    if len(numbers) >= 2:
+        return f"{rng.uniform(numbers[0], numbers[1]):.1f}"
+    if numbers:
+        return f"{numbers[0] * rng.uniform(1.0, 1.15):.2f}"
+    return 'Conforms'
+
+
+def _format_dt(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _next_id(conn, table):
+    return (conn.exec_driver_sql(f"SELECT MAX(id) FROM {table}").scalar() or 0) + 1
+
+
+def _insert_chunks(conn, sql, rows, chunk_size):
+    """Sends `rows` (any iterable of tuples) to executemany in chunks."""
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            conn.exec_driver_sql(sql, chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        conn.exec_driver_sql(sql, chunk)
+        count += len(chunk)
+    return count
+
+
+# --- Generator ---
+def generate_synthetic(plants=10, products=5, reports=10000, events=100000, seed=1,
+                       chunk_size=10000, days=365, end_date=None, extra_templates=0, echo=None):
+    """
+    Bulk-creates a synthetic dataset alongside any existing data and returns
+    the number of rows written per table. Output depends only on the
+    arguments, so the same seed and end date reproduce the same dataset.
+    """
+    echo = echo or (lambda message: None)
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    start_dt = datetime.combine(end_date - timedelta(days=days - 1), datetime.min.time())
+
+    conn = db.session.connection()
+    if conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql('PRAGMA synchronous=OFF')
+    counts = {}
+
+    # --- 1. Plants and one QA user per plant ---
+    plant_id = _next_id(conn, 'plant')
+    user_id = _next_id(conn, 'user')
+    password_hash = generate_password_hash('synthetic')
+    plant_rows, user_rows = [], []
+    for i in range(plants):
+        pid = plant_id + i
+        name = f"Synthetic Plant {pid:05d}"
+        plant_rows.append((pid, name, f"SYN{pid:05d}"))
+        user_rows.append((user_id + i, f"synthetic_qa_{pid:05d}", password_hash, 'qa', name, pid))
+    conn.exec_driver_sql('INSERT INTO plant (id, name, code) VALUES (?, ?, ?)', plant_rows)
+    conn.exec_driver_sql(
+        'INSERT INTO user (id, username, password_hash, role, plant_name, plant_id) '
+        'VALUES (?, ?, ?, ?, ?, ?)', user_rows)
+    counts['plant'] = counts['user'] = plants
+    echo(f"Created {plants} plants and QA users.")
+
+    # --- 2. Products, plant links and templates ---
+    product_id = _next_id(conn, 'product')
+    template_id = _next_id(conn, 'report_template')
+    product_rows, link_rows, template_rows = [], [], []
+    product_templates = {}
+    for i in range(products):
+        prod_id = product_id + i
+        is_cow_milk = i % 2 == 1
+        product_rows.append((prod_id, f"Synthetic Milk {prod_id:04d}", f"SYN_{prod_id:05d}"))
+        link_rows.extend((plant_rows[p][0], prod_id) for p in range(plants))
+
+        specs = list(default_template_rows(is_cow_milk))
+        for extra in range(extra_templates):
+            specs.append((f"Extra Parameter {extra + 1}", f"Max {rng.randint(5, 500)}", 'Analyser', 0))
+        product_templates[prod_id] = []
+        for order, (param, spec, method, _) in enumerate(specs, 1):
+            template_rows.append((template_id, prod_id, param, spec, method, order))
+            product_templates[prod_id].append((template_id, spec))
+            template_id += 1
+    conn.exec_driver_sql('INSERT INTO product (id, name, sku) VALUES (?, ?, ?)', product_rows)
+    conn.exec_driver_sql(
+        'INSERT INTO plant_product_association (plant_id, product_id) VALUES (?, ?)', link_rows)
+    conn.exec_driver_sql(
+        'INSERT INTO report_template (id, product_id, parameter, specification, method, "order") '
+        'VALUES (?, ?, ?, ?, ?, ?)', template_rows)
+    counts['product'] = products
+    counts['report_template'] = len(template_rows)
+    echo(f"Created {products} products with {len(template_rows)} templates.")
+
+    # --- 3. Reports with results and machine codes ---
+    report_id = _next_id(conn, 'quality_report')
+    code_offset = rng.randrange(BATCH_SPACE)
+    product_ids = [row[0] for row in product_rows]
+    span_seconds = days * 86400
+    result_rows = []
+    result_count = 0
+    report_count = 0
+    report_sql = ('INSERT INTO quality_report (id, product_id, user_id, batch_code, machine_codes, '
+                  'expiry_date, plant_name, plant_id, created_at, updated_at) '
+                  'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+    result_sql = 'INSERT INTO report_result (report_id, template_id, result_value, result_numeric) VALUES (?, ?, ?, ?)'
+
+    report_chunk = []
+    for n in range(reports):
+        plant_index = rng.randrange(plants)
+        pid, plant_name, _ = plant_rows[plant_index]
+        prod_id = rng.choice(product_ids)
+        created_at = start_dt + timedelta(seconds=int(span_seconds * n / max(reports, 1)) + rng.randrange(60))
+        machine_codes = None
+        if rng.random() < 0.4:
+            prefix = rng.choice('ABCD')
+            machine_codes = ','.join(f"{prefix}{h}" for h in range(1, rng.randint(2, 24) + 1))
+        expiry = (created_at + timedelta(days=rng.randint(2, 5))).strftime('%Y-%m-%d')
+        report_chunk.append((report_id + n, prod_id, user_rows[plant_index][0],
+                             _batch_code(n, code_offset), machine_codes, expiry,
+                             plant_name, pid, _format_dt(created_at), _format_dt(created_at)))
+        for tid, spec in product_templates[prod_id]:
+            value = _result_value(rng, spec)
+            result_rows.append((report_id + n, tid, value, parse_number(value)))
+
+        if len(report_chunk) >= chunk_size:
+            conn.exec_driver_sql(report_sql, report_chunk)
+            report_count += len(report_chunk)
+            report_chunk = []
+        if len(result_rows) >= chunk_size:
+            conn.exec_driver_sql(result_sql, result_rows)
+            result_count += len(result_rows)
+            result_rows = []
+    if report_chunk:
+        conn.exec_driver_sql(report_sql, report_chunk)
+        report_count += len(report_chunk)
+    if result_rows:
+        conn.exec_driver_sql(result_sql, result_rows)
+        result_count += len(result_rows)
+    counts['quality_report'] = report_count
+    counts['report_result'] = result_count
+    echo(f"Created {report_count} reports with {result_count} results.")
+
+    # --- 4. Analytics events ---
+    # A small set of heavy visitors plus a long tail: index = pool * u**3
+    # concentrates most events on the first few hundred addresses.
+    ip_pool_size = max(1000, events // 20)
+    event_types = [name for name, _ in EVENT_TYPE_WEIGHTS]
+    event_weights = [weight for _, weight in EVENT_TYPE_WEIGHTS]
+    agent_weights = [weight for _, weight in USER_AGENTS]
+    hours = list(range(24))
+
+    def _ip(index):
+        return f"{49 + index % 150}.{(index >> 8) % 256}.{(index >> 16) % 256}.{index % 256}"
+
+    # Events reference dictionary rows, so fill the dictionaries up front
+    salt = current_app.config.get('ANALYTICS_IP_SALT') or current_app.config['SECRET_KEY']
+    agent_digests = [analytics.user_agent_digest(agent) for agent, _ in USER_AGENTS]
+    ip_hashes = [analytics.hash_ip(_ip(index), salt) for index in range(ip_pool_size)]
+    _insert_chunks(conn, 'INSERT OR IGNORE INTO analytics_user_agent (digest, user_agent) VALUES (?, ?)',
+                   zip(agent_digests, (agent for agent, _ in USER_AGENTS)), chunk_size)
+    _insert_chunks(conn, 'INSERT OR IGNORE INTO analytics_visitor (ip_hash) VALUES (?)',
+                   ((ip_hash,) for ip_hash in ip_hashes), chunk_size)
+    agent_ids = dict(conn.exec_driver_sql('SELECT digest, id FROM analytics_user_agent').all())
+    visitor_ids = dict(conn.exec_driver_sql('SELECT ip_hash, id FROM analytics_visitor').all())
+    agents = [agent_ids[digest] for digest in agent_digests]
+    visitors = [visitor_ids[ip_hash] for ip_hash in ip_hashes]
+    visitor_hashes = [sketches.visitor_hash(ip_hash) for ip_hash in ip_hashes]
+    daily_sketches = {}
+
+    def event_rows():
+        remaining = events
+        while remaining > 0:
+            batch = min(chunk_size, remaining)
+            types = rng.choices(event_types, event_weights, k=batch)
+            ua = rng.choices(agents, agent_weights, k=batch)
+            hour = rng.choices(hours, HOURLY_WEIGHTS, k=batch)
+            for i in range(batch):
+                # Traffic grows over the period, so later days are denser
+                day = int(days * rng.random() ** 0.7)
+                ts = start_dt + timedelta(days=day, hours=hour[i], seconds=rng.randrange(3600))
+                visitor = int(ip_pool_size * rng.random() ** 3)
+                if day not in daily_sketches:
+                    daily_sketches[day] = sketches.HyperLogLog()
+                daily_sketches[day].add(visitor_hashes[visitor])
+                yield (types[i], _format_dt(ts), visitors[visitor], ua[i])
+            remaining -= batch
+
+    counts['analytics_event'] = _insert_chunks(
+        conn,
+        'INSERT INTO analytics_event (event_type, timestamp, visitor_id, user_agent_id) VALUES (?, ?, ?, ?)',
+        event_rows(), chunk_size)
+    echo(f"Created {counts['analytics_event']} analytics events.")
+    sketches.save({((start_dt + timedelta(days=day)).date(), 'all'): sketch for day, sketch in daily_sketches.items()})
+
+    db.session.commit()
+    if conn.dialect.name == 'sqlite':
+        db.session.connection().exec_driver_sql('PRAGMA synchronous=FULL')
+    return counts
+
+
+# --- CLI ---
+@click.command('gen-synthetic')
+@with_appcontext
+@click.option('--plants', default=10, show_default=True, help='Number of plants to create.')
+@click.option('--products', default=5, show_default=True, help='Number of products to create.')
+@click.option('--reports', default=10000, show_default=True, help='Number of quality reports to create.')
+@click.option('--events', default=100000, show_default=True, help='Number of analytics events to create.')
+@click.option('--extra-templates', default=0, show_default=True, help='Templates per product beyond the standard 26.')
+@click.option('--days', default=365, show_default=True, help='Length of the generated history in days.')
+@click.option('--end-date', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Last day of the history (default: today).')
+@click.option('--seed', default=1, show_default=True, help='Random seed.')
+@click.option('--chunk-size', default=10000, show_default=True, help='Rows per executemany call.')
+def gen_synthetic_command(plants, products, reports, events, extra_templates, days, end_date, seed, chunk_size):
+    """Bulk-generates a deterministic synthetic dataset for scale testing."""
+    if plants < 1 or products < 1:
+        click.echo('Error: --plants and --products must be at least 1.', err=True)
+        return
+
+    started = time.perf_counter()
+    counts = generate_synthetic(
+        plants=plants, products=products, reports=reports, events=events, seed=seed,
+        chunk_size=chunk_size, days=days, end_date=end_date.date() if end_date else None,
+        extra_templates=extra_templates, echo=click.echo)
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    click.echo(f"Synthetic dataset complete: {total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s).")
+
+
+def init_app(app):
+    """Registers the synthetic data command with the Flask app."""
+    app.cli.add_command(gen_synthetic_command)
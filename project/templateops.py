@@ -0,0 +1,162 @@
+# project/templateops.py
+# Batch edits of one product's report templates.
+#
+# The template manager sends every pending change as one list of operations:
+#   {"op": "add", "parameter": ..., "specification": ..., "method": ..., "order": 3}
+#   {"op": "edit", "id": 12, "specification": ..., "order": 4}   (either field)
+#   {"op": "delete", "id": 12}
+#   {"op": "reorder", "ids": [14, 12, 13]}   (orders 1..n in that sequence)
+# Operations apply in list order to an in-memory copy of the templates; the
+# result must give every remaining template a distinct positive order. Only
+# then is the difference written, in one transaction: one DELETE, one
+# executemany UPDATE and one executemany INSERT, whatever the number of rows.
+# As in the single-row routes, parameter and method of a saved template are
+# locked.
+#
+# Product.template_version counts changes to a product's templates. A batch
+# that names the version it was edited from fails with VersionConflict if
+# anything changed since, instead of overwriting someone else's edit.
+
+from sqlalchemy import delete, insert, update
+
+from . import db
+from .models import Product, ReportTemplate
+
+MAX_OPERATIONS = 500
+TEXT_LIMITS = {'parameter': 200, 'specification': 200, 'method': 100}
+
+
+class VersionConflict(Exception):
+    """The templates changed after the client loaded them."""
+
+    def __init__(self, version):
+        super().__init__(f"The templates were changed elsewhere (now version {version}). Reload and try again.")
+        self.version = version
+
+
+def bump_version(product_id):
+    """Counts a change to the product's templates; part of the caller's transaction."""
+    db.session.execute(update(Product).where(Product.id == product_id).values(
+        template_version=Product.template_version + 1).execution_options(synchronize_session=False))
+
+
+def _text(operation, field, index):
+    value = operation.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"Operation {index + 1}: '{field}' is required.")
+    value = value.strip()
+    if len(value) > TEXT_LIMITS[field]:
+        raise ValueError(f"Operation {index + 1}: '{field}' is longer than {TEXT_LIMITS[field]} characters.")
+    return value
+
+
+def _order(value, index):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"Operation {index + 1}: 'order' must be a positive whole number.")
+    try:
+        order = int(value)
+    except ValueError:
+        raise ValueError(f"Operation {index + 1}: 'order' must be a positive whole number.") from None
+    if order < 1:
+        raise ValueError(f"Operation {index + 1}: 'order' must be a positive whole number.")
+    return order
+
+
+def plan(current, operations):
+    """
+    Applies `operations` to `current` ({id: {'specification', 'order', ...}})
+    without touching the database. Returns (edits {id: changed fields},
+    deleted ids, new template rows). Raises ValueError for an invalid batch.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('Expected a non-empty list of operations.')
+    if len(operations) > MAX_OPERATIONS:
+        raise ValueError(f"At most {MAX_OPERATIONS} operations per batch.")
+
+    state = {template_id: dict(fields) for template_id, fields in current.items()}
+    added, deleted = [], set()
+
+    def existing(operation, index):
+        template_id = operation.get('id')
+        if isinstance(template_id, bool) or not isinstance(template_id, int):
+            raise ValueError(f"Operation {index + 1}: 'id' must be a template id (a whole number).")
+        if template_id in deleted:
+            raise ValueError(f"Operation {index + 1}: template {template_id} is already deleted.")
+        if template_id not in state:
+            raise ValueError(f"Operation {index + 1}: template {template_id!r} does not belong to this product.")
+        return template_id
+
+    for index, operation in enumerate(operations):
+        kind = operation.get('op') if isinstance(operation, dict) else None
+        if kind == 'add':
+            added.append({name: _text(operation, name, index) for name in ('parameter', 'specification', 'method')}
+                         | {'order': _order(operation.get('order'), index)})
+        elif kind == 'edit':
+            template_id = existing(operation, index)
+            if 'specification' not in operation and 'order' not in operation:
+                raise ValueError(f"Operation {index + 1}: nothing to edit.")
+            if 'specification' in operation:
+                state[template_id]['specification'] = _text(operation, 'specification', index)
+            if 'order' in operation:
+                state[template_id]['order'] = _order(operation['order'], index)
+        elif kind == 'delete':
+            deleted.add(existing(operation, index))
+            del state[operation['id']]
+        elif kind == 'reorder':
+            ids = operation.get('ids')
+            if not isinstance(ids, list) or len(set(map(repr, ids))) != len(ids):
+                raise ValueError(f"Operation {index + 1}: 'ids' must list distinct template ids.")
+            for position, template_id in enumerate(ids, start=1):
+                state[existing({'id': template_id}, index)]['order'] = position
+        else:
+            raise ValueError(f"Operation {index + 1}: unknown op {kind!r} (add, edit, delete or reorder).")
+
+    # Every remaining template needs its own position on the report
+    positions = {}
+    for fields in list(state.values()) + added:
+        positions.setdefault(fields['order'], []).append(fields['parameter'])
+    clashes = {order: names for order, names in positions.items() if len(names) > 1}
+    if clashes:
+        details = '; '.join(f"{order}: {', '.join(names)}" for order, names in sorted(clashes.items()))
+        raise ValueError(f"Each template needs a distinct order. Shared orders: {details}.")
+
+    edits = {}
+    for template_id, fields in state.items():
+        changed = {name: fields[name] for name in ('specification', 'order')
+                   if fields[name] != current[template_id][name]}
+        if changed:
+            edits[template_id] = changed
+    return edits, deleted, added
+
+
+def apply(product, operations, base_version=None):
+    """
+    Validates and writes a batch for `product` in one transaction. Returns
+    (new version, ids of templates whose specification changed, deleted ids).
+    Raises ValueError or VersionConflict; the caller commits.
+    """
+    if base_version is not None and base_version != product.template_version:
+        raise VersionConflict(product.template_version)
+    current = {template_id: {'parameter': parameter, 'specification': specification, 'order': order}
+               for template_id, parameter, specification, order in db.session.query(
+                   ReportTemplate.id, ReportTemplate.parameter, ReportTemplate.specification, ReportTemplate.order
+               ).filter(ReportTemplate.product_id == product.id)}
+    edits, deleted, added = plan(current, operations)
+
+    # The conditional bump takes the write lock first, so a concurrent batch
+    # from the same version finds no row to update
+    bumped = db.session.execute(update(Product).where(
+        Product.id == product.id, Product.template_version == product.template_version
+    ).values(template_version=Product.template_version + 1).execution_options(synchronize_session=False))
+    if bumped.rowcount != 1:
+        raise VersionConflict(db.session.query(Product.template_version).filter(Product.id == product.id).scalar())
+
+    if deleted:
+        db.session.execute(delete(ReportTemplate).where(ReportTemplate.id.in_(deleted))
+                           .execution_options(synchronize_session=False))
+    if edits:
+        db.session.execute(update(ReportTemplate), [{'id': template_id, **fields} for template_id, fields in edits.items()])
+    if added:
+        db.session.execute(insert(ReportTemplate), [{'product_id': product.id, **fields} for fields in added])
+    spec_changed = [template_id for template_id, fields in edits.items() if 'specification' in fields]
+    return product.template_version + 1, spec_changed, deleted
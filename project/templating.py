@@ -0,0 +1,79 @@
+# project/templating.py
+# Persistent Jinja bytecode cache and template precompilation.
+
+import os
+import time
+from hashlib import sha1
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+from jinja2.bccache import Bucket
+
+
+class SourceHashBytecodeCache(FileSystemBytecodeCache):
+    """
+    A filesystem bytecode cache keyed by template name *and* source hash.
+    An edited template gets a new cache file instead of overwriting the
+    old one, so workers running different deploys never fight over a file.
+    """
+
+    def get_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        key = sha1(f"{name}|{checksum}".encode('utf-8')).hexdigest()
+        bucket = Bucket(environment, key, checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+
+def cache_directory(app):
+    return os.path.join(app.instance_path, 'jinja_cache')
+
+
+def precompile_templates(app, clear=False):
+    """
+    Compiles every HTML template into the bytecode cache.
+    Returns (compiled count, {template name: error} for templates that fail to parse).
+    """
+    cache = app.jinja_env.bytecode_cache
+    if clear and cache is not None:
+        cache.clear()
+    compiled, errors = 0, {}
+    for name in app.jinja_env.list_templates():
+        if not name.endswith('.html'):
+            continue
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except TemplateSyntaxError as e:
+            errors[name] = f"line {e.lineno}: {e.message}"
+    return compiled, errors
+
+
+@click.command('precompile-templates')
+@with_appcontext
+@click.option('--clear', is_flag=True, default=False, help='Remove stale cache files first.')
+def precompile_templates_command(clear):
+    """Compiles all templates ahead of time into the bytecode cache."""
+    if current_app.jinja_env.bytecode_cache is None:
+        click.echo('Warning: JINJA_BYTECODE_CACHE is disabled; templates are compiled in memory only.')
+    started = time.perf_counter()
+    count, errors = precompile_templates(current_app, clear=clear)
+    elapsed = (time.perf_counter() - started) * 1000
+    click.echo(f"Precompiled {count} templates in {elapsed:.0f} ms.")
+    for name, error in errors.items():
+        click.echo(f"Warning: Could not compile {name} ({error}).", err=True)
+
+
+def init_app(app):
+    """Configures the bytecode cache (before the Jinja env is created) and the CLI."""
+    app.cli.add_command(precompile_templates_command)
+    if not app.config.get('JINJA_BYTECODE_CACHE', True):
+        return
+    directory = cache_directory(app)
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': SourceHashBytecodeCache(directory)}
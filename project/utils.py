@@ -1,5 +1,4 @@
 import os
-from fpdf import FPDF
 from flask import current_app
 
 # --- Text Cleaning ---
@@ -28,6 +27,8 @@ def get_line_count_fast(text, col_width, char_width=2.5):
 # --- PDF Generation ---
 def generate_report_pdf(report, results):
     """Generates PDF report and returns bytes."""
+    # Imported here so fpdf only loads when a PDF is actually requested
+    from fpdf import FPDF
 
     # Precompute image paths (check existence once)
     logo_path = os.path.join(current_app.static_folder, 'heritage-logo.png')
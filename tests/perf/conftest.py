@@ -0,0 +1,141 @@
+# tests/perf/conftest.py
+# Fixtures for the route performance suite: a scale-seeded SQLite database,
+# a query counter on the engine and a calibration timing for this machine.
+
+import json
+import os
+import statistics
+import threading
+import time
+from datetime import date
+
+import pytest
+from sqlalchemy import event, text
+
+from config import Config
+from project import create_app, db, rollups
+from project.models import User
+from project.synthetic import generate_synthetic
+
+# Scale of the seeded dataset; override for heavier local runs.
+PERF_REPORTS = int(os.environ.get('PERF_REPORTS', 20000))
+PERF_EVENTS = int(os.environ.get('PERF_EVENTS', 200000))
+PERF_REPORT_PATH = os.environ.get(
+    'PERF_REPORT_PATH', os.path.join(os.path.dirname(__file__), 'perf_report.json'))
+
+SUPERADMIN = ('perf_superadmin', 'perf-password')
+QA_USER = ('synthetic_qa_00001', 'synthetic')
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    db_path = tmp_path_factory.mktemp('perf') / 'perf.db'
+
+    class PerfConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+        QUERY_STATS_ENABLED = False
+        RATE_LIMIT_ENABLED = False
+        TESTING = True
+
+    app = create_app(PerfConfig)
+    with app.app_context():
+        db.create_all()
+        generate_synthetic(plants=4, products=2, reports=PERF_REPORTS, events=PERF_EVENTS,
+                           seed=29, end_date=date.today(), days=90)
+        superadmin = User(username=SUPERADMIN[0], role='superadmin', plant_name='Corporate')
+        superadmin.set_password(SUPERADMIN[1])
+        db.session.add(superadmin)
+        db.session.commit()
+        # The worker keeps complete hours and days rolled up; measure that steady state
+        rollups.rollup()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture(scope='session')
+def query_counter(app):
+    """
+    Counts statements sent to the engine by the measuring thread while the
+    counter is active; background writers on other threads are ignored.
+    """
+
+    class Counter:
+        def __init__(self):
+            self.active = False
+            self.count = 0
+            self.thread_id = None
+
+        def __enter__(self):
+            self.count = 0
+            self.thread_id = threading.get_ident()
+            self.active = True
+            return self
+
+        def __exit__(self, *exc):
+            self.active = False
+
+    counter = Counter()
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if counter.active and threading.get_ident() == counter.thread_id:
+            counter.count += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _count)
+    return counter
+
+
+@pytest.fixture(scope='session')
+def calibration_ms(app):
+    """
+    Median time of a fixed reference workload (500 indexed point lookups
+    plus a small template render) on this machine. Wall-time budgets are
+    expressed as multiples of it, so they hold on slow and fast hardware.
+    """
+    samples = []
+    with app.test_request_context():
+        from flask import render_template_string
+        for _ in range(7):
+            start = time.perf_counter()
+            for report_id in range(1, 501):
+                db.session.execute(text('SELECT batch_code FROM quality_report WHERE id = :id'),
+                                   {'id': report_id}).scalar()
+            render_template_string('{% for i in range(200) %}<td>{{ i }}</td>{% endfor %}')
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+@pytest.fixture(scope='session')
+def perf_results(calibration_ms):
+    """Collects per-route measurements and writes them as JSON at session end."""
+    results = {}
+    yield results
+    payload = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'dataset': {'reports': PERF_REPORTS, 'events': PERF_EVENTS},
+        'calibration_ms': round(calibration_ms, 3),
+        'routes': results,
+    }
+    with open(PERF_REPORT_PATH, 'w', encoding='utf-8') as fh:
+        json.dump(payload, fh, indent=2)
+
+
+def _login(client, credentials):
+    client.post('/qa/login', data={'username': credentials[0], 'password': credentials[1]})
+    return client
+
+
+@pytest.fixture
+def anon_client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def qa_client(app):
+    return _login(app.test_client(), QA_USER)
+
+
+@pytest.fixture
+def superadmin_client(app):
+    return _login(app.test_client(), SUPERADMIN)
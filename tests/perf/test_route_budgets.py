@@ -0,0 +1,130 @@
+# tests/perf/test_route_budgets.py
+# Query-count and wall-time budgets for the hot routes.
+#
+# Query budgets are exact upper bounds for the current implementation: a new
+# N+1 pattern fails the test immediately. Time budgets are multiples of the
+# calibration workload, so they catch order-of-magnitude regressions (e.g. a
+# doubled PDF render) without flaking on slower machines.
+
+import statistics
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from project.models import Product, QualityReport
+
+pytestmark = pytest.mark.perf
+
+REPEAT = 5
+
+
+@pytest.fixture(scope='module')
+def sample(app):
+    with app.app_context():
+        plain = QualityReport.query.filter(QualityReport.machine_codes.is_(None)).first()
+        machine = QualityReport.query.filter(QualityReport.machine_codes.isnot(None)).first()
+        return {
+            'plain_code': plain.batch_code,
+            'machine_code': machine.batch_code + machine.machine_codes.split(',')[0],
+            'report_id': machine.id,
+            'report_machine': machine.machine_codes.split(',')[0],
+            'product_id': Product.query.order_by(Product.id).first().id,
+            'year_ago': (date.today() - timedelta(days=364)).isoformat(),
+        }
+
+
+def measure(client, method, path, query_counter, data=None, expect_status=200):
+    """Returns (median wall ms, max query count) over REPEAT warm requests."""
+    response = client.open(path, method=method, data=data)
+    assert response.status_code == expect_status, f"{method} {path} -> {response.status_code}"
+
+    timings, counts = [], []
+    for _ in range(REPEAT):
+        with query_counter:
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            timings.append((time.perf_counter() - start) * 1000)
+        counts.append(query_counter.count)
+        assert response.status_code == expect_status
+    return statistics.median(timings), max(counts)
+
+
+def check_budget(name, elapsed_ms, queries, max_queries, max_factor,
+                 calibration_ms, perf_results):
+    perf_results[name] = {
+        'median_ms': round(elapsed_ms, 3),
+        'queries': queries,
+        'query_budget': max_queries,
+        'time_budget_ms': round(max_factor * calibration_ms, 3),
+        'relative_time': round(elapsed_ms / calibration_ms, 3),
+    }
+    assert queries <= max_queries, f"{name}: {queries} queries (budget {max_queries})"
+    assert elapsed_ms <= max_factor * calibration_ms, (
+        f"{name}: {elapsed_ms:.1f} ms exceeds {max_factor}x calibration ({calibration_ms:.1f} ms)")
+
+
+# (name, client fixture, method, path template, form data, query budget, time factor[, status])
+ROUTES = [
+    ('index_get', 'anon_client', 'GET', '/', None, 0, 1),
+    # The form only redirects; view_report() does the lookup
+    ('index_post_plain', 'anon_client', 'POST', '/', {'batch-code': '{plain_code}'}, 0, 1, 303),
+    ('index_post_machine', 'anon_client', 'POST', '/', {'batch-code': '{machine_code}'}, 0, 1, 303),
+    ('index_post_short', 'anon_client', 'POST', '/', {'batch-code': 'ZZZ'}, 0, 1),
+    ('view_report_invalid', 'anon_client', 'GET', '/report/ZZZZZ', None, 0, 1),
+    ('view_report_plain', 'anon_client', 'GET', '/report/{plain_code}', None, 32, 5),
+    ('view_report_machine', 'anon_client', 'GET', '/report/{machine_code}', None, 32, 5),
+    ('download_pdf_report', 'anon_client', 'GET',
+     '/download/report/{report_id}?machine_code={report_machine}', None, 3, 2),  # Shared-cache hit
+    ('qa_dashboard', 'qa_client', 'GET', '/qa/dashboard', None, 5, 2),
+    ('superadmin_dashboard', 'superadmin_client', 'GET', '/superadmin/dashboard', None, 13, 60),
+    ('get_templates_for_product', 'qa_client', 'GET', '/api/templates/{product_id}', None, 3, 1),
+    ('analytics_series_year', 'superadmin_client', 'GET',
+     '/api/analytics/series?start={year_ago}&granularity=month&breakdown=product', None, 6, 2),
+    ('stats_overview_year', 'superadmin_client', 'GET', '/api/stats/overview?days=365', None, 4, 5),
+    ('search_reports', 'superadmin_client', 'GET', '/api/reports/search?q={plain_code}', None, 5, 1),
+    ('qa_dashboard_search', 'qa_client', 'GET', '/qa/dashboard?q={plain_code}', None, 5, 2),
+    ('batch_code_suggest', 'qa_client', 'GET', '/api/batch-codes/suggest?prefix={plain_code[0]}', None, 1, 1),
+    ('batch_code_check', 'qa_client', 'GET', '/api/batch-codes/check?code={plain_code}', None, 2, 1),
+    ('machine_code_preview', 'qa_client', 'GET', '/api/machine-codes/preview?expression=A1-A24,B*,!A13', None, 1, 1),
+]
+
+
+@pytest.mark.parametrize('route', ROUTES, ids=[route[0] for route in ROUTES])
+def test_route_budget(request, sample, query_counter, calibration_ms, perf_results, route):
+    name, client_fixture, method, path, data, max_queries, max_factor = route[:7]
+    expect_status = route[7] if len(route) > 7 else 200
+    client = request.getfixturevalue(client_fixture)
+    path = path.format(**sample)
+    if data:
+        data = {key: value.format(**sample) for key, value in data.items()}
+
+    elapsed_ms, queries = measure(client, method, path, query_counter, data=data,
+                                  expect_status=expect_status)
+    check_budget(name, elapsed_ms, queries, max_queries, max_factor, calibration_ms, perf_results)
+
+
+# Conditional requests: a repeat view with a matching validator must skip the render
+CONDITIONAL_ROUTES = [
+    ('view_report_304', '/report/{machine_code}', 3),
+    ('download_pdf_report_304', '/download/report/{report_id}?machine_code={report_machine}', 3),
+]
+
+
+@pytest.mark.parametrize('name,path,max_queries', CONDITIONAL_ROUTES,
+                         ids=[route[0] for route in CONDITIONAL_ROUTES])
+def test_conditional_budget(anon_client, sample, query_counter, calibration_ms, perf_results,
+                            name, path, max_queries):
+    path = path.format(**sample)
+    etag = anon_client.get(path).headers['ETag']
+
+    timings, counts = [], []
+    for _ in range(REPEAT):
+        with query_counter:
+            start = time.perf_counter()
+            response = anon_client.get(path, headers={'If-None-Match': etag})
+            timings.append((time.perf_counter() - start) * 1000)
+        counts.append(query_counter.count)
+        assert response.status_code == 304
+    check_budget(name, statistics.median(timings), max(counts), max_queries, 1,
+                 calibration_ms, perf_results)
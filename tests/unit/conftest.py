@@ -0,0 +1,64 @@
+# tests/unit/conftest.py
+# Fixtures for the unit tests: an app on an empty SQLite database per test.
+
+from datetime import date
+
+import pytest
+
+from config import Config
+from project import create_app, db
+from project.models import Product, QualityReport, User
+
+
+@pytest.fixture
+def app_config():
+    """Config overrides for the app fixture; override this fixture in a test module."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    class UnitConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'unit.db'}"
+        QUERY_STATS_ENABLED = False
+        RATE_LIMIT_ENABLED = False
+        TESTING = True
+
+    for name, value in app_config.items():
+        setattr(UnitConfig, name, value)
+    app = create_app(UnitConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def product(app):
+    item = Product(name='Unit Product', sku='UNIT-1')
+    db.session.add(item)
+    db.session.commit()
+    return item
+
+
+@pytest.fixture
+def user(app):
+    item = User(username='unit_qa', role='qa', plant_name='Unit Plant')
+    item.set_password('unit')
+    db.session.add(item)
+    db.session.commit()
+    return item
+
+
+@pytest.fixture
+def make_report(product, user):
+    """Adds and commits a report of `product`; extra fields are passed through."""
+
+    def make(batch_code, **fields):
+        report = QualityReport(product_id=product.id, user_id=user.id, batch_code=batch_code,
+                               expiry_date=date(2030, 1, 1), **fields)
+        db.session.add(report)
+        db.session.commit()
+        return report
+
+    return make
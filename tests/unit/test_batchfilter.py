@@ -0,0 +1,83 @@
+# tests/unit/test_batchfilter.py
+# The batch-code Bloom filter and the journal workers share new codes through.
+
+import random
+
+import pytest
+
+from project.batchfilter import BatchCodeFilter, BloomFilter
+
+
+@pytest.fixture
+def make_filter(app, tmp_path):
+    """BatchCodeFilters of one app sharing a journal under tmp_path (one per simulated worker)."""
+
+    def make(**options):
+        return BatchCodeFilter(app, journal_path=str(tmp_path / 'batch_codes.journal'), **options)
+
+    return make
+
+
+def test_bloom_filter_has_no_false_negatives():
+    rng = random.Random(7)
+    codes = [f"B{rng.randrange(10 ** 9)}" for _ in range(5000)]
+    bloom = BloomFilter(len(codes), 0.01)
+    for code in codes:
+        bloom.add(code)
+    assert all(code in bloom for code in codes)
+
+
+def test_bloom_filter_false_positive_rate_near_target():
+    bloom = BloomFilter(5000, 0.01)
+    for n in range(5000):
+        bloom.add(f"IN{n}")
+    false_positives = sum(f"OUT{n}" in bloom for n in range(20000))
+    assert false_positives / 20000 < 0.03
+
+
+def test_build_contains_every_stored_code(make_filter, make_report):
+    codes = [f"LOT{n:04d}" for n in range(200)]
+    for code in codes:
+        make_report(code)
+    batch_filter = make_filter()
+    batch_filter.build()
+    assert all(batch_filter.might_contain(code) for code in codes)
+
+
+def test_journal_replays_across_instances(make_filter):
+    writer, reader = make_filter(), make_filter()
+    writer.build()
+    reader.build()
+    for n in range(20):
+        writer.add(f"NEW{n}")
+    assert all(reader.might_contain(f"NEW{n}") for n in range(20))
+
+
+def test_compaction_keeps_codes_for_other_workers(make_filter):
+    writer, reader = make_filter(journal_max_bytes=16), make_filter(journal_max_bytes=16)
+    writer.build()
+    reader.build()
+    for n in range(10):
+        writer.add(f"OLD{n}")
+    # The rebuild starts a new segment before the reader has seen the old one
+    writer.build()
+    assert writer.journal.segments() == [0, 1]
+    writer.add('AFTER1')
+    assert all(reader.might_contain(f"OLD{n}") for n in range(10))
+    assert reader.might_contain('AFTER1')
+    assert writer.might_contain('AFTER1')
+
+
+def test_reader_behind_deleted_segments_rebuilds(make_filter, make_report):
+    writer = make_filter(journal_max_bytes=1, rebuild_seconds=0)
+    reader = make_filter()
+    writer.build()
+    reader.build()
+    writer.add('GONE1')
+    make_report('GONE1')
+    # Three rotations; segments two behind and idle are deleted
+    for n in range(3):
+        writer.add(f"NEXT{n}")
+        writer.build()
+    assert 0 not in writer.journal.segments()
+    assert reader.might_contain('GONE1')
@@ -0,0 +1,38 @@
+# tests/unit/test_batchindex.py
+# Batch-code autocomplete index: prefix queries and changes shared between workers.
+
+import pytest
+
+from project.batchindex import BatchCodeIndex, PlantCodes
+
+
+@pytest.fixture
+def make_index(app, tmp_path):
+    """BatchCodeIndexes of one app sharing a journal under tmp_path (one per simulated worker)."""
+
+    def make(**options):
+        return BatchCodeIndex(app, journal_path=str(tmp_path / 'batch_index.journal'), **options)
+
+    return make
+
+
+def test_plant_codes_prefix_and_counts():
+    codes = PlantCodes({'AB100': 1, 'AB200': 2, 'AC100': 1})
+    codes.add('AB150')
+    codes.remove('AB200')
+    assert codes.prefix('AB', 10) == [('AB100', 1), ('AB150', 1), ('AB200', 1)]
+    codes.remove('AB200')
+    assert codes.prefix('AB', 2) == [('AB100', 1), ('AB150', 1)]
+
+
+def test_changes_replay_across_instances_and_compaction(make_index, make_report):
+    make_report('AB100')
+    writer, reader = make_index(journal_max_bytes=8), make_index(journal_max_bytes=8)
+    writer.build()
+    reader.build()
+    writer.record(None, added='ab200')
+    writer.record(None, added='AB300', removed='AB100')
+    writer.build()
+    writer.record(None, added='AB400')
+    assert writer.journal.segments() == [0, 1]
+    assert [code for code, _ in reader.suggest(None, 'AB')] == ['AB200', 'AB300', 'AB400']
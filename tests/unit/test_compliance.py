@@ -0,0 +1,145 @@
+# tests/unit/test_compliance.py
+# Specification parsing, result and report flags, and rescoring stored flags.
+
+import pytest
+from sqlalchemy import event
+
+from project import compliance, db
+from project.compliance import NEGATIVE, POSITIVE, compile_spec, report_flag
+from project.models import QualityReport, ReportResult, ReportTemplate
+
+
+@pytest.mark.parametrize('specification, parameter, expected', [
+    # Min / Max, with units and notes
+    ('Min 6.0hrs', '', ('min', 6.0, None)),
+    ('Min. 34 % on MSNF', '', ('min', 34.0, None)),
+    ('Minimum 3.5 % w/w', '', ('min', 3.5, None)),
+    ('>= 60', '', ('min', 60.0, None)),
+    ('≥ 1.5', '', ('min', 1.5, None)),
+    ('Max 550 mg', '', ('max', None, 550.0)),
+    ('Max. 0.14', '', ('max', None, 0.14)),
+    ('<= 0.14', '', ('max', None, 0.14)),
+    ('max 10 cfu/g', '', ('max', None, 10.0)),
+    # Ranges
+    ('40-44', '', ('range', 40.0, 44.0)),
+    ('6.5 – 8.5', '', ('range', 6.5, 8.5)),
+    ('40 to 44 °C', '', ('range', 40.0, 44.0)),
+    ('44-40', '', ('range', 40.0, 44.0)),
+    # Categorical words
+    ('Negative', '', ('categorical', None, None)),
+    ('Absent.', '', ('categorical', None, None)),
+    ('nil', '', ('categorical', None, None)),
+    ('Positive', '', ('categorical', None, None)),
+    # Bare numbers take their direction from the parameter name
+    ('4', 'Fat % (Min)', ('min', 4.0, None)),
+    ('0.5 %', 'Acidity (Max)', ('max', None, 0.5)),
+    ('4', 'Fat %', (None, None, None)),
+    # Descriptive text
+    ('White, Uniform', '', (None, None, None)),
+    ('Characteristic', '', (None, None, None)),
+    ('', '', (None, None, None)),
+    (None, '', (None, None, None)),
+    # More numbers after the bound: exponent notation and the like
+    ('1-2 x 10^4', '', (None, None, None)),
+    ('Max 1 x 10^2 cfu/g', '', (None, None, None)),
+    ('Min 5e3', '', (None, None, None)),
+    ('40-44-46', '', (None, None, None)),
+    # Malformed input
+    ('Min', '', (None, None, None)),
+    ('Max abc', '', (None, None, None)),
+    ('- 5', '', (None, None, None)),
+    ('to 44', '', (None, None, None)),
+])
+def test_compile_spec(specification, parameter, expected):
+    spec = compile_spec(specification, parameter)
+    assert (spec.kind, spec.low, spec.high) == expected
+
+
+def test_categorical_values():
+    assert compile_spec('Absent').values == NEGATIVE
+    assert compile_spec('Present').values == POSITIVE
+
+
+@pytest.mark.parametrize('specification, value, expected', [
+    ('Min 6.0hrs', '6.5 hrs', True),
+    ('Min 6.0hrs', '5.9', False),
+    ('Max 550 mg', '550', True),
+    ('Max 550 mg', '551 mg', False),
+    ('40-44', '40', True),
+    ('40-44', '44.1', False),
+    ('40-44', 'n/a', None),
+    ('Negative', 'Nil', True),
+    ('Negative', 'Positive', False),
+    ('Negative', 'see note', None),
+    ('White, Uniform', 'White', None),
+    ('40-44', None, None),
+])
+def test_spec_check(specification, value, expected):
+    assert compile_spec(specification).check(value) is expected
+
+
+@pytest.mark.parametrize('flags, expected', [
+    ([], None),
+    ([None, None], None),
+    ([True, None], True),
+    ([True, True], True),
+    ([True, False, None], False),
+    ([None, False], False),
+])
+def test_report_flag(flags, expected):
+    assert report_flag(flags) is expected
+
+
+@pytest.fixture
+def scored(product, make_report):
+    """Two reports of `product`, scored against a 'Min 4' spec; returns (template, reports)."""
+    template = ReportTemplate(product_id=product.id, parameter='Fat', specification='Min 4', method='M1', order=1)
+    db.session.add(template)
+    db.session.commit()
+    reports = []
+    for batch_code, value in (('AAAAA', '5'), ('BBBBB', '3')):
+        report = make_report(batch_code)
+        result = ReportResult(report_id=report.id, template_id=template.id, result_value=value)
+        db.session.add(result)
+        db.session.flush()
+        compliance.score_report(report, [result])
+        reports.append(report)
+    db.session.commit()
+    return template, reports
+
+
+def captured_updates():
+    """Parameters of the in_spec UPDATEs sent while the context is active, per table."""
+    updates = {}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE') and 'in_spec' in statement:
+            table = statement.split()[1]
+            rows = parameters if executemany else [parameters]
+            updates.setdefault(table, []).extend(tuple(row) for row in rows)
+
+    return updates, capture
+
+
+def test_rescore_writes_only_changed_flags(app, scored):
+    template, (passing, failing) = scored
+    assert (passing.in_spec, failing.in_spec) == (True, False)
+
+    # Nothing changed: nothing is written
+    updates, capture = captured_updates()
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        assert compliance.rescore() == (2, 2)
+        assert updates == {}
+
+        # A stricter spec fails the first report only
+        template.specification = 'Min 6'
+        db.session.commit()
+        compliance.rescore()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    result_id = ReportResult.query.filter_by(report_id=passing.id).one().id
+    assert updates == {'report_result': [(False, result_id)], 'quality_report': [(False, passing.id)]}
+    assert db.session.get(QualityReport, passing.id).in_spec is False
+    assert db.session.get(QualityReport, failing.id).in_spec is False
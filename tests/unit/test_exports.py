@@ -0,0 +1,29 @@
+# tests/unit/test_exports.py
+# Encoding of export chunks as CSV and NDJSON.
+
+import json
+from datetime import date, datetime
+
+import pytest
+
+from project.exports import encode
+
+
+def encoded(columns, chunks, fmt):
+    return b''.join(encode(columns, iter(chunks), fmt)).decode('utf-8')
+
+
+def test_ndjson_dates_first_seen_after_first_chunk():
+    text = encoded(['a', 'b'], [[[1, None]], [[2, datetime(2024, 1, 1)]], [[3, date(2024, 2, 3)]]], 'ndjson')
+    assert [json.loads(line) for line in text.splitlines()] == [
+        {'a': 1, 'b': None}, {'a': 2, 'b': '2024-01-01T00:00:00'}, {'a': 3, 'b': '2024-02-03'}]
+
+
+def test_csv_dates_are_iso_8601():
+    text = encoded(['a', 'b'], [[[1, None]], [[2, datetime(2024, 1, 1, 8, 30)]]], 'csv')
+    assert text.splitlines() == ['a,b', '1,', '2,2024-01-01T08:30:00']
+
+
+@pytest.mark.parametrize('fmt, expected', [('csv', 'a,b\r\n'), ('ndjson', '')])
+def test_empty_export(fmt, expected):
+    assert encoded(['a', 'b'], [], fmt) == expected
@@ -0,0 +1,62 @@
+# tests/unit/test_hotbatches.py
+# Space-saving summary: error bounds and the heavy-hitter guarantee.
+
+import random
+from collections import Counter
+
+from project.hotbatches import SpaceSaving
+
+
+def skewed_stream(length, keys, seed):
+    """Zipf-like stream of batch codes: key n is drawn with weight 1 / n."""
+    rng = random.Random(seed)
+    population = [f"LOT{n}" for n in range(1, keys + 1)]
+    weights = [1 / n for n in range(1, keys + 1)]
+    return rng.choices(population, weights, k=length)
+
+
+def summarize(stream, capacity):
+    summary = SpaceSaving(capacity)
+    for key in stream:
+        summary.offer(key)
+    return summary
+
+
+def test_exact_while_under_capacity():
+    stream = ['A', 'B', 'A', 'C', 'A', 'B']
+    summary = summarize(stream, capacity=5)
+    assert [(key, count, error) for key, count, error, _ in summary.top()] == [('A', 3, 0), ('B', 2, 0), ('C', 1, 0)]
+
+
+def test_counts_bound_true_counts():
+    stream = skewed_stream(20000, 2000, seed=11)
+    true_counts = Counter(stream)
+    summary = summarize(stream, capacity=50)
+    assert len(summary.counters) == 50
+    # Each counter overestimates by at most its recorded error, and that error
+    # never exceeds total / capacity
+    for key, count, error, _ in summary.top():
+        assert count - error <= true_counts[key] <= count
+        assert error <= len(stream) / 50
+    assert sum(count for _, count, _, _ in summary.top()) == len(stream)
+
+
+def test_heavy_hitters_are_tracked():
+    stream = skewed_stream(20000, 2000, seed=12)
+    true_counts = Counter(stream)
+    capacity = 40
+    summary = summarize(stream, capacity)
+    heavy = {key for key, count in true_counts.items() if count > len(stream) / capacity}
+    assert heavy
+    assert heavy <= set(summary.counters)
+
+
+def test_weights_and_report_ids():
+    summary = SpaceSaving(capacity=2)
+    summary.offer('A', report_id=1, weight=5)
+    summary.offer('A', report_id=2)
+    summary.offer('B', report_id=3)
+    # C replaces B (the smallest) and inherits its count as error
+    summary.offer('C', report_id=4)
+    assert summary.top() == [('A', 6, 0, 2), ('C', 2, 1, 4)]
+    assert summary.top(limit=1) == [('A', 6, 0, 2)]
@@ -0,0 +1,28 @@
+# tests/unit/test_jobs.py
+# Claims, retries and expired claims in the SQLite job queue.
+
+import pytest
+
+from project.jobs import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite'), visibility_timeout=0, backoff_seconds=0)
+
+
+def test_failed_job_is_retried_until_max_attempts(queue):
+    queue.enqueue('noop', max_attempts=2)
+    assert queue.fail(queue.claim(['default']), 'boom') is True
+    assert queue.fail(queue.claim(['default']), 'boom') is False
+    assert queue.claim(['default']) is None
+    assert queue.counts() == {'default': {'failed': 1}}
+
+
+def test_expired_claim_on_last_attempt_fails_the_job(queue):
+    queue.enqueue('noop', max_attempts=2)
+    # Each worker dies mid-job; with no visibility timeout the claim expires at once
+    assert queue.claim(['default'])['attempts'] == 1
+    assert queue.claim(['default'])['attempts'] == 2
+    assert queue.claim(['default']) is None
+    assert queue.counts() == {'default': {'failed': 1}}
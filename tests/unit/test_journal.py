@@ -0,0 +1,155 @@
+# tests/unit/test_journal.py
+# The segmented journal shared by workers, under Windows file semantics.
+
+import builtins
+import os
+
+import pytest
+
+from project import journal as journal_module
+from project.journal import Journal, JournalGap
+
+
+@pytest.fixture
+def windows_files(monkeypatch):
+    """
+    Emulates Windows: a file another handle has open cannot be removed,
+    renamed or replaced. Returns the set of paths currently open.
+    """
+    open_paths = set()
+    real_open, real_remove = builtins.open, os.remove
+
+    class Tracked:
+        def __init__(self, fh, path):
+            self._fh, self._path = fh, path
+
+        def __enter__(self):
+            return self._fh
+
+        def __exit__(self, *exc):
+            self.close()
+
+        def close(self):
+            open_paths.discard(self._path)
+            self._fh.close()
+
+        def __getattr__(self, name):
+            return getattr(self._fh, name)
+
+    def tracked_open(path, *args, **kwargs):
+        fh = real_open(path, *args, **kwargs)
+        open_paths.add(os.path.abspath(path))
+        return Tracked(fh, os.path.abspath(path))
+
+    def remove(path):
+        if os.path.abspath(path) in open_paths:
+            raise PermissionError(32, 'The process cannot access the file because it is being used', path)
+        real_remove(path)
+
+    def no_rename(*args, **kwargs):
+        raise PermissionError(32, 'The process cannot access the file because it is being used')
+
+    monkeypatch.setattr(journal_module, 'open', tracked_open, raising=False)
+    monkeypatch.setattr(os, 'remove', remove)
+    monkeypatch.setattr(os, 'replace', no_rename)
+    monkeypatch.setattr(os, 'rename', no_rename)
+    return open_paths
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'test.journal')
+
+
+def test_append_and_read(path, windows_files):
+    journal = Journal(path)
+    position = journal.end()
+    journal.append(b'A\nB\n')
+    lines, position = journal.read(position)
+    assert lines == [b'A', b'B']
+    assert journal.read(position) == ([], position)
+    assert not windows_files
+
+
+def test_half_written_line_waits(path):
+    journal = Journal(path)
+    position = journal.end()
+    with open(f"{path}.0", 'ab') as fh:
+        fh.write(b'PART')
+    lines, position = journal.read(position)
+    assert lines == [] and position == (0, 0)
+    with open(f"{path}.0", 'ab') as fh:
+        fh.write(b'IAL\n')
+    assert journal.read(position)[0] == [b'PARTIAL']
+
+
+def test_compaction_under_windows_semantics(path, windows_files):
+    journal = Journal(path, max_bytes=4, keep_seconds=0)
+    slow = journal.end()
+    journal.append(b'ONE\nTWO\n')
+    assert journal.compact() == 1
+    journal.append(b'THREE\n')
+    # A reader still on segment 0 finishes it, then reads the new one
+    lines, slow = journal.read(slow)
+    assert lines == [b'ONE', b'TWO', b'THREE']
+    assert slow == (1, 6)
+    # Segment 0 is kept while it is only one behind
+    assert journal.segments() == [0, 1]
+    journal.compact()
+    journal.append(b'FOUR\n')
+    assert journal.compact() == 3
+    assert journal.segments() == [2, 3]
+    assert not windows_files
+
+
+def test_segment_open_elsewhere_is_kept(path, windows_files):
+    journal = Journal(path, max_bytes=1, keep_seconds=0)
+    journal.append(b'X\n')
+    journal.compact()
+    journal.append(b'Y\n')
+    # Another worker is reading segment 0 right now
+    windows_files.add(os.path.abspath(f"{path}.0"))
+    assert journal.compact() == 2
+    assert journal.segments() == [0, 1, 2]
+    windows_files.clear()
+    journal.compact()
+    assert 0 not in journal.segments()
+
+
+def test_append_racing_a_new_segment_is_repeated(path, monkeypatch):
+    journal = Journal(path)
+    reader = journal.end()
+    journal.append(b'A\n')
+    real_latest = journal.latest
+    calls = []
+
+    def latest():
+        # A rebuild starts segment 1 between the append and the check after it
+        calls.append(1)
+        if len(calls) == 2:
+            open(f"{path}.1", 'xb').close()
+        return real_latest()
+
+    monkeypatch.setattr(journal, 'latest', latest)
+    journal.append(b'B\n')
+    lines, reader = journal.read(reader)
+    assert lines.count(b'B') >= 1
+    assert reader[0] == 1
+    with open(f"{path}.1", 'rb') as fh:
+        assert fh.read() == b'B\n'
+
+
+def test_gap_when_unread_segment_was_deleted(path):
+    journal = Journal(path, max_bytes=1, keep_seconds=0)
+    behind = journal.end()
+    for line in (b'A\n', b'B\n', b'C\n'):
+        journal.append(line)
+        journal.compact()
+    with pytest.raises(JournalGap):
+        journal.read(behind)
+
+
+def test_missing_journal_reads_empty(path):
+    journal = Journal(path)
+    assert journal.end() == (0, 0)
+    assert journal.read((0, 0)) == ([], (0, 0))
@@ -0,0 +1,127 @@
+# tests/unit/test_machinecodes.py
+# Machine-code expressions, their stored form and rows written before them.
+
+from types import SimpleNamespace
+
+import pytest
+
+from project import db, machinecodes
+from project.machinecodes import compile_expression, compile_for_storage, load, matcher_for
+
+
+@pytest.mark.parametrize('expression, accepted, rejected', [
+    ('A7', ['A7', 'a7', ' A7 '], ['A70', 'A', '']),
+    ('A1-A24', ['A1', 'A13', 'A24'], ['A0', 'A25', 'A01', 'B5']),
+    ('A1-24', ['A1', 'A24'], ['A25']),
+    ('7-9', ['7', '9'], ['10', 'A7']),
+    # Zero-padded bounds only match codes of the same width
+    ('A01-A24', ['A01', 'A09', 'A24'], ['A1', 'A9', 'A001']),
+    ('B*', ['B', 'B1', 'BX9'], ['AB', 'C1']),
+    ('*', ['A1', 'Z'], ['']),
+    ('A1-A24,!A13', ['A12', 'A14'], ['A13']),
+    ('*,!B*', ['A1'], ['B1']),
+    ('A1-A5,B*,!B2,!A3', ['A1', 'B1', 'B3'], ['A3', 'B2']),
+])
+def test_matches(expression, accepted, rejected):
+    matcher = compile_expression(expression)
+    assert all(matcher.matches(code) for code in accepted)
+    assert not any(matcher.matches(code) for code in rejected)
+
+
+@pytest.mark.parametrize('expression, message', [
+    ('A*1', 'wildcard can only end'),
+    ('A1-B5', 'same prefix'),
+    ('A9-A1', 'runs backwards'),
+    ('A01-A100', 'same number of digits'),
+    ('A0-A10000', 'at most 10000 codes'),
+    ('A1-', 'not a range'),
+    ('M-1', 'not a range'),
+    ('A1,!', "'!' needs"),
+    ('!A1', 'exclusions only'),
+])
+def test_malformed_terms(expression, message):
+    with pytest.raises(ValueError, match=message):
+        compile_expression(expression)
+
+
+def test_empty_expression_accepts_nothing():
+    assert not compile_expression('')
+    assert not compile_expression(' , ,')
+
+
+def test_normalized():
+    matcher = compile_expression('b*, a3 ,A1-A2,!a2, A05-A07')
+    assert matcher.normalized() == 'A3,A1-A2,A05-A07,B*,!A2'
+    assert compile_expression(matcher.normalized()).normalized() == matcher.normalized()
+
+
+def test_expand():
+    matcher = compile_expression('A01-A03,C9,B*,!A02')
+    assert matcher.expand(10) == (['C9', 'A01', 'A03'], True)
+    assert matcher.expand(2) == (['C9', 'A01'], False)
+    assert matcher.open_ended
+
+
+def test_expand_is_bounded_behind_exclusions(monkeypatch):
+    # Compiled before ranges were capped: every member is excluded
+    matcher = load(compile_expression('A1-A9999,!A*').to_json().replace('9999', '3000000'))
+    monkeypatch.setattr(machinecodes, 'EXPAND_PROBES', 1000)
+    assert matcher.expand(10) == ([], False)
+
+
+def test_widest_range_accepted():
+    assert compile_expression('A1-A10000').expand(3) == (['A1', 'A2', 'A3'], False)
+
+
+@pytest.mark.parametrize('expression', ['A7', 'A1-A24,!A13', 'A01-A24,B*,C1', '*,!B*'])
+def test_json_round_trip(expression):
+    matcher = compile_expression(expression)
+    loaded = load(matcher.to_json())
+    assert loaded.normalized() == matcher.normalized()
+    assert loaded.to_json() == matcher.to_json()
+
+
+def legacy_row(machine_codes, machine_matcher=None):
+    return SimpleNamespace(machine_codes=machine_codes, machine_matcher=machine_matcher)
+
+
+def test_rows_without_compiled_form_match_exact_codes():
+    matcher = matcher_for(legacy_row('L1-2,M-1,B*'))
+    assert matcher.matches('L1-2') and matcher.matches('M-1') and matcher.matches('B*')
+    assert not matcher.matches('L1') and not matcher.matches('B1')
+    assert matcher_for(legacy_row(None)) is None
+
+
+def test_reads_differently():
+    assert machinecodes.reads_differently(legacy_row('L1-2'))
+    assert machinecodes.reads_differently(legacy_row('M-1'))
+    assert not machinecodes.reads_differently(legacy_row('A1,A2'))
+    stored = compile_expression('A1-A3').to_json()
+    assert not machinecodes.reads_differently(legacy_row('A1-A3', stored))
+
+
+def test_unchanged_legacy_codes_keep_exact_meaning():
+    report = legacy_row('L1-2,M-1')
+    raw, compiled = compile_for_storage(' L1-2,M-1 ', report)
+    assert raw == 'L1-2,M-1'
+    assert load(compiled).matches('M-1') and not load(compiled).matches('L1')
+    # Saved once, the exact form is kept on later saves too
+    assert compile_for_storage('L1-2,M-1', legacy_row(raw, compiled)) == (raw, compiled)
+    # Edited text is read as an expression
+    raw, compiled = compile_for_storage('L1-3', report)
+    assert load(compiled).matches('L2')
+    with pytest.raises(ValueError):
+        compile_for_storage('M-1,M-2', report)
+
+
+def test_compile_command_keeps_exact_meaning_and_lists_ambiguous_rows(app, make_report):
+    plain = make_report('AAAAA', machine_codes='A1,A2')
+    legacy = make_report('BBBBB', machine_codes='L1-2,M-1')
+    result = app.test_cli_runner().invoke(args=['machine-codes-compile'])
+    assert result.exit_code == 0, result.output
+    assert 'Compiled 2 reports' in result.output
+    assert f"report {legacy.id}: L1-2,M-1" in result.output
+    assert f"report {plain.id}:" not in result.output
+    db.session.expire_all()
+    assert legacy.machine_matcher is not None
+    assert matcher_for(legacy).matches('M-1') and not matcher_for(legacy).matches('L2')
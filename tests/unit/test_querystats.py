@@ -0,0 +1,41 @@
+# tests/unit/test_querystats.py
+# Pruning of per-process query-stat snapshots.
+
+import os
+import time
+
+import pytest
+
+from project import querystats
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(querystats._state, 'snapshot_dir', str(tmp_path))
+    monkeypatch.setitem(querystats._state, 'snapshot_path', str(tmp_path / f"{os.getpid()}-1.json"))
+    monkeypatch.setitem(querystats._state, 'retention_hours', 24)
+    return tmp_path
+
+
+def write_snapshot(directory, name, age_hours):
+    path = directory / name
+    path.write_text('{}', encoding='utf-8')
+    stamp = time.time() - age_hours * 3600
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_prune_by_age_only(snapshot_dir, monkeypatch):
+    def no_signals(*args):
+        raise AssertionError('prune_snapshots() must not signal other processes')
+
+    monkeypatch.setattr(os, 'kill', no_signals)
+    stale = write_snapshot(snapshot_dir, '999999-1.json', age_hours=30)
+    # A pid that is not running, but a recent snapshot: kept until it ages out
+    recent = write_snapshot(snapshot_dir, '999998-1.json', age_hours=1)
+    own = write_snapshot(snapshot_dir, f"{os.getpid()}-1.json", age_hours=30)
+    other = write_snapshot(snapshot_dir, 'GENERATION', age_hours=30)
+
+    assert querystats.prune_snapshots() == 1
+    assert not stale.exists()
+    assert recent.exists() and own.exists() and other.exists()
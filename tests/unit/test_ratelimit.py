@@ -0,0 +1,37 @@
+# tests/unit/test_ratelimit.py
+# Per-IP token buckets on the public lookup.
+
+import pytest
+
+
+@pytest.fixture
+def app_config():
+    # Two lookups, and practically no refill during the test
+    return {'RATE_LIMIT_ENABLED': True, 'RATE_LIMIT_STORE': 'memory',
+            'RATE_LIMIT_LOOKUP_BURST': 2, 'RATE_LIMIT_LOOKUP_PER_MINUTE': 0.001}
+
+
+def lookup(client, code):
+    return client.post('/', data={'batch-code': code}, follow_redirects=True)
+
+
+def test_form_lookup_costs_one_token(app, make_report):
+    make_report('AAAAA')
+    client = app.test_client()
+    assert lookup(client, 'AAAAA').status_code == 200
+    assert lookup(client, 'ZZZZZ').status_code == 200
+    assert lookup(client, 'AAAAA').status_code == 429
+
+
+def test_permalink_costs_one_token(app, make_report):
+    make_report('AAAAA')
+    client = app.test_client()
+    assert [client.get('/report/AAAAA').status_code for _ in range(3)] == [200, 200, 429]
+
+
+def test_short_code_is_answered_without_a_token(app):
+    client = app.test_client()
+    for _ in range(3):
+        response = lookup(client, 'AB')
+        assert response.status_code == 200
+        assert b'at least 5 characters' in response.data
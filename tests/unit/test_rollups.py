@@ -0,0 +1,57 @@
+# tests/unit/test_rollups.py
+# Hourly/daily rollups: late events and the series labels.
+
+from datetime import datetime, timedelta
+
+from project import db, rollups
+from project.models import AnalyticsDaily, AnalyticsEvent
+
+
+def add_events(timestamps, event_type='PAGE_VIEW'):
+    db.session.add_all(AnalyticsEvent(event_type=event_type, timestamp=timestamp) for timestamp in timestamps)
+    db.session.commit()
+
+
+def total(start, end):
+    counts, _ = rollups.counts(start, end)
+    return sum(counts.values())
+
+
+def test_late_event_in_rolled_up_hour_is_counted(app):
+    current_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    last_hour = current_hour - timedelta(hours=1)
+    add_events([current_hour - timedelta(hours=5), last_hour + timedelta(minutes=30)])
+    rollups.rollup()
+    assert rollups.watermarks()[1] == current_hour
+
+    # Written by the analytics writer after the rollup, timestamped before it
+    add_events([last_hour + timedelta(minutes=59)])
+    assert rollups.rollup_complete_hours() == 0
+    assert total(current_hour - timedelta(hours=6), current_hour) == 3
+
+
+def test_recount_does_not_double_count(app):
+    current_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    add_events([current_hour - timedelta(minutes=m) for m in (10, 70, 130)])
+    for _ in range(3):
+        rollups.rollup()
+    assert total(current_hour - timedelta(hours=4), current_hour) == 3
+
+
+def test_day_waits_for_recount_window(app):
+    current_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    midnight = datetime.combine(current_hour.date(), datetime.min.time())
+    add_events([midnight - timedelta(days=2), midnight - timedelta(minutes=1)])
+    rollups.rollup(lag_hours=current_hour.hour + 1)
+    # Yesterday's last hour is still inside the recount window
+    assert AnalyticsDaily.query.filter(AnalyticsDaily.day == (midnight - timedelta(days=1)).date()).count() == 0
+    rollups.rollup(lag_hours=0)
+    assert AnalyticsDaily.query.filter(AnalyticsDaily.day == (midnight - timedelta(days=1)).date()).count() == 1
+
+
+def test_series_labels_missing_plant_as_unknown(app):
+    now = datetime.utcnow()
+    add_events([now - timedelta(hours=3), now])
+    rollups.rollup()
+    data = rollups.series(now.date() - timedelta(days=1), now.date(), breakdown='plant')
+    assert [(entry['key'], entry['label'], entry['total']) for entry in data['series']] == [(0, 'Unknown', 2)]
@@ -0,0 +1,52 @@
+# tests/unit/test_sketches.py
+# HyperLogLog registers, merging and estimates.
+
+import random
+
+import pytest
+
+from project.sketches import REGISTERS, STANDARD_ERROR, HyperLogLog
+
+
+def sketch_of(hashes):
+    sketch = HyperLogLog()
+    for value in hashes:
+        sketch.add(value)
+    return sketch
+
+
+def random_hashes(count, seed):
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(count)]
+
+
+def test_merge_is_register_wise_maximum():
+    rng = random.Random(3)
+    left = HyperLogLog(bytes(rng.randrange(54) for _ in range(REGISTERS)))
+    right = HyperLogLog(bytes(rng.randrange(54) for _ in range(REGISTERS)))
+    expected = bytearray(max(a, b) for a, b in zip(left.registers, right.registers))
+    assert left.merge(right).registers == expected
+
+
+def test_merge_equals_sketch_of_union():
+    first, second = random_hashes(3000, 1), random_hashes(3000, 2)
+    merged = sketch_of(first).merge(sketch_of(second))
+    assert merged.registers == sketch_of(first + second).registers
+
+
+def test_readding_items_changes_nothing():
+    hashes = random_hashes(2000, 4)
+    once = sketch_of(hashes)
+    assert sketch_of(hashes + hashes).registers == once.registers
+
+
+@pytest.mark.parametrize('count', [0, 100, 5000, 50000, 300000])
+def test_estimate_within_standard_errors(count):
+    estimate = sketch_of(random_hashes(count, count)).count()
+    # Four standard errors, plus one for the empty sketch
+    assert abs(estimate - count) <= 4 * STANDARD_ERROR * count + 1
+
+
+def test_blob_round_trip():
+    sketch = sketch_of(random_hashes(1000, 5))
+    assert HyperLogLog.from_blob(sketch.to_blob()).registers == sketch.registers
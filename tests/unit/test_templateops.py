@@ -0,0 +1,161 @@
+# tests/unit/test_templateops.py
+# Batch template edits: validation in plan() and the writes apply() issues.
+
+import pytest
+from sqlalchemy import event
+
+from project import db, templateops
+from project.models import Product, ReportTemplate, User
+from project.templateops import MAX_OPERATIONS, VersionConflict, apply, plan
+
+CURRENT = {
+    1: {'parameter': 'Fat', 'specification': 'Min 4', 'order': 1},
+    2: {'parameter': 'SNF', 'specification': 'Min 8.5', 'order': 2},
+    3: {'parameter': 'Acidity', 'specification': 'Max 0.14', 'order': 3},
+}
+
+
+def add(order, parameter='Protein'):
+    return {'op': 'add', 'parameter': parameter, 'specification': 'Min 3', 'method': 'Kjeldahl', 'order': order}
+
+
+def test_plan_returns_only_differences():
+    edits, deleted, added = plan(CURRENT, [
+        {'op': 'edit', 'id': 1, 'specification': 'Min 4.5'},
+        {'op': 'edit', 'id': 2, 'specification': 'Min 8.5'},
+        {'op': 'delete', 'id': 3},
+        add(3),
+    ])
+    assert edits == {1: {'specification': 'Min 4.5'}}
+    assert deleted == {3}
+    assert added == [{'parameter': 'Protein', 'specification': 'Min 3', 'method': 'Kjeldahl', 'order': 3}]
+
+
+def test_plan_reorder():
+    edits, _, _ = plan(CURRENT, [{'op': 'reorder', 'ids': [3, 1, 2]}])
+    assert edits == {3: {'order': 1}, 1: {'order': 2}, 2: {'order': 3}}
+
+
+@pytest.mark.parametrize('operations, message', [
+    ([], 'non-empty list'),
+    ({'op': 'delete', 'id': 1}, 'non-empty list'),
+    ([{'op': 'rename', 'id': 1}], 'unknown op'),
+    (['delete 1'], 'unknown op'),
+    ([{'op': 'delete', 'id': 1}, {'op': 'delete', 'id': 1}], 'already deleted'),
+    ([{'op': 'delete', 'id': 1}, {'op': 'edit', 'id': 1, 'order': 5}], 'already deleted'),
+    ([{'op': 'delete', 'id': 99}], 'does not belong'),
+    ([{'op': 'edit', 'id': '1', 'order': 5}], "'id' must be a template id"),
+    ([{'op': 'edit', 'id': [1], 'order': 5}], "'id' must be a template id"),
+    ([{'op': 'delete', 'id': True}], "'id' must be a template id"),
+    ([{'op': 'delete'}], "'id' must be a template id"),
+    ([{'op': 'reorder', 'ids': [[1], [2], [3]]}], "'id' must be a template id"),
+    ([{'op': 'edit', 'id': 1}], 'nothing to edit'),
+    ([{'op': 'edit', 'id': 1, 'specification': '  '}], "'specification' is required"),
+    ([{'op': 'edit', 'id': 1, 'specification': 'x' * 201}], 'longer than 200'),
+    ([{'op': 'edit', 'id': 1, 'order': 2}], 'distinct order'),
+    ([add(2)], 'distinct order'),
+    ([add(7), add(7, 'Lactose')], 'distinct order'),
+    ([{'op': 'edit', 'id': 1, 'order': True}], 'positive whole number'),
+    ([{'op': 'edit', 'id': 1, 'order': 0}], 'positive whole number'),
+    ([{'op': 'edit', 'id': 1, 'order': -2}], 'positive whole number'),
+    ([{'op': 'edit', 'id': 1, 'order': 1.5}], 'positive whole number'),
+    ([{'op': 'edit', 'id': 1, 'order': 'first'}], 'positive whole number'),
+    ([add(None)], 'positive whole number'),
+    ([{'op': 'reorder', 'ids': [1, 1, 2]}], 'distinct template ids'),
+    ([{'op': 'reorder', 'ids': [1, 2, 3, 99]}], 'does not belong'),
+    ([add(4 + n, f"P{n}") for n in range(MAX_OPERATIONS + 1)], f"At most {MAX_OPERATIONS}"),
+])
+def test_plan_rejects(operations, message):
+    with pytest.raises(ValueError, match=message):
+        plan(CURRENT, operations)
+
+
+def test_plan_accepts_max_operations():
+    _, _, added = plan(CURRENT, [add(4 + n, f"P{n}") for n in range(MAX_OPERATIONS)])
+    assert len(added) == MAX_OPERATIONS
+
+
+def test_swapping_orders_within_a_batch_is_allowed():
+    edits, _, _ = plan(CURRENT, [{'op': 'edit', 'id': 1, 'order': 2}, {'op': 'edit', 'id': 2, 'order': 1}])
+    assert edits == {1: {'order': 2}, 2: {'order': 1}}
+
+
+@pytest.fixture
+def templates(product):
+    rows = [ReportTemplate(product_id=product.id, parameter=fields['parameter'],
+                           specification=fields['specification'], method='M', order=fields['order'])
+            for fields in CURRENT.values()]
+    other = Product(name='Other Product', sku='UNIT-2')
+    db.session.add_all(rows + [other])
+    db.session.flush()
+    foreign = ReportTemplate(product_id=other.id, parameter='Fat', specification='Min 3', method='M', order=1)
+    db.session.add(foreign)
+    db.session.commit()
+    return rows, foreign
+
+
+def test_apply_ids_from_another_product(product, templates):
+    _, foreign = templates
+    with pytest.raises(ValueError, match='does not belong'):
+        apply(product, [{'op': 'delete', 'id': foreign.id}], product.template_version)
+
+
+def test_apply_stale_version_conflicts(product, templates):
+    rows, _ = templates
+    version = product.template_version
+    apply(product, [{'op': 'edit', 'id': rows[0].id, 'specification': 'Min 5'}], version)
+    db.session.commit()
+    db.session.refresh(product)
+    assert product.template_version == version + 1
+    with pytest.raises(VersionConflict) as conflict:
+        apply(product, [{'op': 'edit', 'id': rows[0].id, 'specification': 'Min 6'}], version)
+    assert conflict.value.version == version + 1
+    db.session.rollback()
+    assert db.session.get(ReportTemplate, rows[0].id).specification == 'Min 5'
+
+
+def test_apply_conflicts_when_version_moves_underneath(product, templates):
+    rows, _ = templates
+    # Another request bumps the version after this one loaded the product
+    templateops.bump_version(product.id)
+    with pytest.raises(VersionConflict):
+        apply(product, [{'op': 'delete', 'id': rows[0].id}])
+
+
+def test_apply_issues_one_statement_per_kind(app, product, templates):
+    ids = [row.id for row in templates[0]]
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'report_template' in statement.split('WHERE')[0] and not statement.startswith('SELECT'):
+            statements.append(statement.split()[0])
+
+    operations = [{'op': 'delete', 'id': ids[0]}, {'op': 'delete', 'id': ids[1]},
+                  {'op': 'edit', 'id': ids[2], 'specification': 'Max 0.2', 'order': 1}]
+    operations += [add(2 + n, f"P{n}") for n in range(5)]
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        version, spec_changed, deleted = apply(product, operations, product.template_version)
+        db.session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    assert sorted(statements) == ['DELETE', 'INSERT', 'UPDATE']
+    assert (spec_changed, deleted) == ([ids[2]], {ids[0], ids[1]})
+    remaining = ReportTemplate.query.filter_by(product_id=product.id).order_by(ReportTemplate.order).all()
+    assert [(t.parameter, t.specification, t.order) for t in remaining] == (
+        [('Acidity', 'Max 0.2', 1)] + [(f"P{n}", 'Min 3', 2 + n) for n in range(5)])
+    assert db.session.get(Product, product.id).template_version == version
+
+
+@pytest.mark.parametrize('body', [[{'op': 'delete', 'id': 1}], 'delete', None])
+def test_batch_route_rejects_non_object_body(app, product, body):
+    admin = User(username='unit_superadmin', role='superadmin', plant_name='Corporate')
+    admin.set_password('unit')
+    db.session.add(admin)
+    db.session.commit()
+    client = app.test_client()
+    client.post('/qa/login', data={'username': 'unit_superadmin', 'password': 'unit'})
+    response = client.post(f'/superadmin/templates/batch/{product.id}', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
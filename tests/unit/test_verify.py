@@ -0,0 +1,56 @@
+# tests/unit/test_verify.py
+# Request validation on the bulk verification API.
+
+import io
+
+import pytest
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+
+@pytest.fixture
+def app_config():
+    return {'BULK_VERIFY_MAX_BYTES': 100}
+
+
+@pytest.mark.parametrize('body', [['AAAAA'], 'AAAAA', 5, None, {'batch_codes': 'AAAAA'}, {'batch_codes': [1]}])
+def test_rejects_malformed_body(app, body):
+    response = app.test_client().post('/api/verify', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_verifies_codes(app, make_report):
+    make_report('AAAAA')
+    response = app.test_client().post('/api/verify', json={'batch_codes': ['aaaaa', 'ZZZZZ']})
+    assert response.status_code == 200
+    assert [entry['status'] for entry in response.get_json()['results']] == ['valid', 'not_found']
+
+
+class EndlessBody(io.RawIOBase):
+    consumed = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        buffer[:] = b' ' * len(buffer)
+        self.consumed += len(buffer)
+        return len(buffer)
+
+
+def chunked_post(app, stream):
+    # As a server passes on a Transfer-Encoding: chunked body: no Content-Length
+    environ = EnvironBuilder('/api/verify', method='POST', content_type='application/json').get_environ()
+    environ.pop('CONTENT_LENGTH', None)
+    environ['wsgi.input'] = stream
+    environ['wsgi.input_terminated'] = True
+    # Run directly: the test client would measure the stream and set a Content-Length
+    _, status, _ = run_wsgi_app(app, environ, buffered=True)
+    return int(status.split()[0])
+
+
+def test_caps_body_without_content_length(app):
+    assert chunked_post(app, io.BytesIO(b'{"batch_codes": ["AAAAA"]}')) == 200
+    body = EndlessBody()
+    assert chunked_post(app, body) == 413
+    assert body.consumed <= 101